@@ -0,0 +1,111 @@
+#
+#		Send to all instances benchmark for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		compares the time and memory it takes to encode one data command for every XTension
+#		instance the old way, where the command was encoded again for each instance with its target
+#		id, against encoding it once with getRawParts and joining in each instance's target id the
+#		way sendCommandToAll does now. Nothing is sent, only the encoding is measured.
+#
+#		the memory is the peak that tracemalloc sees while building the packets for one command,
+#		the packets themselves included. The per instance cost is how much that and the time go up
+#		for each instance added past the first, for the encode once way it should be little more
+#		than the size of the packet itself.
+#
+#		run from the pimonitor directory:
+#			python3 benchmarks/sendall.py
+#
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__))))
+
+from xtension import XTension, XTInstance, XTPCommand
+from xtension_constants import *
+
+
+
+instanceCounts		= (1, 2, 4, 8)
+timingRuns			= 20000
+
+
+
+#
+#	E N C O D E   E A C H
+#
+#	the old way, the whole command encoded again for every instance
+#
+def encodeEach( command, instances):
+	packets = []
+
+	for instance in instances:
+		command.targetId = instance.uniqueId
+		packets.append( command.getRawData())
+
+	return packets
+
+
+#
+#	E N C O D E   O N C E
+#
+#	the way sendCommandToAll does it now, encoded once and the target id joined in for each
+#
+def encodeOnce( command, instances):
+	head, tail, key = command.getRawParts()
+	return [b''.join( (head, instance.targetIdBytes, tail)) for instance in instances]
+
+
+#
+#	P E A K   B Y T E S
+#
+#	the most memory allocated at once while encoding the command for the instances
+#
+def peakBytes( function, command, instances):
+	tracemalloc.start()
+	try:
+		before = tracemalloc.get_traced_memory()[ 0]
+		tracemalloc.reset_peak()
+		packets = function( command, instances)
+		peak = tracemalloc.get_traced_memory()[ 1]
+	finally:
+		tracemalloc.stop()
+
+	return peak - before
+
+
+def main():
+	xtension = XTension( deviceName='benchmark', deviceId='BENCH1')
+	command = XTPCommand( command=xtension.xtPCommandData, jsonData={xtKeyCommand:xtCommandSetValue,
+		xtKeyTag:xtension.tagRegister, xtKeyAddress:'CPUUSAGE', xtKeyValue:12.5, xtKeyDefaultLabel:'12.5%', xtKeyUpdateOnly:True})
+
+	print( "%-12s %10s %10s %12s %12s" % ('', 'instances', 'us', 'peak bytes', 'packet bytes'))
+	results = {}
+
+	for function in (encodeEach, encodeOnce):
+		for count in instanceCounts:
+			instances = [XTInstance( address='127.0.0.%d' % (x + 1), uniqueId='XT%06d' % x) for x in range( count)]
+
+			seconds = timeit.timeit( lambda: function( command, instances), number=timingRuns) / timingRuns
+			peak = peakBytes( function, command, instances)
+			packetBytes = sum( len( x) for x in function( command, instances))
+
+			results[ (function.__name__, count)] = (seconds, peak)
+			print( "%-12s %10d %10.2f %12d %12d" % (function.__name__, count, seconds * 1000000, peak, packetBytes))
+
+	print()
+	first = instanceCounts[ 0]
+	last = instanceCounts[ -1]
+
+	for name in ('encodeEach', 'encodeOnce'):
+		firstSeconds, firstPeak = results[ (name, first)]
+		lastSeconds, lastPeak = results[ (name, last)]
+		print( "%-12s per instance %.2f us %d bytes" % (name, (lastSeconds - firstSeconds) / (last - first) * 1000000,
+			(lastPeak - firstPeak) / (last - first)))
+
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,469 @@
+#
+#		Collector framework for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		every metric that pimonitor sends to XTension is gathered by a Collector in one of the
+#		modules in this package. A collector declares how often it wants to run, the units it
+#		sends and does the actual reading in sample(). The modules are found by looking in the
+#		package but are only imported if the configuration turns them on, and every collector is
+#		probed once at startup so that a missing sysfs or proc file disables just that collector
+#		rather than logging an error every time it runs.
+#
+#		to add a metric drop a new module in here with a Collector subclass in its collectors
+#		list. Unless it's added to collectorFlags below it is turned on by a configuration option
+#		named check and the module name with the first letter capitalized, so gpu.py would be
+#		turned on by checkGpu = True
+#
+
+import importlib
+import pkgutil
+
+from xtension_constants import *	# the kInfo keys for the unit descriptions
+
+
+
+# the configuration options that turn on each module, if any of them are True the module is
+# imported. An empty tuple means it is always loaded. This is also the order the collectors are
+# started in and their units are listed to XTension, any other modules found come after these.
+collectorFlags = {
+	'throttled':	(),
+	'cputemp':		('checkCPUTemp',),
+	'wifi':			('checkRSSI',),
+	'cpuusage':		('checkCPUUsage',),
+	'frequency':	('checkCPUFrequency',),
+	'memory':		('checkMemory',),
+	'pressure':		('checkPressure',),
+	'diskspace':	('checkDiskSpace',),
+	'diskio':		('checkDiskIO',),
+	'network':		('checkNetwork',)
+}
+
+
+
+#
+#	class		C O L L E C T O R   C O N T E X T
+#
+#	everything a collector needs from the rest of pimonitor. The config is anything with the
+#	configuration options as attributes. The watch and unwatch functions register a file
+#	descriptor with the file watcher epoll and may only be called from that thread, which is
+#	where start() and sample() are called from. runBlocking( function, callback) calls the
+#	function somewhere it may wait without holding up the asyncio loop and then the callback with
+#	what it returned back in the file watcher.
+#
+class CollectorContext( object):
+	def __init__( self, *, xtension, config, pseudoFiles, watchFileDescriptor, unwatchFileDescriptor, runBlocking):
+		self.xtension = xtension
+		self.config = config
+		self.pseudoFiles = pseudoFiles
+		self.watchFileDescriptor = watchFileDescriptor
+		self.unwatchFileDescriptor = unwatchFileDescriptor
+		self.runBlocking = runBlocking
+
+
+
+
+#
+#	class		R E C O R D E D   C O N F I G
+#
+#	what each collector sees as its config. Every option it reads goes through here and is
+#	remembered in optionsRead so that when the configuration is reloaded only the collectors
+#	that read an option that changed have to be touched. The ones read while it was being set
+#	up by probe() and start() are also kept in setupOptions, an option read only after that,
+#	like by sample(), takes effect the next time it's read. See reloadCollectors
+#
+class RecordedConfig( object):
+	def __init__( self, config):
+		self.config = config
+		self.optionsRead = set()
+		self.setupOptions = set()
+
+	def __getattr__( self, name):
+		self.optionsRead.add( name)
+		return getattr( self.config, name)
+
+
+	#
+	#	O P T I O N S   R E A D   B Y
+	#
+	#	calls the function and returns the options it read, which are also kept in optionsRead
+	#
+	def optionsReadBy( self, function):
+		previous = self.optionsRead
+		self.optionsRead = set()
+
+		try:
+			function()
+		finally:
+			read = self.optionsRead
+			self.optionsRead = previous | read
+
+		return read
+
+
+	#
+	#	C A L L   S E T U P
+	#
+	#	calls probe() or start() and returns what it returned, keeping the options it read in setupOptions
+	#
+	def callSetup( self, function):
+		previous = self.optionsRead
+		self.optionsRead = set()
+
+		try:
+			return function()
+		finally:
+			self.setupOptions |= self.optionsRead
+			self.optionsRead = previous | self.optionsRead
+
+
+
+
+#
+#	class		C O L L E C T O R
+#
+#	the base class for all the collectors. Subclasses set name and override whichever of these
+#	they need:
+#
+#		probe()		called once after loading, return False or raise OSError if the files or
+#					devices this needs aren't there and the collector will not be used. Anything
+#					else worth telling the user about goes to logHandler, XTension may not
+#					have been found yet
+#		units()		a list of the unit dicts to send to XTension in the info packet, see unit()
+#		interval()	seconds between calls to sample() or None if it only reacts to events
+#		start()		called once from the file watcher thread before the first sample()
+#		sample()	read the values and send any that have changed with sendValue()
+#		stop()		close anything that start() or probe() opened, but not the files from
+#					pseudoFiles which may be shared with other collectors
+#		carryOver( previous)
+#					called before start() when this replaces a collector of the same class after
+#					the configuration changed, to take over any state that should outlast it
+#
+class Collector( object):
+	name = None
+
+	def __init__( self, context):
+		self.context = context
+		self.xtension = context.xtension
+		self.config = RecordedConfig( context.config)
+		self.pseudoFiles = context.pseudoFiles
+
+		# the last value sent for each unit address so we only send what has changed
+		self.currentValues = {}
+
+		# a prepared UnitSender for each unit address, see sender()
+		self.senders = {}
+
+		# the loader's, set before probe() is called. See loadCollectors
+		self.logHandler = print
+
+	def probe( self):
+		return True
+
+	def units( self):
+		return []
+
+	def interval( self):
+		return None
+
+	def start( self):
+		pass
+
+	def sample( self):
+		pass
+
+	def stop( self):
+		pass
+
+	def carryOver( self, previous):
+		pass
+
+
+	#
+	#	U N I T S   C H A N G E D
+	#
+	#	call when what units() returns is different, like when a new interface or volume is found
+	#	and XTension is sent just the units that were added or removed
+	#
+	def unitsChanged( self):
+		self.xtension.refreshInfo()
+
+
+	#
+	#	U N I T
+	#
+	#	the info dict for one unit with the defaults that nearly all of our units use, a
+	#	read only register that is dimmable so it can hold a value and doesn't log every change
+	#
+	def unit( self, name, address, *, tag=None, suffix=None, noLog=True, **keys):
+		if tag == None:
+			tag = self.xtension.tagRegister
+
+		work = {kInfoName:name, kInfoTag:tag, kInfoAddress:address, kInfoDimmable:True, kInfoIgnoreClicks:True, kInfoReceiveOnly:True}
+
+		if suffix != None:
+			work[ kInfoSuffix] = suffix
+
+		if noLog:
+			work[ kInfoNoLog] = True
+
+		work.update( keys)
+		return work
+
+
+	#
+	#	S E N D E R
+	#
+	#	the UnitSender for the address, created the first time it's used. Any keywords are sent
+	#	with every command to that unit so they must be the same every time for an address.
+	#	units listed in the reliableUnits configuration option are sent with the ack flag
+	#
+	def sender( self, address, *, tag=None, **keys):
+		sender = self.senders.get( address)
+
+		if sender == None:
+			if tag == None:
+				tag = self.xtension.tagRegister
+
+			reliable = address in self.config.reliableUnits
+			sender = self.xtension.unitSender( address=address, tag=tag, reliable=reliable, **keys)
+			self.senders[ address] = sender
+
+		return sender
+
+
+	#
+	#	R E L I A B L E   U N I T S   C H A N G E D
+	#
+	#	the senders already created are given the ack flag or not from the new reliableUnits
+	#
+	def reliableUnitsChanged( self):
+		for address, sender in self.senders.items():
+			sender.setReliable( address in self.config.reliableUnits)
+
+
+	#
+	#	S E N D   V A L U E
+	#
+	#	sends the value to the unit at the address if it is different from the last one we
+	#	sent. The label is sent as the default label if it is not None, any other keywords
+	#	are sent with every command to the unit. Returns True if it was sent.
+	#
+	def sendValue( self, address, value, *, label=None, tag=None, **keys):
+		if value == None or self.currentValues.get( address) == value:
+			return False
+
+		self.currentValues[ address] = value
+		self.sender( address, tag=tag, **keys).sendValue( value, label)
+		return True
+
+
+	def debugLog( self):
+		print( "----- begin %s Collector Debug Logging" % self.name)
+		print( "interval: %s" % self.interval())
+		print( "current values: %s" % len( self.currentValues))
+		print( "----- end %s Collector Debug Logging" % self.name)
+
+
+
+
+#
+#	F L A G S   F O R   M O D U L E
+#
+def flagsForModule( moduleName):
+	if moduleName in collectorFlags:
+		return collectorFlags[ moduleName]
+
+	return ('check' + moduleName[ :1].upper() + moduleName[ 1:],)
+
+
+#
+#	M O D U L E   N A M E S
+#
+#	all the collector modules in the package, the ones in collectorFlags first in that order
+#
+def moduleNames():
+	found = [x.name for x in pkgutil.iter_modules( __path__) if not x.name.startswith( '_')]
+	return [x for x in collectorFlags if x in found] + sorted( x for x in found if not x in collectorFlags)
+
+
+#
+#	M O D U L E   E N A B L E D
+#
+def moduleEnabled( config, moduleName):
+	flags = flagsForModule( moduleName)
+	return len( flags) == 0 or any( getattr( config, x, False) for x in flags)
+
+
+#
+#	L O A D   C O L L E C T O R S
+#
+#	imports the modules that are turned on in the configuration, creates their collectors and
+#	probes them. Returns the list of collectors that can be used. Anything that can't be
+#	loaded or fails its probe is logged once through logHandler and left out.
+#
+def loadCollectors( context, logHandler=print):
+	loaded = []
+
+	for moduleName in moduleNames():
+		if moduleEnabled( context.config, moduleName):
+			loaded += loadModule( context, moduleName, logHandler)
+
+	return loaded
+
+
+#
+#	L O A D   M O D U L E
+#
+#	the usable collectors from one module, see loadCollectors
+#
+def loadModule( context, moduleName, logHandler):
+	try:
+		module = importlib.import_module( '.' + moduleName, __name__)
+	except Exception as e:
+		logHandler( "unable to load the %s collector module (%s)" % (moduleName, e))
+		return []
+
+	loaded = []
+
+	for collectorClass in getattr( module, 'collectors', []):
+		collector = probeCollector( context, collectorClass, logHandler)
+		if collector != None:
+			loaded.append( collector)
+
+	return loaded
+
+
+#
+#	P R O B E   C O L L E C T O R
+#
+#	creates a collector and returns it if its probe says it can be used, otherwise None
+#
+def probeCollector( context, collectorClass, logHandler):
+	collector = collectorClass( context)
+	collector.logHandler = logHandler
+
+	# anything read while it was being created is as much a part of its setup as what probe() reads
+	collector.config.setupOptions |= collector.config.optionsRead
+
+	try:
+		usable = collector.config.callSetup( collector.probe)
+	except OSError as e:
+		usable = False
+		logHandler( "%s is not available on this system and will not be checked (%s)" % (collector.name, e))
+	except Exception as e:
+		usable = False
+		logHandler( "ERROR: probing %s( %s)" % (collector.name, e))
+	else:
+		if not usable:
+			logHandler( "%s is not available on this system and will not be checked" % collector.name)
+
+	if usable:
+		return collector
+
+	try:
+		collector.stop()
+	except Exception:
+		pass
+
+	return None
+
+
+#
+#	R E L O A D   C O L L E C T O R S
+#
+#	works out what has to be done to the running collectors after the configuration options named
+#	in changed were given new values. A collector that didn't read any of them while it was being
+#	set up is left alone so it keeps its state, the new values of the ones it reads as it goes are
+#	used from then on and everything it sends is sent again. One where only its interval changed
+#	just has to be rescheduled and any other is stopped with stopHandler and then replaced by a
+#	new one that is probed again and takes over its state with carryOver(). A new reliableUnits
+#	is given to the senders that are already there. Modules that were turned off have their
+#	collectors stopped and ones that were just turned on are loaded. Returns
+#	(collectors, started, rescheduled) where collectors is the new list of all of them in order
+#	and the others are the ones the caller has to start and reschedule
+#
+def reloadCollectors( context, active, changed, stopHandler, logHandler=print):
+	changed = set( changed)
+	collectors = []
+	started = []
+	rescheduled = []
+
+	if 'reliableUnits' in changed:
+		changed.discard( 'reliableUnits')
+		for collector in active:
+			collector.reliableUnitsChanged()
+
+	for moduleName in moduleNames():
+		running = [x for x in active if x.__module__ == __name__ + '.' + moduleName]
+
+		if not moduleEnabled( context.config, moduleName):
+			for collector in running:
+				stopHandler( collector)
+			continue
+
+		if len( running) == 0:
+			if not changed.isdisjoint( flagsForModule( moduleName)):
+				loaded = loadModule( context, moduleName, logHandler)
+				collectors += loaded
+				started += loaded
+			continue
+
+		for collector in running:
+			# units() may not have been called yet if XTension hasn't asked for the info
+			try:
+				unitOptions = collector.config.optionsReadBy( collector.units)
+				intervalOptions = collector.config.optionsReadBy( collector.interval)
+			except Exception:
+				unitOptions = changed
+				intervalOptions = set()
+
+			changedOptions = changed & collector.config.optionsRead
+			if len( changedOptions) == 0:
+				collectors.append( collector)
+				continue
+
+			setupOptions = collector.config.setupOptions
+			setupChanged = changedOptions & (setupOptions | unitOptions | intervalOptions)
+
+			if setupChanged <= intervalOptions - unitOptions - setupOptions:
+				collectors.append( collector)
+				collector.currentValues.clear()
+				if len( setupChanged) > 0:
+					rescheduled.append( collector)
+				continue
+
+			# stopped first so that anything it holds, like a file registered with the epoll, is
+			# let go before the new one is probed and started
+			stopHandler( collector)
+
+			replacement = probeCollector( context, collector.__class__, logHandler)
+			if replacement == None:
+				continue
+
+			try:
+				replacement.carryOver( collector)
+			except Exception as e:
+				logHandler( "ERROR: carrying over %s( %s)" % (collector.name, e))
+
+			collectors.append( replacement)
+			started.append( replacement)
+
+	return collectors, started, rescheduled
+
+
+
+#
+#	H U M A N   R E A D A B L E   S I Z E
+#
+#	used to format the disk space available into a human readable label that is used as the value
+#	display in XTension. The actual k available is sent as the real unit value but this output
+#	like 16GB or 10MB is sent as the display label to be easier to read.
+#
+def humanReadableSize( size, decimalPlaces = 2):
+	for unit in ['B', 'KB', 'MB', 'GB', 'TB', 'PB']:
+		if size < 1024.0 or unit == 'PB':
+			break
+		size /= 1024.0
+
+	formatString = '{:.%sf} {}' % decimalPlaces
+	return formatString.format( size, unit)
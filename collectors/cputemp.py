@@ -0,0 +1,73 @@
+#
+#		CPU temperature collector for pimonitor
+#			https://MacHomeAutomation.com/
+#
+
+from collectors import Collector
+
+
+
+pathCPUTemp		= '/sys/class/thermal/thermal_zone0/temp'
+
+addrCPUTEMP 	= 'CPUTEMP'
+
+
+
+#
+#	C   T O   F
+#	
+#	just conversion routine
+#
+def CtoF( inTemp):
+	inTemp = 9.0 / 5.0 * inTemp + 32
+	return round( (inTemp * 10)) / 10
+
+
+
+
+#
+#	class		C P U   T E M P   C O L L E C T O R
+#
+#	reads the CPU temperature "file" at the configured interval and sends any changes to XTension
+#
+class CPUTempCollector( Collector):
+	name = 'processCPUTemp'
+
+	def probe( self):
+		return self.pseudoFiles.readInt( pathCPUTemp) != None
+
+	def units( self):
+		return [self.unit( 'CPU Temperature', addrCPUTEMP, tag=self.xtension.tagTemperature, suffix='°F')]
+
+	def interval( self):
+		return self.config.CPUTempScanSeconds
+
+	def sample( self):
+		rawTemp = self.pseudoFiles.readInt( pathCPUTemp)
+		if rawTemp == None:
+			return
+
+		tempInC = round( rawTemp / 100) / 10
+		tempInF = CtoF( tempInC)
+
+		if self.config.showTempsInF:
+			displayTemp = tempInF
+			augTemp = tempInC
+			primarySuffix = '°F'
+			secondarySuffix = '°C'
+		else:
+			displayTemp = tempInC
+			augTemp = tempInF
+			primarySuffix = '°C'
+			secondarySuffix = '°F'
+
+		if self.config.alsoShowInOtherScale:
+			label = '%s%s (%s%s)' % (displayTemp, primarySuffix, augTemp, secondarySuffix)
+		else:
+			label = ''
+
+		self.sendValue( addrCPUTEMP, displayTemp, tag=self.xtension.tagTemperature, label=label)
+
+
+
+collectors = [CPUTempCollector]
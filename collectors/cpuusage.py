@@ -0,0 +1,96 @@
+#
+#		CPU usage collector for pimonitor
+#			https://MacHomeAutomation.com/
+#
+
+import os
+
+from collectors import Collector
+from cpustats import ProcStatReader, cpuModes
+
+
+
+addrCPUUsage 			= 'IDLE'
+addrCPUCoreBusy			= 'CPUBUSY'		# 'CPUBUSY.' and the core number
+addrCPUMode				= 'CPUMODE'		# 'CPUMODE.' and the mode name like CPUMODE.iowait
+addrContextSwitches		= 'CTXT'
+addrInterrupts			= 'INTR'
+addrProcsRunning		= 'PROCRUN'
+addrProcsBlocked		= 'PROCBLK'
+
+
+
+#
+#	class		C P U   U S A G E   C O L L E C T O R
+#
+class CPUUsageCollector( Collector):
+	name = 'processCPUUsage'
+
+	def __init__( self, context):
+		super().__init__( context)
+		self.coreCount = os.cpu_count() or 1
+		self.statReader = None
+
+	def probe( self):
+		self.statReader = ProcStatReader( self.pseudoFiles, coreCount=self.coreCount)
+		return True
+
+	def units( self):
+		config = self.config
+		units = [self.unit( 'CPU Idle', addrCPUUsage, suffix='%')]
+
+		if config.showPerCoreUsage:
+			for core in range( self.coreCount):
+				units.append( self.unit( 'CPU Core %s Busy' % core, addrCPUCoreBusy + '.' + str( core), suffix='%'))
+
+		if config.showCPUModes:
+			for thisMode in cpuModes:
+				units.append( self.unit( 'CPU %s' % thisMode, addrCPUMode + '.' + thisMode, suffix='%'))
+
+		if config.showContextSwitches:
+			units.append( self.unit( 'Context Switches', addrContextSwitches, suffix='/s'))
+
+		if config.showInterruptRate:
+			units.append( self.unit( 'Interrupts', addrInterrupts, suffix='/s'))
+
+		if config.showProcessCounts:
+			units += [self.unit( 'Processes Running', addrProcsRunning),
+				self.unit( 'Processes Blocked', addrProcsBlocked)]
+
+		return units
+
+	def interval( self):
+		return self.config.CPUUsageScanSeconds
+
+	def sample( self):
+		config = self.config
+		sample = self.statReader.read()
+
+		# if we are running the first time then there is nothing to compare against yet
+		# so just look again at whatever interval
+		if sample == None:
+			return
+
+		self.sendValue( addrCPUUsage, sample.idle)
+
+		if config.showPerCoreUsage:
+			for core in range( self.coreCount):
+				self.sendValue( addrCPUCoreBusy + '.' + str( core), sample.coreBusy[ core], xtKeyUpdateOnly=True)
+
+		if config.showCPUModes:
+			for i in range( len( cpuModes)):
+				self.sendValue( addrCPUMode + '.' + cpuModes[ i], sample.modes[ i], xtKeyUpdateOnly=True)
+
+		if config.showContextSwitches:
+			self.sendValue( addrContextSwitches, sample.contextSwitchRate, xtKeyUpdateOnly=True)
+
+		if config.showInterruptRate:
+			self.sendValue( addrInterrupts, sample.interruptRate, xtKeyUpdateOnly=True)
+
+		if config.showProcessCounts:
+			self.sendValue( addrProcsRunning, sample.procsRunning, xtKeyUpdateOnly=True)
+			self.sendValue( addrProcsBlocked, sample.procsBlocked, xtKeyUpdateOnly=True)
+
+
+
+collectors = [CPUUsageCollector]
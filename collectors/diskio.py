@@ -0,0 +1,97 @@
+#
+#		Disk IO collector for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		reads /proc/diskstats once for all the devices and sends the read and write bytes per second,
+#		operations per second, average wait in milliseconds and percent busy for each volume to scan
+#
+
+from collectors import Collector, humanReadableSize
+import diskstats
+
+
+
+addrDiskRead			= 'DISKREAD'	# the disk io units are named the same way as the disk space units
+addrDiskWrite			= 'DISKWRITE'
+addrDiskIOPS			= 'DISKIOPS'
+addrDiskAwait			= 'DISKAWAIT'
+addrDiskUtil			= 'DISKUTIL'
+
+
+
+#
+#	class		D I S K   I O   C O L L E C T O R
+#
+class DiskIOCollector( Collector):
+	name = 'processDiskIO'
+
+	def __init__( self, context):
+		super().__init__( context)
+		self.diskReader = None
+		self.volumeDevices = []	# the (major, minor) of the block device for each of volumesToScan
+
+
+	#
+	#	P R O B E
+	#
+	#	looks up the block device for each of the volumesToScan, volumes that are not on a
+	#	block device (tmpfs, network shares) are None and get no disk io units
+	#
+	def probe( self):
+		for thisPath in self.config.volumesToScan:
+			try:
+				self.volumeDevices.append( diskstats.deviceForPath( thisPath))
+			except Exception as e:
+				self.logHandler( 'Unable to find the block device for volume at "%s" %s' % (thisPath, e))
+				self.volumeDevices.append( None)
+
+		devices = [x for x in self.volumeDevices if x != None]
+		if len( devices) == 0:
+			return False
+
+		self.diskReader = diskstats.DiskStatsReader( self.pseudoFiles, devices)
+		return True
+
+
+	def units( self):
+		units = []
+
+		for thisPath, device in zip( self.config.volumesToScan, self.volumeDevices):
+			if device == None:
+				continue
+
+			addressSuffix = '.' + thisPath.replace( '/', '.')
+			units += [self.unit( 'Disk Read: %s' % thisPath, addrDiskRead + addressSuffix),
+				self.unit( 'Disk Write: %s' % thisPath, addrDiskWrite + addressSuffix),
+				self.unit( 'Disk IOPS: %s' % thisPath, addrDiskIOPS + addressSuffix, suffix='/s'),
+				self.unit( 'Disk Await: %s' % thisPath, addrDiskAwait + addressSuffix, suffix=' ms'),
+				self.unit( 'Disk Utilization: %s' % thisPath, addrDiskUtil + addressSuffix, suffix='%')]
+
+		return units
+
+
+	def interval( self):
+		return self.config.diskIOScanSeconds
+
+
+	def sample( self):
+		samples = self.diskReader.read()
+
+		for thisPath, device in zip( self.config.volumesToScan, self.volumeDevices):
+			sample = samples.get( device)
+			if sample == None:
+				continue
+
+			addressSuffix = '.' + thisPath.replace( '/', '.')
+
+			self.sendValue( addrDiskRead + addressSuffix, sample.readBytesPerSecond,
+				label=humanReadableSize( sample.readBytesPerSecond) + '/s', xtKeyUpdateOnly=True)
+			self.sendValue( addrDiskWrite + addressSuffix, sample.writeBytesPerSecond,
+				label=humanReadableSize( sample.writeBytesPerSecond) + '/s', xtKeyUpdateOnly=True)
+			self.sendValue( addrDiskIOPS + addressSuffix, sample.operationsPerSecond, xtKeyUpdateOnly=True)
+			self.sendValue( addrDiskAwait + addressSuffix, sample.averageWait, xtKeyUpdateOnly=True)
+			self.sendValue( addrDiskUtil + addressSuffix, sample.utilization, xtKeyUpdateOnly=True)
+
+
+
+collectors = [DiskIOCollector]
@@ -0,0 +1,50 @@
+#
+#		Disk space collector for pimonitor
+#			https://MacHomeAutomation.com/
+#
+
+import os
+
+from collectors import Collector, humanReadableSize
+
+
+
+addrDiskSpace 			= 'SPACE'
+	# disk space will be the 'SPACE.' and then the path with all the slashes converted to more periods
+	# so the root would be 'SPACE..' and /pi/recordings would be SPACE.PI.RECORDINGS
+
+
+
+#
+#	class		D I S K   S P A C E   C O L L E C T O R
+#
+#	sends the space available on each of the volumes to scan
+#
+class DiskSpaceCollector( Collector):
+	name = 'processDiskSpace'
+
+	def probe( self):
+		return len( self.config.volumesToScan) > 0
+
+	def units( self):
+		return [self.unit( 'Disk Space: %s' % thisPath, addrDiskSpace + '.' + thisPath.replace( '/', '.'))
+			for thisPath in self.config.volumesToScan]
+
+	def interval( self):
+		return self.config.diskScanSeconds
+
+	def sample( self):
+		for thisPath in self.config.volumesToScan:
+			try:
+				thisAddress = addrDiskSpace + '.' + thisPath.replace( '/', '.')
+				diskInfo = os.statvfs( thisPath)
+				thisSpace = diskInfo.f_bavail * diskInfo.f_frsize
+
+				self.sendValue( thisAddress, thisSpace, label=humanReadableSize( thisSpace), xtKeyUpdateOnly=True)
+
+			except Exception as e:
+				self.xtension.writeLog( 'Unable to get disk space for volume at "%s" %s' % (thisPath, e))
+
+
+
+collectors = [DiskSpaceCollector]
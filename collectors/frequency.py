@@ -0,0 +1,59 @@
+#
+#		CPU frequency collector for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		the kernel keeps track of how long every cpufreq policy has spent at each frequency so
+#		rather than sampling the current frequency many times a second and missing the short
+#		changes anyway we send the exact time weighted average frequency over the interval, the
+#		percent of the time it was at its lowest speed and how many times it changed speed.
+#
+
+from collectors import Collector
+import cpufreq
+
+
+
+addrFrequency 			= 'FREQ'		# these three are followed by '.' and the cpufreq policy name like FREQ.policy0
+addrFrequencyLow		= 'FREQLOW'
+addrFrequencyChanges	= 'FREQTRANS'
+
+
+
+#
+#	class		C P U   F R E Q U E N C Y   C O L L E C T O R
+#
+class CPUFrequencyCollector( Collector):
+	name = 'processCPUFrequency'
+
+	def __init__( self, context):
+		super().__init__( context)
+		self.freqReader = None
+
+	def probe( self):
+		self.freqReader = cpufreq.CPUFreqReader( self.pseudoFiles)
+		return len( self.freqReader.policies) > 0
+
+	def units( self):
+		units = []
+
+		for policy in self.freqReader.policies:
+			thisPolicy = policy.name
+			units += [self.unit( 'CPU Frequency %s' % thisPolicy, addrFrequency + '.' + thisPolicy, suffix=' MHz'),
+				self.unit( 'CPU Time At Lowest Frequency %s' % thisPolicy, addrFrequencyLow + '.' + thisPolicy, suffix='%'),
+				self.unit( 'CPU Frequency Changes %s' % thisPolicy, addrFrequencyChanges + '.' + thisPolicy)]
+
+		return units
+
+	def interval( self):
+		return self.config.CPUFrequencyScanSeconds
+
+	def sample( self):
+		for sample in self.freqReader.read():
+			thisPolicy = sample.policy
+			self.sendValue( addrFrequency + '.' + thisPolicy, sample.averageFrequency, xtKeyUpdateOnly=True)
+			self.sendValue( addrFrequencyLow + '.' + thisPolicy, sample.lowestShare, xtKeyUpdateOnly=True)
+			self.sendValue( addrFrequencyChanges + '.' + thisPolicy, sample.transitions, xtKeyUpdateOnly=True)
+
+
+
+collectors = [CPUFrequencyCollector]
@@ -0,0 +1,61 @@
+#
+#		Memory collector for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		sends the available, cached, dirty, free CMA and free swap memory. These are sent as bytes
+#		with the human readable size as the label the same as the disk space units
+#
+
+from collectors import Collector, humanReadableSize
+import memstats
+
+
+
+addrMemAvailable		= 'MEMAVAIL'
+addrMemCached			= 'MEMCACHED'
+addrMemDirty			= 'MEMDIRTY'
+addrCMAFree				= 'CMAFREE'
+addrSwapFree			= 'SWAPFREE'
+
+# in the same order as memstats.memInfoKeys
+memoryUnits = (
+	(addrMemAvailable,	'Memory Available'),
+	(addrMemCached,		'Memory Cached'),
+	(addrMemDirty,		'Memory Dirty'),
+	(addrCMAFree,		'CMA Free'),
+	(addrSwapFree,		'Swap Free')
+)
+
+
+
+#
+#	class		M E M O R Y   C O L L E C T O R
+#
+class MemoryCollector( Collector):
+	name = 'processMemory'
+
+	def __init__( self, context):
+		super().__init__( context)
+		self.memReader = None
+
+	def probe( self):
+		self.memReader = memstats.MemInfoReader( self.pseudoFiles)
+		return any( x != None for x in self.memReader.read())
+
+	def units( self):
+		return [self.unit( name, address) for address, name in memoryUnits]
+
+	def interval( self):
+		return self.config.memoryScanSeconds
+
+	def sample( self):
+		values = self.memReader.read()
+
+		for i in range( len( values)):
+			value = values[ i]
+			if value != None:
+				self.sendValue( memoryUnits[ i][0], value, label=humanReadableSize( value), xtKeyUpdateOnly=True)
+
+
+
+collectors = [MemoryCollector]
@@ -0,0 +1,154 @@
+#
+#		Network interface collector for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		reads /proc/net/dev once for all the interfaces and sends the receive and transmit
+#		bytes and packets per second and the errors and drops per second for each
+#
+#		when no interfaces are configured the ones that show up later get units too, up to
+#		maxInterfaces in all. Those that go away again, like the veth interfaces of containers,
+#		are forgotten after forgetInterfaceSeconds so the units don't grow without limit. The ones
+#		that were there at startup keep their units
+#
+
+from time import monotonic
+
+from collectors import Collector, humanReadableSize
+import netstats
+
+
+
+addrNetRx				= 'NETRX'		# the network units are followed by '.' and the interface name like NETRX.eth0
+addrNetTx				= 'NETTX'
+addrNetRxPackets		= 'NETRXPKT'
+addrNetTxPackets		= 'NETTXPKT'
+addrNetErrors			= 'NETERR'
+addrNetDrops			= 'NETDROP'
+allAddresses			= (addrNetRx, addrNetTx, addrNetRxPackets, addrNetTxPackets, addrNetErrors, addrNetDrops)
+
+maxInterfaces			= 32
+forgetInterfaceSeconds	= 600
+
+
+
+#
+#	class		N E T W O R K   C O L L E C T O R
+#
+class NetworkCollector( Collector):
+	name = 'processNetwork'
+
+	def __init__( self, context):
+		super().__init__( context)
+		self.netReader = None
+		self.interfaceNames = []
+		self.startupNames = set()
+		self.missingSince = {}		# when each interface that was added later was last seen
+		self.reportedLimit = False
+
+
+	#
+	#	P R O B E
+	#
+	#	the interfaces from the configuration or if that is empty every interface except the
+	#	loopback that exists when we first look. Any that show up later are added in sample()
+	#
+	def probe( self):
+		if len( self.config.networkInterfaces) > 0:
+			self.interfaceNames = list( self.config.networkInterfaces)
+		else:
+			self.interfaceNames = netstats.interfaceNames()[ :maxInterfaces]
+			self.startupNames = set( self.interfaceNames)
+
+		if len( self.interfaceNames) == 0:
+			return False
+
+		self.netReader = netstats.NetDevReader( self.pseudoFiles, self.interfaceNames)
+		return True
+
+
+	def units( self):
+		units = []
+
+		for thisName in self.interfaceNames:
+			addressSuffix = '.' + thisName
+			units += [self.unit( 'Network Receive %s' % thisName, addrNetRx + addressSuffix),
+				self.unit( 'Network Transmit %s' % thisName, addrNetTx + addressSuffix),
+				self.unit( 'Network Receive Packets %s' % thisName, addrNetRxPackets + addressSuffix, suffix='/s'),
+				self.unit( 'Network Transmit Packets %s' % thisName, addrNetTxPackets + addressSuffix, suffix='/s'),
+				self.unit( 'Network Errors %s' % thisName, addrNetErrors + addressSuffix, suffix='/s'),
+				self.unit( 'Network Drops %s' % thisName, addrNetDrops + addressSuffix, suffix='/s')]
+
+		return units
+
+
+	def interval( self):
+		return self.config.networkScanSeconds
+
+
+	def sample( self):
+		for thisName, sample in self.netReader.read().items():
+			addressSuffix = '.' + thisName
+
+			self.sendValue( addrNetRx + addressSuffix, sample.rxBytesPerSecond,
+				label=humanReadableSize( sample.rxBytesPerSecond) + '/s', xtKeyUpdateOnly=True)
+			self.sendValue( addrNetTx + addressSuffix, sample.txBytesPerSecond,
+				label=humanReadableSize( sample.txBytesPerSecond) + '/s', xtKeyUpdateOnly=True)
+			self.sendValue( addrNetRxPackets + addressSuffix, sample.rxPacketsPerSecond, xtKeyUpdateOnly=True)
+			self.sendValue( addrNetTxPackets + addressSuffix, sample.txPacketsPerSecond, xtKeyUpdateOnly=True)
+			self.sendValue( addrNetErrors + addressSuffix, sample.errorsPerSecond, xtKeyUpdateOnly=True)
+			self.sendValue( addrNetDrops + addressSuffix, sample.dropsPerSecond, xtKeyUpdateOnly=True)
+
+		if len( self.config.networkInterfaces) == 0:
+			self.updateInterfaces()
+
+
+	#
+	#	U P D A T E   I N T E R F A C E S
+	#
+	#	a new interface like a usb wifi adapter being plugged in gets its units created in XTension
+	#	and is added to the reader without losing the counters of the others. One added this way
+	#	that has been gone for forgetInterfaceSeconds has its units removed, a short absence like
+	#	unplugging the adapter for a moment keeps them so they aren't deleted and created again
+	#
+	def updateInterfaces( self):
+		now = monotonic()
+		currentNames = self.netReader.allNames()
+		goneNames = []
+
+		for thisName in self.interfaceNames:
+			if thisName in self.startupNames:
+				continue
+
+			if thisName in currentNames:
+				self.missingSince.pop( thisName, None)
+			elif now - self.missingSince.setdefault( thisName, now) >= forgetInterfaceSeconds:
+				goneNames.append( thisName)
+
+		if len( goneNames) > 0:
+			self.interfaceNames = [x for x in self.interfaceNames if not x in goneNames]
+			self.netReader.removeNames( goneNames)
+
+			for thisName in goneNames:
+				del self.missingSince[ thisName]
+				for address in allAddresses:
+					self.senders.pop( address + '.' + thisName, None)
+					self.currentValues.pop( address + '.' + thisName, None)
+
+		newNames = [x for x in currentNames if not x in self.interfaceNames]
+
+		if len( newNames) > maxInterfaces - len( self.interfaceNames):
+			newNames = newNames[ :max( 0, maxInterfaces - len( self.interfaceNames))]
+			if not self.reportedLimit:
+				self.xtension.writeLog( "more than %d network interfaces, the rest are ignored" % maxInterfaces)
+				self.reportedLimit = True
+
+		if len( newNames) > 0:
+			self.interfaceNames += newNames
+			self.netReader.addNames( newNames)
+
+		if len( goneNames) > 0 or len( newNames) > 0:
+			self.unitsChanged()
+
+
+
+collectors = [NetworkCollector]
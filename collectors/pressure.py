@@ -0,0 +1,112 @@
+#
+#		Pressure stall information collector for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		sends the 10 second average of the pressure stall information for cpu, memory and io
+#		and the milliseconds that tasks were stalled on each since the last read. This is called
+#		at the regular scan interval and also right away by the epoll when one of the pressure
+#		triggers fires, when the stall time shows the whole of the stall that set it off
+#
+
+import select
+
+from collectors import Collector
+import memstats
+
+
+
+addrPressure			= 'PSI'			# 'PSI.' resource and then '.some' or '.full' like PSI.memory.some
+addrPressureStall		= 'PSISTALL'	# 'PSISTALL.' resource like PSISTALL.io
+
+
+
+#
+#	class		P R E S S U R E   C O L L E C T O R
+#
+class PressureCollector( Collector):
+	name = 'processPressure'
+
+	def __init__( self, context):
+		super().__init__( context)
+		self.pressureReader = None
+		self.pressureTriggers = []
+
+	def probe( self):
+		# raises OSError on kernels without PSI
+		self.pressureReader = memstats.PressureReader( self.pseudoFiles)
+		return True
+
+	def units( self):
+		units = []
+
+		for resource in memstats.pressureResources:
+			kinds = ['some']
+			if resource != 'cpu':
+				kinds.append( 'full')
+
+			for kind in kinds:
+				units.append( self.unit( 'Pressure %s %s' % (resource, kind), addrPressure + '.' + resource + '.' + kind, suffix='%'))
+
+			units.append( self.unit( 'Pressure Stall %s' % resource, addrPressureStall + '.' + resource, suffix=' ms'))
+
+		return units
+
+	def interval( self):
+		return self.config.pressureScanSeconds
+
+
+	#
+	#	S T A R T
+	#
+	#	asks the kernel to wake the file watcher epoll as soon as any resource has been stalled for
+	#	more than pressureTriggerStallMs in a pressureTriggerWindowMs window. This needs root and a
+	#	kernel with PSI enabled, if it can't be done we just log it and rely on the regular scan.
+	#
+	def start( self):
+		if not self.config.usePressureTriggers:
+			return
+
+		for resource in memstats.pressureResources:
+			try:
+				trigger = memstats.PressureTrigger( resource, stallMs=self.config.pressureTriggerStallMs, 
+					windowMs=self.config.pressureTriggerWindowMs)
+			except OSError as e:
+				self.xtension.writeLog( "unable to create the %s pressure trigger, only the regular pressure scan will be used (%s)" % (resource, e))
+				continue
+
+			self.pressureTriggers.append( trigger)
+			self.context.watchFileDescriptor( trigger.fileno(), self.name, self.processEvent)
+
+
+	def stop( self):
+		for trigger in self.pressureTriggers:
+			self.context.unwatchFileDescriptor( trigger.fileno())
+			trigger.close()
+
+		self.pressureTriggers = []
+
+
+	def processEvent( self, fd, event):
+		if event & select.EPOLLERR:
+			# the trigger is no longer valid so stop watching it
+			self.context.unwatchFileDescriptor( fd)
+			for trigger in self.pressureTriggers:
+				if trigger.fileno() == fd:
+					self.pressureTriggers.remove( trigger)
+					trigger.close()
+					break
+			return
+
+		self.sample()
+
+
+	def sample( self):
+		for sample in self.pressureReader.read():
+			for kind, value in (('some', sample.some), ('full', sample.full)):
+				self.sendValue( addrPressure + '.' + sample.resource + '.' + kind, value, xtKeyUpdateOnly=True)
+
+			self.sendValue( addrPressureStall + '.' + sample.resource, sample.someStallMs, xtKeyUpdateOnly=True)
+
+
+
+collectors = [PressureCollector]
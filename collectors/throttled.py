@@ -0,0 +1,260 @@
+#
+#		Throttled, undervoltage and capped CPU status collector for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		the firmware get_throttled file signals a change with POLLPRI so this is registered with
+#		the file watcher epoll rather than being polled. The only thing on an interval is the
+#		total time spent in each state if that is turned on.
+#
+
+from time import monotonic
+
+from xtension_constants import *
+from collectors import Collector
+
+
+
+pathThrottled			= '/sys/devices/platform/soc/soc:firmware/get_throttled'
+
+addrThrottled 			= 'THROTTLED'
+addrUndervolt 			= 'UNDERVOLT'
+addrCapped				= 'CAPPED'
+addrThrottledHistoric 	= 'HTHROTTLED'
+addrUndervoltHistoric	= 'HUNDERVOLT'
+addrCappedHistoric		= 'HCAPPED'
+addrThrottledTime		= 'THROTTLEDTIME'
+addrUndervoltTime		= 'UNDERVOLTTIME'
+addrCappedTime			= 'CAPPEDTIME'
+
+throttledBits = (
+	# bit		address					historic
+	(0x40000,	addrThrottledHistoric,	True),
+	(0x20000,	addrCappedHistoric,		True),
+	(0x10000,	addrUndervoltHistoric,	True),
+	(0x4,		addrThrottled,			False),
+	(0x2,		addrCapped,				False),
+	(0x1,		addrUndervolt,			False)
+)
+throttledHistoricMask 	= 0x70000
+throttledAllMask		= 0x70007
+
+# the active bits that we keep the total time on for and the units they are sent to
+throttledTimeAddresses = (
+	(0x4,	addrThrottledTime),
+	(0x1,	addrUndervoltTime),
+	(0x2,	addrCappedTime)
+)
+
+
+
+#
+#	H U M A N   R E A D A B L E   D U R A T I O N
+#
+#	seconds as something like "2h 4m 12s" for the label of the throttled time units
+#
+def humanReadableDuration( seconds):
+	minutes, seconds = divmod( int( seconds), 60)
+	hours, minutes = divmod( minutes, 60)
+
+	if hours > 0:
+		return '%dh %dm %ds' % (hours, minutes, seconds)
+	if minutes > 0:
+		return '%dm %ds' % (minutes, seconds)
+	return '%ds' % seconds
+
+
+
+
+#
+#	class		T H R O T T L E D   C O L L E C T O R
+#
+class ThrottledCollector( Collector):
+	name = 'processThrottledFile'
+
+	def __init__( self, context):
+		super().__init__( context)
+		self.throttledFile = None
+		self.lastSentThrottled = None 	# the status bits last sent for the throttled units, None until the first read
+
+		# total seconds each of the active bits has been on and when it came on if it's on now
+		self.totalTime = {x:0.0 for x, address in throttledTimeAddresses}
+		self.onSince = {x:None for x, address in throttledTimeAddresses}
+
+
+	def probe( self):
+		self.throttledFile = self.pseudoFiles.get( pathThrottled)
+		return True
+
+
+	def units( self):
+		tag = self.xtension.tagDiscreteRegister
+
+		# we always watch the throttling and power file for info so those units are always present
+		units = [
+			{kInfoName:'Active Throttling', kInfoTag:tag, kInfoAddress:addrThrottled,
+				kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoOnLabel:'THROTTLED', kInfoOffLabel:'OK'},
+			{kInfoName:'Active Undervoltage', kInfoTag:tag, kInfoAddress:addrUndervolt,
+				kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoOnLabel:'UNDERVOLT', kInfoOffLabel:'OK'},
+			{kInfoName:'Active CPU Speed Capping', kInfoTag:tag, kInfoAddress:addrCapped,
+				kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoOnLabel:'CAPPED', kInfoOffLabel:'OK'},
+			{kInfoName:'Throttling Has Occurred', kInfoTag:tag, kInfoAddress:addrThrottledHistoric,
+				kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoOnLabel:'THROTTLED', kInfoOffLabel:'OK'},
+			{kInfoName:'Undervoltage Has Occurred', kInfoTag:tag, kInfoAddress:addrUndervoltHistoric,
+				kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoOnLabel:'UNDERVOLT', kInfoOffLabel:'OK'},
+			{kInfoName:'CPU Speed Capping Has Occurred', kInfoTag:tag, kInfoAddress:addrCappedHistoric,
+				kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoOnLabel:'CAPPED', kInfoOffLabel:'OK'}
+		]
+
+		if self.config.showThrottledTimes:
+			units += [self.unit( 'Time Throttled', addrThrottledTime, suffix=' s'),
+				self.unit( 'Time Undervoltage', addrUndervoltTime, suffix=' s'),
+				self.unit( 'Time CPU Speed Capped', addrCappedTime, suffix=' s')]
+
+		return units
+
+
+	def interval( self):
+		if self.config.showThrottledTimes:
+			return self.config.throttledTimeScanSeconds
+		return None
+
+
+	#
+	#	S T A R T
+	#
+	#	before beginning the watching of the file make sure that the historical throttled units
+	#	are off. If they turn out to be on as soon as we begin reading the file then they will
+	#	be turned on again. But since we cannot reliably read a 0 for nothing we cannot reliably
+	#	send an off for these. They are normally only reset by a reboot so when this program starts we send them
+	#	an off. A collector that replaced one after the configuration changed already knows what
+	#	was sent, see carryOver, so it leaves them as they are.
+	#
+	def start( self):
+		if self.lastSentThrottled == None:
+			self.xtension.sendRawPartsToAll( [self.discreteSender( address).offParts()
+				for address in (addrThrottledHistoric, addrCappedHistoric, addrUndervoltHistoric)], priority=True)
+
+		# if the firmware file ever has to be reopened by the cache then the epoll needs the new descriptor
+		self.throttledFile.reopenHandler = self.fileReopened
+		self.context.watchFileDescriptor( self.throttledFile.fileno(), self.name, self.processEvent)
+
+		# the file only signals a change so read it once now to get the units in sync
+		self.processFile()
+
+
+	def stop( self):
+		if self.throttledFile != None:
+			self.context.unwatchFileDescriptor( self.throttledFile.fileno())
+			if self.throttledFile.reopenHandler == self.fileReopened:
+				self.throttledFile.reopenHandler = None
+			self.throttledFile = None
+
+
+	#
+	#	C A R R Y   O V E R
+	#
+	#	the bits that were last sent and the time in each state so the replacement only sends
+	#	what changes and the totals keep counting from where they were
+	#
+	def carryOver( self, previous):
+		self.lastSentThrottled = previous.lastSentThrottled
+		self.totalTime = previous.totalTime
+		self.onSince = previous.onSince
+
+
+	def fileReopened( self, oldFd, newFd):
+		self.context.unwatchFileDescriptor( oldFd)
+		self.context.watchFileDescriptor( newFd, self.name, self.processEvent)
+
+
+	def processEvent( self, fd, event):
+		self.processFile()
+
+
+	#
+	#		P R O C E S S   F I L E
+	#
+	#	if the epoll returns the throttled file as having changed then we read it here
+	#	the file can fire over and over during a brownout so we remember the bits that we last sent
+	#	and only send the units whose bit actually changed, all together in one packet that goes
+	#	ahead of any other values waiting to be sent.
+	#
+	#	the historic bits are only cleared by a reboot. The firmware sometimes reports a 0 which
+	#	does not mean they are off so when the status is 0 the historic bits are left as they were.
+	#
+	def processFile( self):
+		status = self.throttledFile.readInt( 16)
+		if status == None:
+			return
+
+		if status == 0 and self.lastSentThrottled != None:
+			status = self.lastSentThrottled & throttledHistoricMask
+
+		self.updateTimes( status)
+
+		if self.lastSentThrottled == None:
+			changedBits = throttledAllMask 	# first read, nothing has been sent yet
+		else:
+			changedBits = (status ^ self.lastSentThrottled) & throttledAllMask
+
+		if changedBits == 0:
+			return
+
+		parts = []
+
+		for bit, address, historic in throttledBits:
+			if not changedBits & bit:
+				continue
+
+			if status & bit:
+				parts.append( self.discreteSender( address).onParts())
+			else:
+				parts.append( self.discreteSender( address).offParts())
+
+		self.lastSentThrottled = status
+		self.xtension.sendRawPartsToAll( parts, priority=True)
+
+
+	def discreteSender( self, address):
+		return self.sender( address, tag=self.xtension.tagDiscreteRegister, xtKeyUpdateOnly=True)
+
+
+	#
+	#	U P D A T E   T I M E S
+	#
+	#	keeps the total time that each of the active throttled, capped and undervolt bits have been on
+	#	there is nothing in the firmware that tracks this so it is the time since PiMonitor started
+	#
+	def updateTimes( self, status):
+		now = monotonic()
+
+		for bit in self.onSince:
+			if status & bit:
+				if self.onSince[ bit] == None:
+					self.onSince[ bit] = now
+			elif self.onSince[ bit] != None:
+				self.totalTime[ bit] += now - self.onSince[ bit]
+				self.onSince[ bit] = None
+
+
+	def getTime( self, bit):
+		total = self.totalTime[ bit]
+		if self.onSince[ bit] != None:
+			total += monotonic() - self.onSince[ bit]
+		return round( total)
+
+
+	#
+	#	S A M P L E
+	#
+	#	called at the configured interval to send the total time spent in each state
+	#	if it has changed since the last time it was sent
+	#
+	def sample( self):
+		for bit, address in throttledTimeAddresses:
+			value = self.getTime( bit)
+			self.sendValue( address, value, label=humanReadableDuration( value), xtKeyUpdateOnly=True)
+
+
+
+collectors = [ThrottledCollector]
@@ -0,0 +1,111 @@
+#
+#		WiFi link statistics collector for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		all the interfaces are read in one batch from nl80211 (or /proc/net/wireless if that is
+#		not available) without running iwconfig so this is cheap enough to run more than once a second
+#		the netlink reply can take a while so the read is done through runBlocking, on the asyncio
+#		loop it runs in the executor and never holds up the loop
+#
+
+from collectors import Collector
+from wifistats import WiFiReader
+
+
+
+addrRSSI 				= 'RSSI'		# all followed by '.' and the interface name like RSSI.wlan0
+addrLinkQuality			= 'QUAL'
+addrLinkRate			= 'RATE'
+addrTXPower 			= 'TXPOWER'
+addrWiFiFreq			= 'WFREQ'
+
+# the values that can be sent for each interface
+# as (configuration option, address, sample attribute, unit name, suffix, noLog)
+wifiValues = (
+	('checkRSSI', addrRSSI, 'signal', 'WiFi RSSI ', ' dBm', True),
+	('showBitRate', addrLinkRate, 'bitRate', 'WiFi Bit Rate ', ' Mb/s', True),
+	('showTXPower', addrTXPower, 'txPower', 'WiFi TX Power ', ' dBm', True),
+	('showLinkQuality', addrLinkQuality, 'linkQuality', 'WiFi Link Quality ', '%', True),
+	('showWiFiFrequency', addrWiFiFreq, 'frequency', 'WiFi Frequency ', ' GHz', False)
+)
+
+
+
+#
+#	class		W I F I   C O L L E C T O R
+#
+class WiFiCollector( Collector):
+	name = 'processRSSI'
+
+	def __init__( self, context):
+		super().__init__( context)
+		self.wifiReader = None
+		self.reading = False 	# a read is still waiting for its reply in the executor
+		self.values = []		# the wifiValues that are turned on in the configuration
+
+	#
+	#	P R O B E
+	#
+	#	the values are picked here so that turning one on or off replaces the collector when the
+	#	configuration is reloaded, see reloadCollectors
+	#
+	def probe( self):
+		self.values = [x for x in wifiValues if getattr( self.config, x[0], False)]
+
+		if len( self.config.RSSIInterfaceName) == 0:
+			return False
+
+		self.wifiReader = WiFiReader( self.pseudoFiles)
+		return True
+
+	def units( self):
+		units = []
+
+		for option, address, attribute, name, suffix, noLog in self.values:
+			for thisInterface in self.config.RSSIInterfaceName:
+				units.append( self.unit( name + thisInterface, address + '.' + thisInterface, suffix=suffix, noLog=noLog))
+
+		return units
+
+	def interval( self):
+		return self.config.RSSIScanSeconds
+
+	def stop( self):
+		wifiReader = self.wifiReader
+		self.wifiReader = None
+
+		# a read still waiting for its reply closes the reader itself when it's done
+		if wifiReader != None and not self.reading:
+			wifiReader.close()
+
+	def sample( self):
+		if self.reading:
+			return
+
+		wifiReader = self.wifiReader
+		interfaceNames = self.config.RSSIInterfaceName
+
+		# may be called off the file watcher thread so it only touches the reader it was given
+		def read():
+			try:
+				return wifiReader.read( interfaceNames)
+			finally:
+				self.reading = False
+				if self.wifiReader is not wifiReader:
+					wifiReader.close()
+
+		self.reading = True
+		self.context.runBlocking( read, self.sendStats)
+
+	def sendStats( self, allStats):
+		# stopped while the read was waiting
+		if self.wifiReader == None:
+			return
+
+		for thisName, stats in allStats.items():
+			for option, address, attribute, name, suffix, noLog in self.values:
+				self.sendValue( address + '.' + thisName, getattr( stats, attribute), xtKeyUpdateOnly=True)
+
+
+
+collectors = [WiFiCollector]
@@ -58,6 +58,17 @@ alsoShowInOtherScale = True
 
 
 
+#
+#	THROTTLED TIMES
+#
+# the throttled, undervolt and capped units are always created. If this is True then units
+# are also created for the total time the pi has spent throttled, undervolted or speed capped
+# since PiMonitor started. They are sent at this interval if they have changed.
+showThrottledTimes = True
+throttledTimeScanSeconds = 60
+
+
+
 #
 # 	CPU TEMPERATURE
 #
@@ -79,6 +90,8 @@ CPUTempScanSeconds = 10
 # NOTE that this value must be a python list even with just one element
 # if you have multiple wireless lans you wish to check you can enter more in the list
 # something like: ['wlan0', 'wlan1', 'wlan2']
+# the values are read directly from the kernel so the scan can be fractional seconds if you
+# wish to watch the link closely, something like 0.5
 RSSIInterfaceName = ['wlan0']
 RSSIScanSeconds = 10
 checkRSSI = True
@@ -96,16 +109,57 @@ showWiFiFrequency = True
 checkCPUUsage = True
 CPUUsageScanSeconds = 10
 
+# these all come from the same read of /proc/stat as the CPU Idle unit and only work if
+# checkCPUUsage is True.
+# showPerCoreUsage creates a percent busy unit for every core, a single core pinned at 100% is not
+# visible in the overall idle of a 4 core pi.
+# showCPUModes creates a unit for the percent of time spent in each of user, nice, system, idle,
+# iowait, irq, softirq and steal. A high iowait usually means the SD card can't keep up.
+# showContextSwitches and showInterruptRate are per second and showProcessCounts creates units
+# for the number of processes running and blocked waiting on I/O.
+showPerCoreUsage = True
+showCPUModes = False
+showContextSwitches = False
+showInterruptRate = False
+showProcessCounts = False
+
 
 #
 # 	CPU FREQUENCY
 #
-# this can change very rapidly and is more of an indication of the load on the machine as even the 
-# fastest pi will throttle back when it's mostly idle. While you can set the speed to be very fast to catch
-# rapid changes that can occur in the course of normal operation keep in mind the XTdb will not record values
-# faster than once a second so it may not be useful to scan faster than that unless you want to 
-checkCPUFrequency = False
-CPUFrequencyScanSeconds	= 0.2
+# creates units for every cpufreq policy (all the cores of a pi are in policy0) with the
+# average frequency over the interval weighted by the time spent at each speed, the percent of
+# the interval spent at the lowest speed and the number of times the speed changed. These come
+# from the statistics the kernel keeps so nothing is missed between scans no matter how long
+# the interval is.
+checkCPUFrequency = True
+CPUFrequencyScanSeconds	= 10
+
+#
+#	MEMORY
+#
+# creates units for the memory available, the page cache, dirty pages waiting to be written to
+# disk, free CMA memory (used by the camera and video drivers) and free swap. The values are in
+# bytes with a human readable label like the disk space units.
+checkMemory = True
+memoryScanSeconds = 10
+
+
+#
+#	PRESSURE STALL INFORMATION
+#
+# creates units for the percent of the last 10 seconds that tasks were stalled waiting for the
+# CPU, memory or io. A pi that is running out of memory or waiting on a slow SD card shows up here
+# long before anything else looks wrong.
+# if usePressureTriggers is True the kernel will tell us right away whenever tasks have been stalled
+# for more than pressureTriggerStallMs milliseconds within any pressureTriggerWindowMs milliseconds
+# rather than waiting for the next scan. The window must be between 500 and 10000.
+checkPressure = True
+pressureScanSeconds = 10
+usePressureTriggers = True
+pressureTriggerStallMs = 150
+pressureTriggerWindowMs = 1000
+
 
 #
 #	DISK SPACE
@@ -123,7 +177,61 @@ checkDiskSpace = True
 diskScanSeconds = 60
 volumesToScan = ['/']
 
+#
+#	DISK IO
+#
+# for each of the volumesToScan above that is on a block device this creates units for the read
+# and write bytes per second, operations per second, the average milliseconds each operation took
+# to complete and the percent of the time the device was busy. An SD card that is wearing out
+# shows up here as very long await times long before it fails.
+checkDiskIO = True
+diskIOScanSeconds = 10
+
+
+#
+#	NETWORK
+#
+# creates units for the receive and transmit bytes and packets per second and the errors and
+# drops per second for each network interface. If networkInterfaces is empty every interface
+# except the loopback is used, otherwise only the ones listed like ['eth0', 'wlan0']
+checkNetwork = True
+networkScanSeconds = 10
+networkInterfaces = []
+
+
+#
+#	SENDING
+#
+# the values from all the collectors that run at the same time are packed together into as few
+# packets to XTension as they fit in. If this is more than 0 then values are held for up to this
+# many seconds so that ones from collectors that run a little apart can go together too. This cuts
+# down on the network traffic from a busy pi at the cost of values arriving up to that much later.
+sendLingerSeconds = 0
+
+# while no XTension instance can be reached the values are kept in this file and replayed, with the
+# time they were read, at spoolReplayRate commands per second when XTension is found again. The file
+# is never larger than spoolSizeKB, when it is full the oldest values are dropped.
+useOfflineSpool = True
+spoolPath = '/var/tmp/pimonitor.spool'
+spoolSizeKB = 1024
+spoolReplayRate = 200
 
+# the addresses of the units whose changes must not be lost. XTension acks every command to these
+# and they are sent again until it does. Everything else is sent once, the next value replaces a
+# lost one. The throttled and undervoltage units only change rarely so they are the default.
+reliableUnits = ['THROTTLED', 'UNDERVOLT', 'CAPPED', 'HTHROTTLED', 'HUNDERVOLT', 'HCAPPED']
 
+# how many XTension machines this pi can send to at once. If another one is found when there are
+# already this many the one that hasn't been heard from the longest is dropped.
+maxXTensionInstances = 8
 
+# run everything on a single asyncio event loop instead of separate threads for receiving from
+# XTension, sending to it and reading the files. Sends never retry on the loop, a lost one is lost
+# unless it is one of the reliableUnits.
+useAsyncio = False
 
+# load the changes to this file as soon as it is saved instead of having to restart pimonitor. Only
+# the collectors that use the options that changed are restarted and XTension is only sent the units
+# that were added or removed. The options for the XTension connection and the spool, and this one,
+# still need a restart. If the file has a mistake in it the change is logged and ignored.
+watchConfiguration = True
@@ -0,0 +1,157 @@
+#
+#		Configuration file watcher for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		notices when configuration.py is saved so that it can be loaded again without restarting
+#		pimonitor. Editors usually save by writing a new file and renaming it over the old one, which
+#		would leave a watch on the file itself watching the old one, so the directory is watched
+#		with inotify and only the events for the names we care about are kept.
+#
+#		the configuration is loaded again into a namespace of its own and never into the running
+#		one, so a file with a mistake in it is only logged and everything carries on as it was.
+#		There is no inotify in the standard library so it is called through ctypes.
+#
+
+import ctypes
+import os
+import struct
+import types
+
+
+
+# the inotify event flags we watch for, from linux/inotify.h
+inotifyCloseWrite	= 0x00000008
+inotifyMovedFrom	= 0x00000040
+inotifyMovedTo		= 0x00000080
+inotifyDelete		= 0x00000200
+inotifyWatchMask	= inotifyCloseWrite | inotifyMovedFrom | inotifyMovedTo | inotifyDelete
+
+# watch descriptor, mask, cookie and the length of the name that follows
+inotifyEvent		= struct.Struct( 'iIII')
+
+
+
+#
+#	class		C O N F I G   W A T C H E R
+#
+#	usage:
+#		watcher = ConfigWatcher( '/home/pi/pimonitor', ['configuration.py'])
+#		epoll.register( watcher.fileno(), select.EPOLLIN)
+#		...
+#		if watcher.changed():
+#			reload it
+#
+class ConfigWatcher( object):
+	def __init__( self, directory, names):
+		self.directory = directory
+		self.names = set( os.fsencode( x) for x in names)
+
+		libc = ctypes.CDLL( None, use_errno=True)
+
+		self.fd = libc.inotify_init1( os.O_NONBLOCK | os.O_CLOEXEC)
+		if self.fd == -1:
+			errorNumber = ctypes.get_errno()
+			raise OSError( errorNumber, os.strerror( errorNumber))
+
+		if libc.inotify_add_watch( self.fd, os.fsencode( directory), inotifyWatchMask) == -1:
+			errorNumber = ctypes.get_errno()
+			os.close( self.fd)
+			raise OSError( errorNumber, os.strerror( errorNumber), directory)
+
+
+	def fileno( self):
+		return self.fd
+
+
+	#
+	#	C H A N G E D
+	#
+	#	reads all the waiting events and returns True if any of them were for one of our files
+	#
+	def changed( self):
+		found = False
+
+		while True:
+			try:
+				events = os.read( self.fd, 4096)
+			except BlockingIOError:
+				break
+
+			offset = 0
+			while offset + inotifyEvent.size <= len( events):
+				watch, mask, cookie, nameLength = inotifyEvent.unpack_from( events, offset)
+				offset += inotifyEvent.size
+
+				# the name is padded with nulls to a multiple of the event size
+				name = events[ offset:offset + nameLength].rstrip( b'\0')
+				offset += nameLength
+
+				if name in self.names:
+					found = True
+
+		return found
+
+
+	def close( self):
+		if self.fd != -1:
+			os.close( self.fd)
+			self.fd = -1
+
+
+
+
+#
+#	L O A D   C O N F I G U R A T I O N
+#
+#	runs the configuration file in a namespace of its own and returns its options as a dict, that
+#	is everything it defines except for private names, modules, functions and classes. Anything
+#	wrong with the file is raised as it would be by import
+#
+def loadConfiguration( path):
+	with open( path, 'rb') as f:
+		source = f.read()
+
+	namespace = {'__name__': 'configuration', '__file__': path}
+	exec( compile( source, path, 'exec'), namespace)
+
+	return {name: value for name, value in namespace.items()
+		if not name.startswith( '_') and not isinstance( value, (types.ModuleType, types.FunctionType, type))}
+
+
+
+#
+#	V A L I D A T E   O P T I O N S
+#
+#	checks the new value of every option against the one it is replacing and returns a list of
+#	what is wrong, empty if nothing is. Each must be the same kind of value, though whole and
+#	fractional numbers and lists and tuples can be swapped, an option that was None can be
+#	anything, no number can be negative and the scan intervals must be more than 0
+#
+def validateOptions( options, current):
+	errors = []
+
+	for name, value in options.items():
+		if not name in current:
+			continue
+
+		old = current[ name]
+
+		if old == None:
+			continue
+
+		if isinstance( old, bool):
+			valid = isinstance( value, bool)
+		elif isinstance( old, (int, float)):
+			valid = isinstance( value, (int, float)) and not isinstance( value, bool)
+		elif isinstance( old, (list, tuple)):
+			valid = isinstance( value, (list, tuple))
+		else:
+			valid = isinstance( value, type( old))
+
+		if valid and isinstance( value, (int, float)) and not isinstance( value, bool):
+			valid = value > 0 or (value == 0 and not name.endswith( 'ScanSeconds'))
+
+		if not valid:
+			errors.append( "%s can't be %r" % (name, value))
+
+	return errors
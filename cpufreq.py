@@ -0,0 +1,181 @@
+#
+#		CPU frequency statistics from cpufreq for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		rather than polling the current frequency many times a second and still missing the
+#		short changes this reads the cpufreq stats that the kernel keeps for every policy (a
+#		policy is a group of cores that always run at the same speed, all of them on a pi, but
+#		the big and little clusters on other boards.) time_in_state has the total time spent at
+#		every frequency and total_trans the number of frequency changes, so comparing them with
+#		the previous read gives us the exact time weighted average frequency over the interval
+#		and how much of it was spent at the lowest speed.
+#
+#		if the kernel was built without the cpufreq stats then the current frequency is
+#		read instead and the other values are None.
+#
+
+from array import array
+import glob
+import os
+
+
+
+pathCPUFreqPolicies = '/sys/devices/system/cpu/cpufreq'
+
+
+
+#
+#	class		C P U   F R E Q   S A M P L E
+#
+class CPUFreqSample( object):
+	def __init__( self, policy):
+		self.policy = policy
+		self.averageFrequency = None 	# MHz
+		self.lowestShare = None 		# percent of the interval spent at the lowest frequency
+		self.transitions = None			# number of frequency changes during the interval
+
+
+
+
+#
+#	class		C P U   F R E Q   P O L I C Y
+#
+#	keeps the files and the previous time_in_state for one cpufreq policy
+#
+class CPUFreqPolicy( object):
+	def __init__( self, pseudoFiles, path):
+		self.name = os.path.basename( path)
+		self.pseudoFiles = pseudoFiles
+
+		try:
+			self.timeInStateFile = pseudoFiles.get( path + '/stats/time_in_state')
+			self.totalTransFile = pseudoFiles.get( path + '/stats/total_trans')
+			self.curFreqFile = None
+		except OSError:
+			self.timeInStateFile = None
+			self.totalTransFile = None
+			self.curFreqFile = pseudoFiles.get( path + '/scaling_cur_freq')
+
+		self.frequencies = None
+		self.times = None
+		self.previousTimes = None
+		self.previousTransitions = None
+
+
+	#
+	#	P A R S E   T I M E   I N   S T A T E
+	#
+	#	the file is a line for each frequency with the frequency in kHz and the time
+	#	spent there in 10ms units since boot like:
+	#	600000 1832649
+	#	1500000 30211
+	#
+	def parseTimeInState( self):
+		length = self.timeInStateFile.read()
+		buffer = self.timeInStateFile.buffer
+
+		if self.frequencies == None or buffer.count( b'\n', 0, length) != len( self.frequencies):
+			# first time or the frequency table was changed, start over
+			rows = buffer.count( b'\n', 0, length)
+			self.frequencies = array( 'q', bytes( 8 * rows))
+			self.times = array( 'q', bytes( 8 * rows))
+			self.previousTimes = None
+
+		row = 0
+		lineStart = 0
+
+		while lineStart < length and row < len( self.frequencies):
+			separator = buffer.find( b' ', lineStart, length)
+			lineEnd = buffer.find( b'\n', separator, length)
+			if separator == -1 or lineEnd == -1:
+				break
+
+			self.frequencies[ row] = int( buffer[ lineStart:separator])
+			self.times[ row] = int( buffer[ separator + 1:lineEnd])
+			row += 1
+			lineStart = lineEnd + 1
+
+
+	#
+	#	R E A D
+	#
+	#	returns a CPUFreqSample or None the first time through when there is nothing
+	#	to compare against yet
+	#
+	def read( self):
+		sample = CPUFreqSample( self.name)
+
+		if self.timeInStateFile == None:
+			currentFrequency = self.curFreqFile.readInt()
+			if currentFrequency != None:
+				sample.averageFrequency = round( currentFrequency / 1000)
+			return sample
+
+		self.parseTimeInState()
+		transitions = self.totalTransFile.readInt()
+
+		# some kernels leave the table empty for a while, like when the policy's cpus are being
+		# hotplugged. Nothing to send this time and start over when it's back
+		if len( self.frequencies) == 0:
+			self.previousTimes = None
+			return None
+
+		if self.previousTimes == None:
+			self.previousTimes = array( 'q', self.times)
+			self.previousTransitions = transitions
+			return None
+
+		totalTime = 0
+		weightedFrequency = 0
+		lowestFrequency = min( self.frequencies)
+		lowestTime = 0
+
+		for i in range( len( self.times)):
+			elapsed = self.times[ i] - self.previousTimes[ i]
+			totalTime += elapsed
+			weightedFrequency += elapsed * self.frequencies[ i]
+			if self.frequencies[ i] == lowestFrequency:
+				lowestTime += elapsed
+
+		if totalTime > 0:
+			sample.averageFrequency = round( weightedFrequency / totalTime / 1000)
+			sample.lowestShare = round( lowestTime / totalTime * 100)
+
+		if transitions != None and self.previousTransitions != None:
+			sample.transitions = transitions - self.previousTransitions
+
+		self.previousTimes, self.times = self.times, self.previousTimes
+		self.previousTransitions = transitions
+		return sample
+
+
+
+
+#
+#	class		C P U   F R E Q   R E A D E R
+#
+#	usage:
+#		freqReader = CPUFreqReader( pseudoFiles)
+#		for sample in freqReader.read():
+#			...
+#
+class CPUFreqReader( object):
+	def __init__( self, pseudoFiles):
+		self.policies = []
+
+		for path in sorted( glob.glob( pathCPUFreqPolicies + '/policy*')):
+			try:
+				self.policies.append( CPUFreqPolicy( pseudoFiles, path))
+			except OSError:
+				continue
+
+	def read( self):
+		results = []
+
+		for policy in self.policies:
+			sample = policy.read()
+			if sample != None:
+				results.append( sample)
+
+		return results
+
@@ -0,0 +1,193 @@
+#
+#		CPU accounting from /proc/stat for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		one read and one parse of /proc/stat per sample gives us the aggregate and per core
+#		time in every mode as well as the context switch and interrupt counters and the number
+#		of running and blocked processes.
+#
+#		the jiffy counters for every cpu line are stored in a preallocated integer array one
+#		row per cpu, the first row being the aggregate "cpu" line. The deltas from the previous
+#		sample are then calculated for all of them in a single pass and the current and previous
+#		arrays are swapped rather than copied.
+#
+
+from array import array
+from operator import sub
+import os
+from time import monotonic
+
+
+
+# the columns we keep for each cpu line, guest and guest_nice are already counted in user and nice
+cpuModes 		= ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal')
+modeCount		= len( cpuModes)
+modeIdle		= 3
+modeIOWait		= 4
+
+pathProcStat	= '/proc/stat'
+
+
+
+#
+#	class		C P U   S A M P L E
+#
+#	the results of comparing one read of /proc/stat to the previous one. Any percentage
+#	that could not be calculated (a core that is offline or had no ticks) is None
+#
+class CPUSample( object):
+	def __init__( self, coreCount):
+		self.idle = None 						# aggregate percent idle, the same value the CPU Idle unit has always shown
+		self.modes = [None] * modeCount			# aggregate percent of time in each of cpuModes
+		self.coreBusy = [None] * coreCount		# percent busy for each core
+		self.contextSwitchRate = None			# per second
+		self.interruptRate = None				# per second
+		self.procsRunning = None
+		self.procsBlocked = None
+
+
+
+
+#
+#	class		P R O C   S T A T   R E A D E R
+#
+#	usage:
+#		statReader = ProcStatReader( pseudoFiles)
+#		sample = statReader.read() 	# None the first time as there is nothing to compare against
+#
+class ProcStatReader( object):
+	def __init__( self, pseudoFiles, *, coreCount=None):
+		self.statFile = pseudoFiles.get( pathProcStat)
+
+		if coreCount == None:
+			coreCount = os.cpu_count() or 1
+
+		self.coreCount = coreCount
+		rowCount = coreCount + 1
+
+		self.current = array( 'q', bytes( 8 * rowCount * modeCount))
+		self.previous = array( 'q', bytes( 8 * rowCount * modeCount))
+		self.deltas = [0] * (rowCount * modeCount)
+		self.rowSeen = bytearray( rowCount)
+
+		self.counters = [0, 0] 			# context switches, interrupts
+		self.previousCounters = [0, 0]
+		self.procsRunning = 0
+		self.procsBlocked = 0
+
+		self.previousTime = None
+
+
+	#
+	#	P A R S E
+	#
+	#	walk the lines in the buffer once, storing the numbers we want directly into the
+	#	current arrays. The intr line has a count for every interrupt on the system and can
+	#	be thousands of characters long but we only want the total at the start of it.
+	#
+	def parse( self):
+		length = self.statFile.read()
+		buffer = self.statFile.buffer
+		current = self.current
+		rowSeen = self.rowSeen
+		rowSeen[:] = bytes( len( rowSeen))
+		lineStart = 0
+
+		while lineStart < length:
+			lineEnd = buffer.find( b'\n', lineStart, length)
+			if lineEnd == -1:
+				lineEnd = length
+
+			if buffer.startswith( b'cpu', lineStart):
+				nameEnd = buffer.find( b' ', lineStart, lineEnd)
+
+				if nameEnd == lineStart + 3:
+					row = 0
+				else:
+					row = int( buffer[ lineStart + 3:nameEnd]) + 1
+
+				if row <= self.coreCount:
+					rowSeen[ row] = 1
+					base = row * modeCount
+					fields = buffer[ nameEnd:lineEnd].split()
+					for i in range( modeCount):
+						current[ base + i] = int( fields[ i])
+
+			elif buffer.startswith( b'ctxt ', lineStart):
+				self.counters[0] = int( buffer[ lineStart + 5:lineEnd])
+
+			elif buffer.startswith( b'intr ', lineStart):
+				totalEnd = buffer.find( b' ', lineStart + 5, lineEnd)
+				if totalEnd == -1:
+					totalEnd = lineEnd
+				self.counters[1] = int( buffer[ lineStart + 5:totalEnd])
+
+			elif buffer.startswith( b'procs_running ', lineStart):
+				self.procsRunning = int( buffer[ lineStart + 14:lineEnd])
+
+			elif buffer.startswith( b'procs_blocked ', lineStart):
+				self.procsBlocked = int( buffer[ lineStart + 14:lineEnd])
+
+			lineStart = lineEnd + 1
+
+		# a core that has been taken offline has no line so carry its old values forward
+		for row in range( len( rowSeen)):
+			if not rowSeen[ row]:
+				base = row * modeCount
+				current[ base:base + modeCount] = self.previous[ base:base + modeCount]
+
+
+	#
+	#	R E A D
+	#
+	def read( self):
+		now = monotonic()
+		self.parse()
+
+		if self.previousTime == None:
+			self.previousTime = now
+			self.swap()
+			return None
+
+		elapsed = now - self.previousTime
+		self.previousTime = now
+
+		deltas = self.deltas
+		deltas[:] = map( sub, self.current, self.previous)
+
+		sample = CPUSample( self.coreCount)
+
+		# row 0 is the aggregate of all the cores
+		total = sum( deltas[ 0:modeCount])
+		if total > 0:
+			idleTotal = deltas[ modeIdle] + deltas[ modeIOWait]
+			sample.idle = 100 - round( ((total - idleTotal) / total) * 100)
+			sample.modes = [round( deltas[ i] / total * 100, 1) for i in range( modeCount)]
+
+		for core in range( self.coreCount):
+			base = (core + 1) * modeCount
+			coreTotal = sum( deltas[ base:base + modeCount])
+			if coreTotal > 0:
+				coreIdle = deltas[ base + modeIdle] + deltas[ base + modeIOWait]
+				sample.coreBusy[ core] = round( (coreTotal - coreIdle) / coreTotal * 100)
+
+		if elapsed > 0:
+			sample.contextSwitchRate = round( (self.counters[0] - self.previousCounters[0]) / elapsed)
+			sample.interruptRate = round( (self.counters[1] - self.previousCounters[1]) / elapsed)
+
+		sample.procsRunning = self.procsRunning
+		sample.procsBlocked = self.procsBlocked
+
+		self.swap()
+		return sample
+
+
+	#
+	#	S W A P
+	#
+	#	the current values become the previous ones by swapping the arrays, the next
+	#	parse overwrites the old previous values in place
+	#
+	def swap( self):
+		self.current, self.previous = self.previous, self.current
+		self.counters, self.previousCounters = self.previousCounters, self.counters
@@ -0,0 +1,190 @@
+#
+#		Block device throughput and latency from /proc/diskstats for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		free space doesn't tell you anything about an SD card that is worn out and taking
+#		seconds to complete a write. /proc/diskstats has the running totals of the operations,
+#		sectors and milliseconds spent for every block device so comparing them with the last
+#		read gives the read and write bytes per second, operations per second, the average time
+#		each operation took (await) and the percent of the time the device was busy.
+#
+#		the volumes to scan are mapped to their block device through /proc/self/mountinfo
+#		so the values line up with the disk space units for the same paths.
+#
+#		on the 32 bit pi kernels these counters are 32 bits and wrap around the same as the
+#		network ones, so the change in them is worked out with counterDelta from netstats
+#		which also knows a counter that was reset from one that wrapped.
+#
+
+from array import array
+import os
+from time import monotonic
+
+from netstats import counterDelta
+
+
+
+pathDiskStats 		= '/proc/diskstats'
+pathMountInfo 		= '/proc/self/mountinfo'
+sectorSize			= 512 	# diskstats always counts 512 byte sectors whatever the real sector size is
+
+# the fields we keep from each line, counting from the first one after the device name
+fieldReads			= 0
+fieldSectorsRead	= 2
+fieldMsReading		= 3
+fieldWrites			= 4
+fieldSectorsWritten	= 6
+fieldMsWriting		= 7
+fieldIOTicks		= 9
+keptFields			= (fieldReads, fieldSectorsRead, fieldMsReading, fieldWrites, fieldSectorsWritten, fieldMsWriting, fieldIOTicks)
+
+
+
+#
+#	D E V I C E   F O R   P A T H
+#
+#	finds the mount that the path is on in mountinfo and returns the (major, minor) of
+#	the block device it's mounted from or None if it's not on a block device at all, like
+#	a tmpfs or a network share. Some filesystems, btrfs for one, report an anonymous device
+#	number in mountinfo so if that's the case we try the device node of the mount source.
+#
+def deviceForPath( path):
+	path = os.path.realpath( path)
+	bestMount = None
+	bestDevice = None
+	bestSource = None
+
+	with open( pathMountInfo, 'rb') as f:
+		for line in f:
+			# 36 35 98:0 /mnt1 /mnt2 rw,noatime master:1 - ext3 /dev/root rw,errors=continue
+			fields = line.split()
+			mountPoint = fields[4].decode().replace( '\\040', ' ')
+
+			if not (path == mountPoint or path.startswith( mountPoint.rstrip( '/') + '/')):
+				continue
+
+			if bestMount != None and len( mountPoint) < len( bestMount):
+				continue
+
+			separator = fields.index( b'-')
+			bestMount = mountPoint
+			bestDevice = tuple( int( x) for x in fields[2].split( b':'))
+			bestSource = fields[ separator + 2].decode()
+
+	if bestMount == None:
+		return None
+
+	if bestDevice[0] != 0:
+		return bestDevice
+
+	try:
+		sourceStat = os.stat( bestSource)
+		if sourceStat.st_rdev != 0:
+			return (os.major( sourceStat.st_rdev), os.minor( sourceStat.st_rdev))
+	except OSError:
+		pass
+
+	return None
+
+
+
+#
+#	class		D I S K   I O   S A M P L E
+#
+class DiskIOSample( object):
+	def __init__( self, device):
+		self.device = device
+		self.readBytesPerSecond = None
+		self.writeBytesPerSecond = None
+		self.operationsPerSecond = None
+		self.averageWait = None 		# milliseconds per operation, 0 if there were none
+		self.utilization = None 		# percent of the time the device had something in flight
+
+
+
+
+#
+#	class		D I S K   S T A T S   R E A D E R
+#
+#	usage:
+#		diskReader = DiskStatsReader( pseudoFiles, [(179, 2), (8, 1)])
+#		samples = diskReader.read() 	# dict of (major, minor) to DiskIOSample, empty the first time
+#
+class DiskStatsReader( object):
+	def __init__( self, pseudoFiles, devices):
+		self.diskStatsFile = pseudoFiles.get( pathDiskStats)
+		self.devices = list( dict.fromkeys( devices)) # the same device may be listed for more than one volume
+
+		# the lines start with the major and minor right justified like "   8       1 sda1 ..."
+		self.lineKeys = [b'%4d %7d ' % device for device in self.devices]
+
+		fieldCount = len( keptFields) * len( self.devices)
+		self.current = array( 'q', bytes( 8 * fieldCount))
+		self.previous = array( 'q', bytes( 8 * fieldCount))
+		self.previousTime = None
+
+
+	#
+	#	P A R S E
+	#
+	def parse( self):
+		length = self.diskStatsFile.read()
+		buffer = self.diskStatsFile.buffer
+		current = self.current
+
+		for i in range( len( self.devices)):
+			start = buffer.find( self.lineKeys[ i], 0, length)
+			while start > 0 and buffer[ start - 1] != 10:
+				start = buffer.find( self.lineKeys[ i], start + 1, length)
+
+			base = i * len( keptFields)
+
+			if start == -1:
+				# the device has gone away, carry the old values forward so it reads as idle
+				current[ base:base + len( keptFields)] = self.previous[ base:base + len( keptFields)]
+				continue
+
+			lineEnd = buffer.find( b'\n', start, length)
+			if lineEnd == -1:
+				lineEnd = length
+
+			# skip the major, minor and the name
+			fields = buffer[ start:lineEnd].split()[ 3:]
+			for j in range( len( keptFields)):
+				current[ base + j] = int( fields[ keptFields[ j]])
+
+
+	#
+	#	R E A D
+	#
+	def read( self):
+		now = monotonic()
+		self.parse()
+		results = {}
+
+		if self.previousTime != None and now > self.previousTime:
+			elapsed = now - self.previousTime
+			current = self.current
+			previous = self.previous
+
+			for i in range( len( self.devices)):
+				base = i * len( keptFields)
+				reads, sectorsRead, msReading, writes, sectorsWritten, msWriting, ioTicks = (
+					counterDelta( current[ base + j], previous[ base + j]) for j in range( len( keptFields)))
+
+				sample = DiskIOSample( self.devices[ i])
+				sample.readBytesPerSecond = round( sectorsRead * sectorSize / elapsed)
+				sample.writeBytesPerSecond = round( sectorsWritten * sectorSize / elapsed)
+				sample.operationsPerSecond = round( (reads + writes) / elapsed, 1)
+
+				if reads + writes > 0:
+					sample.averageWait = round( (msReading + msWriting) / (reads + writes), 1)
+				else:
+					sample.averageWait = 0
+
+				sample.utilization = min( 100, round( ioTicks / (elapsed * 1000) * 100))
+				results[ self.devices[ i]] = sample
+
+		self.previousTime = now
+		self.current, self.previous = self.previous, self.current
+		return results
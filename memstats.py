@@ -0,0 +1,185 @@
+#
+#		Memory and pressure stall statistics for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		/proc/meminfo tells us how much memory is actually available, how much is in the page
+#		cache or dirty and waiting to be written to the SD card and how much of the CMA area
+#		that the camera and video drivers need is still free.
+#
+#		/proc/pressure/{cpu,memory,io} are the pressure stall information (PSI) files which
+#		show the percent of time that some (or all) tasks were stalled waiting on that resource.
+#		The kernel can also watch these for us, if a trigger is written to the file it will
+#		wake up a POLLPRI on it as soon as the stall time within the window goes over the
+#		threshold so we can report a spike right away instead of at the next scan.
+#
+
+import os
+
+
+
+pathMemInfo 		= '/proc/meminfo'
+pathPressure		= '/proc/pressure/'
+
+# the /proc/meminfo keys we report, all are in kB
+memInfoKeys			= (b'MemAvailable:', b'Cached:', b'Dirty:', b'CmaFree:', b'SwapFree:')
+
+pressureResources	= ('cpu', 'memory', 'io')
+
+
+
+#
+#	class		M E M   I N F O   R E A D E R
+#
+#	usage:
+#		memReader = MemInfoReader( pseudoFiles)
+#		values = memReader.read() # a list of bytes for each of memInfoKeys, None if that key isn't there
+#
+class MemInfoReader( object):
+	def __init__( self, pseudoFiles):
+		self.memInfoFile = pseudoFiles.get( pathMemInfo)
+		self.values = [None] * len( memInfoKeys)
+
+	def read( self):
+		length = self.memInfoFile.read()
+		buffer = self.memInfoFile.buffer
+
+		for i in range( len( memInfoKeys)):
+			key = memInfoKeys[ i]
+			start = buffer.find( key, 0, length)
+
+			# make sure it's the start of a line and not the end of a longer key like SwapCached:
+			while start > 0 and buffer[ start - 1] != 10:
+				start = buffer.find( key, start + 1, length)
+
+			if start == -1:
+				self.values[ i] = None
+				continue
+
+			lineEnd = buffer.find( b'\n', start, length)
+			if lineEnd == -1:
+				lineEnd = length
+
+			# lines look like "MemAvailable:     123456 kB"
+			self.values[ i] = int( buffer[ start + len( key):lineEnd].rstrip( b' kB')) * 1024
+
+		return self.values
+
+
+
+
+#
+#	class		P R E S S U R E   S A M P L E
+#
+#	the avg10 values for one of the pressure files, the percent of the last 10 seconds
+#	that some or all non-idle tasks were stalled. The cpu file has no meaningful full
+#	line so that is None for cpu. someStallMs is how many milliseconds some tasks were
+#	stalled since the file was last read, from the running total, None the first time.
+#	unlike avg10 this shows all of a short stall right away
+#
+class PressureSample( object):
+	def __init__( self, resource):
+		self.resource = resource
+		self.some = None
+		self.full = None
+		self.someStallMs = None
+
+
+
+
+#
+#	class		P R E S S U R E   R E A D E R
+#
+#	reads all of the pressure files that exist on this kernel, older kernels or ones
+#	booted without psi=1 won't have them at all and the constructor will raise OSError
+#
+class PressureReader( object):
+	def __init__( self, pseudoFiles):
+		self.files = {}
+
+		for resource in pressureResources:
+			self.files[ resource] = pseudoFiles.get( pathPressure + resource)
+
+		# the some total= of each resource at the last read in microseconds
+		self.previousTotals = {}
+
+	@staticmethod
+	def parseAverage( buffer, length, lineKey):
+		start = buffer.find( lineKey, 0, length)
+		if start == -1:
+			return None
+
+		start = buffer.find( b'avg10=', start, length)
+		end = buffer.find( b' ', start, length)
+		if start == -1 or end == -1:
+			return None
+
+		return float( buffer[ start + 6:end])
+
+	@staticmethod
+	def parseTotal( buffer, length, lineKey):
+		start = buffer.find( lineKey, 0, length)
+		if start == -1:
+			return None
+
+		start = buffer.find( b'total=', start, length)
+		end = buffer.find( b'\n', start, length)
+		if start == -1:
+			return None
+		if end == -1:
+			end = length
+
+		return int( buffer[ start + 6:end])
+
+	def read( self):
+		results = []
+
+		for resource in pressureResources:
+			workFile = self.files[ resource]
+			length = workFile.read()
+
+			sample = PressureSample( resource)
+			sample.some = self.parseAverage( workFile.buffer, length, b'some ')
+			if resource != 'cpu':
+				sample.full = self.parseAverage( workFile.buffer, length, b'full ')
+
+			total = self.parseTotal( workFile.buffer, length, b'some ')
+			previous = self.previousTotals.get( resource)
+			if total != None and previous != None and total >= previous:
+				sample.someStallMs = round( (total - previous) / 1000)
+			self.previousTotals[ resource] = total
+
+			results.append( sample)
+
+		return results
+
+
+
+
+#
+#	class		P R E S S U R E   T R I G G E R
+#
+#	registers a PSI trigger with the kernel. The file descriptor will show POLLPRI when
+#	the "some" stall time for the resource goes over stallMs within any windowMs window.
+#	The kernel only fires the trigger once per window so this can't flood us.
+#
+#	the trigger lives as long as the file is open so keep the object around. The read
+#	side of the cache is used to read the actual values when it fires.
+#
+class PressureTrigger( object):
+	def __init__( self, resource, *, stallMs, windowMs):
+		self.resource = resource
+		self.fd = os.open( pathPressure + resource, os.O_RDWR | os.O_NONBLOCK | os.O_CLOEXEC)
+
+		try:
+			os.write( self.fd, b'some %d %d\0' % (stallMs * 1000, windowMs * 1000))
+		except OSError:
+			os.close( self.fd)
+			raise
+
+	def fileno( self):
+		return self.fd
+
+	def close( self):
+		if self.fd != -1:
+			os.close( self.fd)
+			self.fd = -1
@@ -0,0 +1,235 @@
+#
+#		Network interface throughput from /proc/net/dev for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		/proc/net/dev has the running totals of the bytes, packets, errors and drops in each
+#		direction for every interface. It's read once per scan for all the interfaces and the
+#		rates calculated from the change since the last read.
+#
+#		on the 32 bit pi kernels these counters are 32 bits and the byte counters on a busy
+#		link wrap around every few minutes so a counter that went backwards is treated as
+#		having wrapped rather than as a huge negative rate. The 64 bit kernels, including the
+#		ones running a 32 bit userland, have 64 bit counters that never wrap so there it was reset.
+#
+
+from array import array
+import os
+from time import monotonic
+
+
+
+pathNetDev 			= '/proc/net/dev'
+
+# the fields we keep from each line, counting from the first one after the "name:"
+fieldRxBytes		= 0
+fieldRxPackets		= 1
+fieldRxErrors		= 2
+fieldRxDrops		= 3
+fieldTxBytes		= 8
+fieldTxPackets		= 9
+fieldTxErrors		= 10
+fieldTxDrops		= 11
+keptFields			= (fieldRxBytes, fieldRxPackets, fieldRxErrors, fieldRxDrops, fieldTxBytes, fieldTxPackets, fieldTxErrors, fieldTxDrops)
+
+# the kernel's counters are an unsigned long, so it's the kernel that matters and not our own python
+counterBits			= 64 if '64' in os.uname().machine else 32
+
+
+
+#
+#	I N T E R F A C E   N A M E S
+#
+#	all the interfaces in /proc/net/dev except the loopback, used when the configuration
+#	doesn't list specific interfaces
+#
+def interfaceNames():
+	with open( pathNetDev, 'rb') as f:
+		return namesInLines( f)
+
+
+def namesInLines( lines):
+	names = []
+
+	for line in lines:
+		separator = line.find( b':')
+		if separator == -1:
+			continue
+
+		name = line[ :separator].strip().decode()
+		if name != 'lo':
+			names.append( name)
+
+	return names
+
+
+
+#
+#	C O U N T E R   D E L T A
+#
+#	the change in a counter since the last read allowing for it to have wrapped. Only a 32 bit
+#	counter that was in the top half of its range can have wrapped since the last read,
+#	anything else that went backwards was reset, like an interface that was removed and created
+#	again, so the new value is the change.
+#
+def counterDelta( current, previous):
+	delta = current - previous
+
+	if delta < 0:
+		if counterBits == 32 and 0x80000000 <= previous < 0x100000000:
+			delta += 0x100000000
+		else:
+			delta = current
+
+	return delta
+
+
+
+#
+#	class		N E T   D E V   S A M P L E
+#
+class NetDevSample( object):
+	def __init__( self, name):
+		self.name = name
+		self.rxBytesPerSecond = None
+		self.txBytesPerSecond = None
+		self.rxPacketsPerSecond = None
+		self.txPacketsPerSecond = None
+		self.errorsPerSecond = None 	# receive and transmit together
+		self.dropsPerSecond = None		# receive and transmit together
+
+
+
+
+#
+#	class		N E T   D E V   R E A D E R
+#
+#	usage:
+#		netReader = NetDevReader( pseudoFiles, ['eth0', 'wlan0'])
+#		samples = netReader.read() 		# dict of name to NetDevSample, empty the first time
+#		netReader.addNames( ['usb0'])		# the others keep their previous counters
+#		netReader.removeNames( ['usb0'])
+#
+class NetDevReader( object):
+	def __init__( self, pseudoFiles, names):
+		self.netDevFile = pseudoFiles.get( pathNetDev)
+		self.names = list( names)
+		self.lineKeys = [name.encode() + b':' for name in self.names]
+
+		fieldCount = len( keptFields) * len( self.names)
+		self.current = array( 'Q', bytes( 8 * fieldCount))
+		self.previous = array( 'Q', bytes( 8 * fieldCount))
+		self.present = bytearray( len( self.names))
+		self.previousTime = None
+		self.length = 0
+
+
+	#
+	#	P A R S E
+	#
+	def parse( self):
+		length = self.netDevFile.read()
+		buffer = self.netDevFile.buffer
+		self.length = length
+		current = self.current
+
+		for i in range( len( self.names)):
+			key = self.lineKeys[ i]
+			start = buffer.find( key, 0, length)
+
+			# names are right justified so make sure we didn't match the end of a longer name
+			while start > 0 and not buffer[ start - 1] in b' \n':
+				start = buffer.find( key, start + 1, length)
+
+			if start == -1:
+				self.present[ i] = 0
+				continue
+
+			lineEnd = buffer.find( b'\n', start, length)
+			if lineEnd == -1:
+				lineEnd = length
+
+			fields = buffer[ start + len( key):lineEnd].split()
+			base = i * len( keptFields)
+			for j in range( len( keptFields)):
+				current[ base + j] = int( fields[ keptFields[ j]])
+
+			self.present[ i] = 1
+
+
+	#
+	#	A D D   N A M E S
+	#
+	#	starts reading more interfaces without losing the previous counters of the others. The new
+	#	ones aren't present until the next read so they have rates from the one after that
+	#
+	def addNames( self, names):
+		names = [x for x in names if not x in self.names]
+
+		self.names += names
+		self.lineKeys += [name.encode() + b':' for name in names]
+		self.current.frombytes( bytes( 8 * len( keptFields) * len( names)))
+		self.previous.frombytes( bytes( 8 * len( keptFields) * len( names)))
+		self.present.extend( bytes( len( names)))
+
+
+	#
+	#	R E M O V E   N A M E S
+	#
+	#	stops reading the interfaces, the rest keep their previous counters
+	#
+	def removeNames( self, names):
+		keep = [i for i in range( len( self.names)) if not self.names[ i] in names]
+		fieldCount = len( keptFields)
+
+		self.names = [self.names[ i] for i in keep]
+		self.lineKeys = [self.lineKeys[ i] for i in keep]
+		self.current = array( 'Q', (self.current[ i * fieldCount + j] for i in keep for j in range( fieldCount)))
+		self.previous = array( 'Q', (self.previous[ i * fieldCount + j] for i in keep for j in range( fieldCount)))
+		self.present = bytearray( self.present[ i] for i in keep)
+
+
+	#
+	#	A L L   N A M E S
+	#
+	#	every interface except the loopback in what the last read found, so that new interfaces
+	#	can be noticed without reading /proc/net/dev again
+	#
+	def allNames( self):
+		return namesInLines( self.netDevFile.buffer[ :self.length].split( b'\n'))
+
+
+	#
+	#	R E A D
+	#
+	def read( self):
+		now = monotonic()
+		wasPresent = bytes( self.present)
+		self.parse()
+		results = {}
+
+		if self.previousTime != None and now > self.previousTime:
+			elapsed = now - self.previousTime
+			current = self.current
+			previous = self.previous
+
+			for i in range( len( self.names)):
+				# an interface that just appeared or went away has nothing to compare
+				if not (self.present[ i] and wasPresent[ i]):
+					continue
+
+				base = i * len( keptFields)
+				rxBytes, rxPackets, rxErrors, rxDrops, txBytes, txPackets, txErrors, txDrops = (
+					counterDelta( current[ base + j], previous[ base + j]) for j in range( len( keptFields)))
+
+				sample = NetDevSample( self.names[ i])
+				sample.rxBytesPerSecond = round( rxBytes / elapsed)
+				sample.txBytesPerSecond = round( txBytes / elapsed)
+				sample.rxPacketsPerSecond = round( rxPackets / elapsed, 1)
+				sample.txPacketsPerSecond = round( txPackets / elapsed, 1)
+				sample.errorsPerSecond = round( (rxErrors + txErrors) / elapsed, 2)
+				sample.dropsPerSecond = round( (rxDrops + txDrops) / elapsed, 2)
+				results[ self.names[ i]] = sample
+
+		self.previousTime = now
+		self.current, self.previous = self.previous, self.current
+		return results
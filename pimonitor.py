@@ -44,22 +44,94 @@
 #						much of the data that changes frequently but is not necessarily
 #						useful to have spamming the log as the values will be there to go
 #						look for if needed.
+#
+#	1.1					collectors are run from a deadline scheduler instead of counting 1 second
+#						epoll timeouts so intervals no longer drift or stall while the throttled file
+#						is busy and they may be fractional seconds.
+#						the /sys and /proc files are kept open and re-read with pread through a shared cache
+#						WiFi statistics are read from nl80211 directly instead of running iwconfig
+#						optional per core, per mode, context switch, interrupt and process count CPU units
+#						CPU frequency is the time weighted average from the cpufreq stats for every policy
+#						instead of a separate thread polling the current frequency
+#						memory, CMA and pressure stall units, PSI triggers report stalls right away
+#						disk throughput, iops, await and utilization for each of the volumes to scan
+#						network throughput, packet, error and drop rates for every interface
+#						throttled units are only sent when their bit changes, all in one packet, plus
+#						units for the total time spent throttled, capped and undervolted
+
+
+#						every metric is a collector in the collectors package that is only loaded if it is turned
+#						on and is left out if the files it needs are not on this pi, see collectors/__init__.py
+#						the values sent from one pass of the collectors are packed together into as few datagrams as will fit
+#						everything is sent from its own thread through a queue so a network outage never holds up
+#						the collectors, throttled changes go ahead of everything else
+#						values sent while there is no XTension to send them to are kept in a memory mapped spool
+#						and replayed with the time they were read when XTension is found again
+#						a newly found XTension, or one that sends a query, is sent the current value of every unit
+#						right after the info packet instead of waiting for them to change
+#						the throttled units, or any listed in reliableUnits, are acked by XTension and sent again
+#						until they are so a lost packet doesn't leave them showing the wrong state
+#						connects to up to maxXTensionInstances XTension machines instead of 4
+#						XTension pings and timeouts are timed in real seconds and the listener no longer wakes every second
+#						optionally everything runs on a single asyncio event loop instead of threads, see useAsyncio
+#						the info packet is compact JSON and is sent in chunks if it is too large for one datagram
+#						the info is built once and sent as is until the units change, then XTension is sent just the
+#						units that were added or removed. New network interfaces get their units without a restart
+#						changes to configuration.py are loaded without restarting, only the collectors that use the
+#						options that changed are restarted or rescheduled, see watchConfiguration
 
 
 import select
+import asyncio
 import datetime
 import sys, os
 import threading
-from subprocess import PIPE, Popen
 
 
 from xtension import *				# XTension plugin communication protocol support
 from xtension_constants import *	# Constants used in the commands to XTension
+from xtension_async import AsyncXTension	# the same on an asyncio event loop if useAsyncio is on
+from scheduler import Scheduler		# deadline scheduler for the collectors
+from sysfiles import PseudoFileCache	# open once and pread handles for the /sys and /proc files
+import collectors					# all the metrics we send, see collectors/__init__.py
+from spool import Spool				# keeps the values while XTension can't be reached
+from configwatch import ConfigWatcher, loadConfiguration, validateOptions	# reloads the configuration when it's edited
 
 
 currentHostname 	= None 			# will become either the machine hostname or was set by the user in configuration file
 overrideDeviceId 	= None 			# see this value in the configuration file for more info
 
+# defaults for configuration options added after 1.0 so that an older configuration.py
+# that doesn't have them in it will still load. Anything in the configuration file replaces these.
+showPerCoreUsage		= True
+showCPUModes			= False
+showContextSwitches		= False
+showInterruptRate		= False
+showProcessCounts		= False
+checkMemory				= True
+memoryScanSeconds		= 10
+checkPressure			= True
+pressureScanSeconds		= 10
+usePressureTriggers		= True
+pressureTriggerStallMs	= 150
+pressureTriggerWindowMs	= 1000
+checkDiskIO				= True
+diskIOScanSeconds		= 10
+showThrottledTimes		= True
+throttledTimeScanSeconds = 60
+checkNetwork			= True
+networkScanSeconds		= 10
+networkInterfaces		= []
+sendLingerSeconds		= 0
+useOfflineSpool			= True
+spoolPath				= '/var/tmp/pimonitor.spool'
+spoolSizeKB				= 1024
+spoolReplayRate			= 200
+reliableUnits			= ['THROTTLED', 'UNDERVOLT', 'CAPPED', 'HTHROTTLED', 'HUNDERVOLT', 'HCAPPED']
+maxXTensionInstances	= 8
+useAsyncio				= False
+watchConfiguration		= True
+
 # import the configuration data
 # if the configuration.py file is not found attempt to import the default values from the template file
 try:
@@ -87,50 +159,74 @@ except:
 
 
 
-pluginVersion = '1.0.1'
+pluginVersion = '1.1'
+
+
+# the collectors find the configuration options as attributes of this module
+config = sys.modules[ __name__]
 
+# the options that are only used at startup, a change to one of these is logged but pimonitor
+# has to be restarted for it to take effect. See reloadConfiguration
+restartOptions = ('currentHostname', 'overrideDeviceId', 'useAsyncio', 'maxXTensionInstances', 'useOfflineSpool', 
+	'spoolPath', 'spoolSizeKB', 'spoolReplayRate', 'watchConfiguration')
 
+# how long to wait after the configuration is saved before loading it, in case the editor
+# saves it in more than one step
+configurationSettleSeconds = 1
 
-# addresses used for normal units 
+# where the configuration files are and the options as they were last loaded from them
+configurationDirectory = os.path.dirname( os.path.abspath( __file__))
+configWatcher = None
 
-addrThrottled 			= 'THROTTLED'
-addrUndervolt 			= 'UNDERVOLT'
-addrCapped				= 'CAPPED'
-addrThrottledHistoric 	= 'HTHROTTLED'
-addrUndervoltHistoric	= 'HUNDERVOLT'
-addrCappedHistoric		= 'HCAPPED'
-addrCPUTEMP 			= 'CPUTEMP'
-addrRSSI 				= 'RSSI'
-addrLinkQuality			= 'QUAL'
-addrLinkRate			= 'RATE'
-addrTXPower 			= 'TXPOWER'
-addrWiFiFreq			= 'WFREQ'
-addrCPUUsage 			= 'IDLE'
-addrFrequency 			= 'FREQ'
-addrDiskSpace 			= 'SPACE'
-	# disk space will be the 'SPACE.' and then the path with all the slashes converted to more periods
-	# so the root would be 'SPACE..' and /pi/recordings would be SPACE.PI.RECORDINGS
+
+
+#
+#	C O N F I G U R A T I O N   P A T H
+#
+#	configuration.py or the template if there isn't one, the same as the import above
+#
+def configurationPath():
+	path = os.path.join( configurationDirectory, 'configuration.py')
+	if os.path.exists( path):
+		return path
+		
+	return os.path.join( configurationDirectory, 'configuration_template.py')
+	
+	
+try:
+	loadedOptions = loadConfiguration( configurationPath())
+except Exception:
+	loadedOptions = {}
+	
+# anything else in the file is ignored when it is reloaded
+configurationOptions = set( loadedOptions) | set( restartOptions)
+try:
+	configurationOptions |= set( loadConfiguration( os.path.join( configurationDirectory, 'configuration_template.py')))
+except Exception:
+	pass
 
 
 
 #
-#	file accessors that we will keep open to read various system files via the select thread
+#	all the /sys and /proc files are opened once through the cache and then re-read with pread
 #
 
-throttledFile = None
-CPUFreqFile = None
+pseudoFiles = PseudoFileCache()
+
+# the collectors that are turned on and were found to work on this pi, see loadCollectors in main
+activeCollectors = []
+
+# the deadline scheduler that runs the collectors, created by the file watcher thread
+scheduler = None
 
-# current values so we can only send info when something has changed
-currentCPUTemp 		= 0.0
-currentRSSI 		= [0] * len( RSSIInterfaceName)
-currentQuality 		= [0] * len( RSSIInterfaceName)
-currentBitRate 		= [0] * len( RSSIInterfaceName)
-currentTXPower 		= [0] * len( RSSIInterfaceName)
-currentWiFiFrequency= [0] * len( RSSIInterfaceName)
-currentUsageData	= None
-currentCPUUsage	 	= -1
-currentCPUFreq 		= 0
-currentDiskSpace 	= [0] * len( volumesToScan)
+# the epoll in the file watcher thread and the handlers for the files registered with it
+# keyed by the file descriptor. See watchFileDescriptor
+epoll = None
+epollHandlers = {}
+
+# the loop and the event that wakes the file watcher when it runs as a coroutine, see runBlocking
+watcherLoop = None
+watcherWakeup = None
 
 	
 
@@ -139,432 +235,330 @@ currentDiskSpace 	= [0] * len( volumesToScan)
 # 
 # 	T H R E A D E D   F I L E   W A T C H E R
 #
-#	called as a thread, pauses on select to watch all the necessary files that might
+#	called as a thread, pauses on epoll to watch all the necessary files that might
 #	change and to send updates to XTension
-# 	unfortunately it seems that only the throttled file will respond to being read via the select.poll method
-#	and the others will still have to be read regularly in a separate thread.
-#	but since there is a 1 second timeout on the poll we can at least get close unless a lot is happening to the pi
-#	in which case the other scans will happen slightly more frequently
-#	TODO switch this to datetime intervals instead of just counting sleeps of a second
+# 	unfortunately it seems that only the throttled file will respond to being read via the epoll method
+#	and the others still have to be read regularly. Those are kept in the scheduler which knows
+#	exactly when the next one is due so the epoll timeout is set to wake us right then, no matter
+#	how often the throttled file is firing in between.
 #
 def threadedFileWatcher():
-	global throttledFile
+	startFileWatcher()
 
+	while True:
+		dispatchEpollEvents( watcherTimeout())
+		scheduler.runDue()
+		flushBatchIfDue()
 
-	epoll = select.epoll()
+
+	stopFileWatcher()
+	
+	
+#
+#	A S Y N C   F I L E   W A T C H E R
+#
+#	the same as threadedFileWatcher but as a coroutine on the event loop when useAsyncio is on.
+#	The sysfs files can't be given to the loop with add_reader directly as they always look
+#	readable and only signal a change with POLLPRI, so they stay registered with the epoll and the
+#	epoll itself, which is readable when any of them have fired, is watched by the loop instead.
+#	in between it sleeps until the next collector is due or the epoll handler wakes it to flush
+#
+async def asyncFileWatcher():
+	global watcherLoop
+	global watcherWakeup
 	
-	CPUCheckCounter 	= CPUTempScanSeconds
-	RSSICheckCounter 	= RSSIScanSeconds
-	CPUUsageCounter 	= CPUUsageScanSeconds
-	diskSpaceCounter 	= diskScanSeconds
+	loop = asyncio.get_running_loop()
+	wakeup = asyncio.Event()
+	watcherLoop = loop
+	watcherWakeup = wakeup
+	
+	startFileWatcher()
+	
+	def epollReady():
+		dispatchEpollEvents( 0)
+		wakeup.set()
+		
+	loop.add_reader( epoll.fileno(), epollReady)
 	
 	try:
-		throttledFile = open( "/sys/devices/platform/soc/soc:firmware/get_throttled")
-	except Exception as e:
-		xtension.writeLog( "error opening throttled information file: %s" % e)
-
+		while True:
+			timeout = watcherTimeout()
+			try:
+				await asyncio.wait_for( wakeup.wait(), None if timeout == -1 else timeout)
+			except asyncio.TimeoutError:
+				pass
+				
+			wakeup.clear()
+			scheduler.runDue()
+			flushBatchIfDue()
+			
+	finally:
+		loop.remove_reader( epoll.fileno())
+		stopFileWatcher()
 	
-	if throttledFile != None:
-		epoll.register( throttledFile.fileno(), select.EPOLLPRI | select.EPOLLERR)
 	
+#
+#	S T A R T   F I L E   W A T C H E R
+#
+#	creates the epoll and the scheduler, starts the collectors and adds the ones that run on an
+#	interval to the scheduler. Called from the file watcher thread or coroutine
+#
+def startFileWatcher():
+	global scheduler
+	global epoll
 
-	while True:
-		skipOtherPolls = False # when the epoll.poll returns something it may be much faster than we want to count other seconds	
-		for fd, event in epoll.poll( 1):
-			skipOtherPolls = True
-
-			if throttledFile != None and fd == throttledFile.fileno():
-				try:
-					processThrottledFile()
-				except Exception as e:
-					xtension.writeLog( "ERROR: processThrottledFile( %s)" % e)
-					
-
-		if skipOtherPolls:
-			continue
-				
-		if checkCPUTemp:
-			CPUCheckCounter += 1
-			if CPUCheckCounter >= CPUTempScanSeconds:
-				try:
-					processCPUTemp()
-				except Exception as e:
-					xtension.writeLog( "ERROR: processCPUTemp( %s)" % e)
-					
-				CPUCheckCounter = 0
+
+	epoll = select.epoll()
+	scheduler = Scheduler( errorHandler=schedulerTaskError, lateHandler=schedulerTaskLate)
+	
+	# everything sent from the file watcher is batched so the values from all the collectors that ran in
+	# the same pass, or within sendLingerSeconds of each other, go out packed into as few datagrams as possible
+	xtension.beginBatch()
+
+	for collector in activeCollectors:
+		startCollector( collector)
+		
+	if watchConfiguration:
+		startConfigWatcher()
+			
+			
+def stopFileWatcher():
+	xtension.endBatch()
+	
+	for collector in activeCollectors:
+		collector.stop()
 		
+	if configWatcher != None:
+		unwatchFileDescriptor( configWatcher.fileno())
+		configWatcher.close()
 		
-		if checkRSSI:
-			RSSICheckCounter += 1
-			if RSSICheckCounter >= RSSIScanSeconds:
-				try:
-					processRSSI()
-				except Exception as e:
-					xtension.writeLog( "ERROR: processRSSI( %s)" % e)
-					
-					
-				RSSICheckCounter = 0
 		
+#
+#	S T A R T   C O L L E C T O R   and   S T O P   C O L L E C T O R
+#
+#	starts a collector and adds it to the scheduler if it runs on an interval, or takes it out
+#	of the scheduler and stops it. Only called from the file watcher
+#
+def startCollector( collector):
+	try:
+		collector.config.callSetup( collector.start)
+	except Exception as e:
+		xtension.writeLog( "ERROR: starting %s( %s)" % (collector.name, e))
+		return
+		
+	scheduleCollector( collector, runNow=True)
+	
+	
+def stopCollector( collector):
+	scheduler.removeTask( collector.name)
+	
+	try:
+		collector.stop()
+	except Exception as e:
+		xtension.writeLog( "ERROR: stopping %s( %s)" % (collector.name, e))
 		
 		
-		if checkCPUUsage:
-			CPUUsageCounter += 1
-			if CPUUsageCounter >= CPUUsageScanSeconds:
-				try:
-					processCPUUsage()
-				except Exception as e:
-					xtension.writeLog( "ERROR: processCPUUsage( %s)" % e)
-					
-				CPUUsageCounter = 0
+def scheduleCollector( collector, runNow):
+	interval = collector.interval()
+	if interval != None:
+		scheduler.addTask( name=collector.name, interval=interval, callback=collector.sample, runNow=runNow)
+	else:
+		scheduler.removeTask( collector.name)
 		
 		
-		if checkDiskSpace:
-			diskSpaceCounter += 1
-			if diskSpaceCounter >= diskScanSeconds:
-				try:
-					processDiskSpace()
-				except Exception as e:
-					xtension.writeLog( "ERROR: processDiskSpace( %s)" % e)
-					
-				diskSpaceCounter = 0
-					
-
-
-	if throtteledFile != None:
-		epoll.unregisterFile( throttledFile.fileno())
-		throttledFile.close()
+#
+#	S T A R T   C O N F I G   W A T C H E R
+#
+#	watches the configuration files with inotify through the file watcher epoll so that any
+#	changes to them are loaded without restarting. See reloadConfiguration
+#
+def startConfigWatcher():
+	global configWatcher
 	
+	try:
+		configWatcher = ConfigWatcher( configurationDirectory, ['configuration.py', 'configuration_template.py'])
+	except Exception as e:
+		xtension.writeLog( "unable to watch the configuration for changes, pimonitor must be restarted for them to take effect (%s)" % e)
+		return
+		
+	watchFileDescriptor( configWatcher.fileno(), 'configuration watcher', configurationChanged, select.EPOLLIN)
 	
 	
+def configurationChanged( fd, event):
+	if configWatcher.changed():
+		# saving again before it has settled just pushes the reload back
+		scheduler.addTask( name='reloadConfiguration', interval=configurationSettleSeconds, callback=reloadConfiguration, runNow=False)
 		
-
+		
+#
+#	R E L O A D   C O N F I G U R A T I O N
 #
-#		P R O C E S S   R S S I
+#	loads the configuration file again in a namespace of its own and if it is valid gives the options
+#	that changed their new values. Only the collectors that use them are rescheduled, restarted, added
+#	or removed and XTension is sent just the units that were added or removed. If the file can't be
+#	loaded or anything in it isn't valid nothing is changed at all. An option taken out of the file
+#	keeps the value it had. Called from the scheduler in the file watcher
 #
-#	called at the interval in configuration to process the various WiFi statistics
-#	as turned on in the configuration, or nothing if the list of wlan interfaces is empty
-#	
+def reloadConfiguration():
+	global activeCollectors
 	
-def processRSSI():
-	global currentRSSI
+	scheduler.removeTask( 'reloadConfiguration')
 	
-	for i in range( len( RSSIInterfaceName)):
-
-		thisName 		= RSSIInterfaceName[ i]	
+	path = configurationPath()
+	try:
+		options = loadConfiguration( path)
+	except Exception as e:
+		xtension.writeLog( "ERROR: unable to load the changes to %s, carrying on with the configuration as it was (%s)" % (path, e))
+		return
 		
-		process = Popen( ['iwconfig', thisName], stdout=PIPE, stderr=PIPE)
-		output, _error = process.communicate()
-		output = output.decode()
+	unknown = sorted( x for x in options if not x in configurationOptions)
+	if len( unknown) > 0:
+		xtension.writeLog( "ignoring unknown options in %s: %s" % (path, ', '.join( unknown)))
 		
-		lines = output.split( '\n')
+	changed = {name: value for name, value in options.items() if name in configurationOptions and 
+		(not name in loadedOptions or loadedOptions[ name] != value)}
 		
-		for workLine in lines:
-			if showWiFiFrequency and 'Frequency:' in workLine:
-				value = float( workLine.split( 'Frequency:')[1].split( ' GHz')[0])
-
-				if value != currentWiFiFrequency[ i]:
-					currentWiFiFrequency[ i] = value
-					thisAddress = addrWiFiFreq + '.' + thisName
-					xtension.sendValue( value=value, tag=xtension.tagRegister, address=thisAddress, keyUpdateOnly=True)
-			
-			if checkRSSI and 'Signal level=' in workLine:
-				value = int( workLine.split( 'Signal level=')[1].split( ' dBm')[0])
-				
-				if value != currentRSSI[ i]:
-					thisAddress = addrRSSI + '.' + thisName
-					currentRSSI[ i] = value
-					xtension.sendValue( value=value, tag=xtension.tagRegister, address=thisAddress, keyUpdateOnly=True)
-					
-			if showBitRate and 'Bit Rate=' in workLine:
-				value = float( workLine.split( 'Bit Rate=')[1].split( ' Mb/s')[0])
-				
-				if value != currentBitRate[ i]:
-					thisAddress = addrLinkRate + '.' + thisName
-					currentBitRate[ i] = value
-					xtension.sendValue( value=value, tag=xtension.tagRegister, address=thisAddress, keyUpdateOnly=True)
-					
-			if showTXPower and 'Tx-Power=' in workLine:
-				value = int( workLine.split( 'Tx-Power=')[1].split( ' dBm')[0])
-				
-				if value != currentTXPower[ i]:
-					currentTXPower[ i] = value
-					thisAddress = addrTXPower + '.' + thisName
-					xtension.sendValue( value=value, tag=xtension.tagRegister, address=thisAddress, keyUpdateOnly=True)
-					
-			if showLinkQuality and 'Link Quality=' in workLine:
-				s = workLine.split( 'Link Quality=')[1].split( ' ')[0].split( '/')
-				value = round( ( float( s[0]) / float( s[1]) * 100))
-				
-				if value != currentQuality[ i]:
-					currentQuality[ i] = value
-					thisAddress = addrLinkQuality + '.' + thisName
-					xtension.sendValue( value=value, tag=xtension.tagRegister, address=thisAddress, keyUpdateOnly=True)
-			
-				
-				
-			
+	if len( changed) == 0:
+		return
+		
+	errors = validateOptions( changed, {name: getattr( config, name) for name in changed if hasattr( config, name)})
+	if len( errors) > 0:
+		xtension.writeLog( "ERROR: the changes to %s are not valid, carrying on with the configuration as it was (%s)" % (path, '; '.join( errors)))
+		return
+		
+	loadedOptions.update( changed)
+	applied = []
+	
+	for name in sorted( changed):
+		if name in restartOptions:
+			xtension.writeLog( "%s has changed, restart pimonitor for it to take effect" % name)
+		elif not hasattr( config, name) or getattr( config, name) != changed[ name]:
+			setattr( config, name, changed[ name])
+			applied.append( name)
 			
-
-
+	if len( applied) == 0:
+		return
+		
+	activeCollectors, started, rescheduled = collectors.reloadCollectors( collectorContext, activeCollectors, applied, 
+		stopCollector, logHandler=xtension.writeLog)
+		
+	for collector in started:
+		startCollector( collector)
+		
+	for collector in rescheduled:
+		scheduleCollector( collector, runNow=False)
+		
+	xtension.refreshInfo()
+	xtension.writeLog( "configuration reloaded, changed %s" % ', '.join( applied))
+	
+	
 #
-#	P R O C E S S   C P U   T E M P
+#	W A T C H E R   T I M E O U T
 #
-#	called at the configured interval by the main watcher thread
-#	opens the CPU temperature "file" and sends any changes to XTension
+#	seconds until the next collector is due or the batch has lingered long enough to be sent
+#	-1 if there is nothing to wait for but the epoll
 #
-
-def processCPUTemp():
-	global currentCPUTemp
-
-	CPUTempFile = open( '/sys/class/thermal/thermal_zone0/temp')
-	tempInC = round( float( CPUTempFile.read().strip()) / 100) / 10
-	CPUTempFile.close()
-	tempInF = CtoF( tempInC)
+def watcherTimeout():
+	timeout = scheduler.timeUntilNext()
 	
-		
-	if showTempsInF:
-		displayTemp = tempInF
-		augTemp = tempInC
-		primarySuffix = '°F'
-		secondarySuffix = '°C'
-	else:
-		displayTemp = tempInC
-		augTemp = tempInF
-		primarySuffix = '°C'
-		secondarySuffix = '°F'
-
-
-	#print( "CPU: %s" % displayTemp)
+	batchAge = xtension.batchAge()
+	if batchAge != None:
+		lingerLeft = max( 0, sendLingerSeconds - batchAge)
+		if timeout == -1 or lingerLeft < timeout:
+			timeout = lingerLeft
+			
+	return timeout
 	
-	if displayTemp != currentCPUTemp:
-		currentCPUTemp = displayTemp
-		if alsoShowInOtherScale:
-			xtension.sendValue( value=displayTemp, tag=xtension.tagTemperature, address=addrCPUTEMP,
-				xtKeyDefaultLabel='%s%s (%s%s)' % (displayTemp, primarySuffix, augTemp, secondarySuffix))
-		else:
-			xtension.sendValue( value=displayTemp, tag=xtension.tagTemperature, address=addrCPUTEMP, xtKeyDefaultLabel='')
-
-
-#
-#	C   T O   F
-#	
-#	just conversion routine
-#
-def CtoF( inTemp):
-	inTemp = 9.0 / 5.0 * inTemp + 32
-	return round( (inTemp * 10)) / 10
 	
-
-
 #
-#	P R O C E S S   C P U   F R E Q   F I L E
+#	D I S P A T C H   E P O L L   E V E N T S
 #
-#	called at the interval in the configuration or not at all if this is turned off
-#	reads the current CPU frequency and sends any changes to XTension
-#	this can change very quickly and so is turned off by default as the scanning must be
-#	multiple times a second to catch very short changes and some may be missed regardless
-#	is useful for debugging purposes or to know how your pi is managing itself but probably not
-#	something you'd want to have streaming constantly all the time.
+#	waits up to timeout seconds on the epoll and calls the handler for each file that fired
 #
+def dispatchEpollEvents( timeout):
+	for fd, event in epoll.poll( timeout):
+		handler = epollHandlers.get( fd)
+		if handler == None:
+			continue
 
-def processCPUFreqFile():
-	global currentCPUFreq
-	global CPUFreqFile
-	
-	if CPUFreqFile == None:
-		CPUFreqFile = open( "/sys/devices/system/cpu/cpufreq/policy0/cpuinfo_cur_freq")
-
-	while True:
-		sleep( CPUFrequencyScanSeconds)
+		name, callback = handler
 		try:
-			CPUFreqFile.seek( 0)
-			rawInfo = CPUFreqFile.read().strip()
-			if rawInfo != '':
-				newFreq = int( rawInfo) / 1000
-			else:
-				continue
-	
-			if newFreq != currentCPUFreq:
-				currentCPUFreq = newFreq	
-				xtension.sendValue( value=newFreq, tag=xtension.tagRegister, address=addrFrequency, xtKeyUpdateOnly=True)
+			callback( fd, event)
 		except Exception as e:
-			# basically ifgnore any errors as the file will be changing sometimes
-			print( "error in CPUFreq read: %s" % e)
-			continue
-
-	CPUFreqFile.close()
+			xtension.writeLog( "ERROR: %s( %s)" % (name, e))
+			
+			
+def flushBatchIfDue():
+	batchAge = xtension.batchAge()
+	if batchAge != None and batchAge >= sendLingerSeconds:
+		xtension.flushBatch()
+	
 	
-
-
-
 #
-#		P R O C E S S   T H R O T T L E D   F I L E 
+#	R U N   B L O C K I N G
 #
-#	if the epoll returns the throttled file as having changed then we read it here
+#	for collectors that have to wait on something that might be slow, like a netlink reply. The
+#	function is called and then the callback with what it returned. The file watcher thread can
+#	just wait for it, but on the asyncio loop that would hold up everything else so the function
+#	is run in the loop's executor instead and the callback is called back on the loop when it is
+#	done, waking the file watcher so whatever it sent goes out right away
 #
-def processThrottledFile():
-	throttledFile.seek( 0)
-	status = int( throttledFile.read().strip(), 16)
-
-	#
-	# HISTORIC THROTTLED
-	#
-	if (status & 0x40000):
-		xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-			{xtKeyCommand:xtCommandOn, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrThrottledHistoric, xtKeyUpdateOnly:True}
-		))
+def runBlocking( function, callback):
+	if watcherLoop == None:
+		callback( function())
+		return
 		
-	elif (status != 0): # it sends a 0 sometimes which does not mean these are not on still for whatever reason
-		xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-			{xtKeyCommand:xtCommandOff, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrThrottledHistoric, xtKeyUpdateOnly:True}
-		))
-
-	
-	#
-	# HISTORIC ARM freqency capping
-	#
-	if (status & 0x20000):
-		xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-			{xtKeyCommand:xtCommandOn, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrCappedHistoric, xtKeyUpdateOnly:True}
-		))
-	elif (status != 0): # it sends a 0 sometimes which does not mean these are not on still for whatever reason
-		xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-			{xtKeyCommand:xtCommandOff, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrCappedHistoric, xtKeyUpdateOnly:True}
-		))
-
-
-	#
-	# HISTORIC UNDERVOLTAGE		
-	#
-	if (status & 0x10000):
-		xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-			{xtKeyCommand:xtCommandOn, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrUndervoltHistoric, xtKeyUpdateOnly:True}
-		))
-	elif (status != 0): # it sends a 0 sometimes which does not mean these are not on still for whatever reason
-		xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-			{xtKeyCommand:xtCommandOff, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrUndervoltHistoric, xtKeyUpdateOnly:True}
-		))
-	
-	
-	#
-	# ACTIVE THROTTLING
-	#
-	if (status & 0x4):
-		xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-			{xtKeyCommand:xtCommandOn, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrThrottled, xtKeyUpdateOnly:True}
-		))
-	else: # it sends a 0 sometimes which does not mean these are not on still for whatever reason
-		xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-			{xtKeyCommand:xtCommandOff, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrThrottled, xtKeyUpdateOnly:True}
-		))
-
-
-	#
-	# FREQUENCY CAPPED
-	#
-	if (status & 0x2):
-		xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-			{xtKeyCommand:xtCommandOn, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrCapped, xtKeyUpdateOnly:True}
-		))
-	else: # it sends a 0 sometimes which does not mean these are not on still for whatever reason
-		xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-			{xtKeyCommand:xtCommandOff, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrCapped, xtKeyUpdateOnly:True}
-		))
+	def finished( future):
+		try:
+			callback( future.result())
+		except Exception as e:
+			xtension.writeLog( "ERROR: %s( %s)" % (getattr( function, '__qualname__', 'runBlocking'), e))
+			
+		watcherWakeup.set()
 		
-	# ACTIVE UNDERVOLTAGE
-	if (status & 0x1):
-		xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-			{xtKeyCommand:xtCommandOn, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrUndervolt, xtKeyUpdateOnly:True}
-		))
-	else: # it sends a 0 sometimes which does not mean these are not on still for whatever reason
-		xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-			{xtKeyCommand:xtCommandOff, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrUndervolt, xtKeyUpdateOnly:True}
-		))
-
-
-
+	watcherLoop.run_in_executor( None, function).add_done_callback( finished)
+	
+	
 #
-#	P R O C E S S   C P U   U S A G E
+#	W A T C H   F I L E   D E S C R I P T O R
 #
-
-def processCPUUsage():
-	global currentUsageData
-	global currentCPUUsage
+#	registers a file with the epoll in the file watcher thread so that the callback is
+#	called with the fd and the epoll event flags whenever it fires. Sysfs and procfs files
+#	signal a change with POLLPRI rather than being readable so that is the default.
+#	the name is only used when logging any error from the callback
+#	only to be called from the file watcher thread
+#
+def watchFileDescriptor( fd, name, callback, events=select.EPOLLPRI | select.EPOLLERR):
+	epollHandlers[ fd] = (name, callback)
+	epoll.register( fd, events)
 	
-	with open( '/proc/stat') as f:
-		rawValues = f.read().strip().split( '\n')[0]
 	
-	x = rawValues.split()
-	data = {'user':int( x[1]), 'nice':int( x[2]), 'system':int( x[3]), 
-		'idle':int( x[4]), 'iowait':int( x[5]), 'irq':int( x[6]),
-		'softirq':int( x[7]), 'steal':int( x[8]), 'guest':int( x[9]), 
-		'quest_nice':int( x[10])}
-		
-	data[ 'idle_total'] = data[ 'idle'] + data[ 'iowait']
-	data[ 'non_idle'] = data[ 'user'] + data[ 'nice'] + data[ 'system'] + data[ 'irq'] + data[ 'softirq'] + data[ 'steal']
-	data[ 'total'] = data[ 'idle_total'] + data[ 'non_idle']
-
-	# if we are running the first time then just save off the data and look again at whatever interval
-	if currentUsageData == None:
-		currentUsageData = data
-		return
-
-	totald = data[ 'total'] - currentUsageData[ 'total']
-	idled = data[ 'idle_total'] - currentUsageData[ 'idle_total']
+def unwatchFileDescriptor( fd):
+	if epollHandlers.pop( fd, None) != None:
+		try:
+			epoll.unregister( fd)
+		except Exception:
+			pass
 	
-	newIdle = 100 - round( ((totald-idled) / totald) * 100)
 	
-	if newIdle != currentCPUUsage:
-		currentCPUUsage = newIdle
-		xtension.sendValue( value=newIdle, tag=xtension.tagRegister, address=addrCPUUsage)
-
-
-
-
-
 #
-#	H U M A N   R E A D A B L E   S I Z E
+#	S C H E D U L E R   T A S K   E R R O R
 #
-#	used to format the disk space available into a human readable label that is used as the value
-#	display in XTension. The actual k available is sent as the real unit value but this output
-#	like 16GB or 10MB is sent as the display label to be easier to read.
+#	called by the scheduler if one of the collectors raises an exception
 #
-def humanReadableSize( size, decimalPlaces = 2):
-	for unit in ['B', 'KB', 'MB', 'GB', 'TB', 'PB']:
-		if size < 1024.0 or unit == 'PB':
-			break
-		size /= 1024.0
+def schedulerTaskError( task, e):
+	xtension.writeLog( "ERROR: %s( %s)" % (task.name, e))
+	
 	
-	formatString = '{:.%sf} {}' % decimalPlaces	
-	return formatString.format( size, unit)
-
-
 #
-#	P R O C E S S   D I S K   S P A C E
+#	S C H E D U L E R   T A S K   L A T E
 #
-#	called at the interval set in configuration if there is anything in the 
-#	list of volumes to check.
+#	called by the scheduler when a collector was so late that it missed at least one
+#	whole interval. This means the pi is too busy to keep up with the configured intervals
 #
-def processDiskSpace():
-	global currentDiskSpace
-	
-	for i in range( len( volumesToScan)):
-		try:
-			thisPath = volumesToScan[ i]
-			thisAddress = addrDiskSpace + '.' + thisPath.replace( '/', '.')
-			diskInfo = os.statvfs( thisPath)
-			thisSpace = diskInfo.f_bavail * diskInfo.f_frsize
-			
-			if thisSpace != currentDiskSpace[ i]:
-				currentDiskSpace[ i] = thisSpace
-				xtension.sendValue( value=thisSpace, tag=xtension.tagRegister, address=thisAddress,
-					xtKeyDefaultLabel=humanReadableSize( thisSpace), xtKeyUpdateOnly=True)
-
-		except Exception as e:
-			xtension.writeLog( 'Unable to get disk space for volume at "%s" %s' % (thisPath, e))
-			
-		
-		
+def schedulerTaskLate( task):
+	xtension.writeLog( "%s ran %.2f seconds late, %s intervals missed so far (average lateness %.3f max %.3f)" % 
+		(task.name, task.lastLateness, task.missedRuns, task.averageLateness(), task.maxLateness))
 
 
 #
@@ -618,6 +612,8 @@ def getPiType():
 #	1.0.1 added the kInfoNoLog flag to the creation of units that change frequently but for which it might not
 #	be useful to have it log constantly like CPU Usage and CPU Temp. You can turn this back on in the Advanced
 #	tab of the Edit Unit dialog in XTension.
+#
+#	1.1 each of the collectors describes its own units
 
 def getInfoForXTension():
 
@@ -628,80 +624,13 @@ def getInfoForXTension():
 	
 	work[ 'devicetype'] = "Pi Monitor"	# this name is used when creating the status unit so it shows what the device is clearly in XTension
 	
+	units = []
 	
-	# we always watch the throttling and power file for info so those units are always present
-	units = [
-		{kInfoName:'Active Throttling', kInfoTag:xtension.tagDiscreteRegister, kInfoAddress:addrThrottled, 
-			kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoOnLabel:'THROTTLED', kInfoOffLabel:'OK'},
-		{kInfoName:'Active Undervoltage', kInfoTag:xtension.tagDiscreteRegister, kInfoAddress:addrUndervolt, 
-			kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoOnLabel:'UNDERVOLT', kInfoOffLabel:'OK'},
-		{kInfoName:'Active CPU Speed Capping', kInfoTag:xtension.tagDiscreteRegister, kInfoAddress:addrCapped, 
-			kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoOnLabel:'CAPPED', kInfoOffLabel:'OK'},
-		{kInfoName:'Throttling Has Occurred', kInfoTag:xtension.tagDiscreteRegister, kInfoAddress:addrThrottledHistoric,
-			kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoOnLabel:'THROTTLED', kInfoOffLabel:'OK'},
-		{kInfoName:'Undervoltage Has Occurred', kInfoTag:xtension.tagDiscreteRegister, kInfoAddress:addrUndervoltHistoric, 
-			kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoOnLabel:'UNDERVOLT', kInfoOffLabel:'OK'},
-		{kInfoName:'CPU Speed Capping Has Occurred', kInfoTag:xtension.tagDiscreteRegister, kInfoAddress:addrCappedHistoric, 
-			kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoOnLabel:'CAPPED', kInfoOffLabel:'OK'}
-	]
-	
-	
-	if checkCPUTemp:
-		units += [{kInfoName:'CPU Temperature', kInfoTag:xtension.tagTemperature, kInfoAddress:addrCPUTEMP, 
-			kInfoDimmable:True, kInfoSuffix:'°F', kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoNoLog:True}]
-			
-	if checkRSSI:
-		for thisInterface in RSSIInterfaceName:
-			thisName = 'WiFi RSSI ' + thisInterface
-			thisAddress = addrRSSI + '.' + thisInterface
-			units += [{kInfoName:thisName, kInfoTag:xtension.tagRegister, kInfoAddress:thisAddress, 
-				kInfoDimmable:True, kInfoSuffix:' dBm', kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoNoLog:True}]
-				
-	if showBitRate:
-		for thisInterface in RSSIInterfaceName:
-			thisName = 'WiFi Bit Rate ' + thisInterface
-			thisAddress = addrLinkRate + '.' + thisInterface
-			
-			units += [{kInfoName:thisName, kInfoTag:xtension.tagRegister, kInfoAddress:thisAddress, 
-				kInfoDimmable:True, kInfoSuffix:' Mb/s', kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoNoLog:True}]
-				
-	if showTXPower:
-		for thisInterface in RSSIInterfaceName:
-			thisName = 'WiFi TX Power ' + thisInterface
-			thisAddress = addrTXPower + '.' + thisInterface
-
-			units += [{kInfoName:thisName, kInfoTag:xtension.tagRegister, kInfoAddress:thisAddress, 
-				kInfoDimmable:True, kInfoSuffix:' dBm', kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoNoLog:True}]
-				
-	if showLinkQuality:
-		for thisInterface in RSSIInterfaceName:
-			thisName = 'WiFi Link Quality ' + thisInterface
-			thisAddress = addrLinkQuality + '.' + thisInterface
-
-			units += [{kInfoName:thisName, kInfoTag:xtension.tagRegister, kInfoAddress:thisAddress, 
-				kInfoDimmable:True, kInfoSuffix:'%', kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoNoLog:True}]
-	
-	if showWiFiFrequency:
-		for thisInterface in RSSIInterfaceName:
-			thisName = 'WiFi Frequency ' + thisInterface
-			thisAddress = addrWiFiFreq + '.' + thisInterface
-
-			units += [{kInfoName:thisName, kInfoTag:xtension.tagRegister, kInfoAddress:thisAddress, 
-				kInfoDimmable:True, kInfoSuffix:' GHz', kInfoIgnoreClicks:True, kInfoReceiveOnly:True}]
-
-	if checkCPUUsage:
-		units += [{kInfoName:'CPU Idle', kInfoTag:xtension.tagRegister, kInfoAddress:addrCPUUsage, 
-			kInfoDimmable:True, kInfoSuffix:'%', kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoNoLog:True}]
-			
-	if checkCPUFrequency:
-		units += [{kInfoName:'CPU Frequency', kInfoTag:xtension.tagRegister, kInfoAddress:addrFrequency, 
-			kInfoDimmable:True,	kInfoIgnoreClicks:True, kInfoReceiveOnly:True, kInfoSuffix:' MHz', kInfoNoLog:True}]
-			
-	if checkDiskSpace:
-		for thisPath in volumesToScan:
-			thisAddress = addrDiskSpace + '.' + thisPath.replace( '/', '.')
-			units += [{kInfoName:'Disk Space: %s' % thisPath, kInfoTag:xtension.tagRegister, 
-				kInfoAddress:thisAddress, kInfoDimmable:True, kInfoReceiveOnly:True, kInfoIgnoreClicks:True, kInfoNoLog:True}]
+	for collector in activeCollectors:
+		try:
+			units += collector.units()
+		except Exception as e:
+			xtension.writeLog( "ERROR: units for %s( %s)" % (collector.name, e))
 				
 
 	work[ 'units'] = units
@@ -719,6 +648,7 @@ def getInfoForXTension():
 
 
 
+
 #
 #		M A I N
 #
@@ -729,53 +659,62 @@ if currentHostname == None:
 
 piType = getPiType()
 
-xtension = XTension( deviceName=currentHostname, deviceId=overrideDeviceId)
+if useAsyncio:
+	xtension = AsyncXTension( deviceName=currentHostname, deviceId=overrideDeviceId, maxInstances=maxXTensionInstances)
+else:
+	xtension = XTension( deviceName=currentHostname, deviceId=overrideDeviceId, maxInstances=maxXTensionInstances)
+	
 xtension.callbackGetInfo = getInfoForXTension
 
-xtension.startup()
-
-# give it a moment to actually find XTension so that initial values can be sent
-sleep( 2)
-
-
-# before beginning the watching of the file make sure that the historical throttled units
-# are off. If they turn out to be on as soon as we begin reading the file then they will
-# be turned on again. But since we cannot reliably read a 0 for nothing we cannot reliably 
-# send an off for these. They are normally only reset by a reboot so when this program starts we send them
-# an off.
-
-xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-	{xtKeyCommand:xtCommandOff, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrThrottledHistoric, xtKeyUpdateOnly:True}
-))
-xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-	{xtKeyCommand:xtCommandOff, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrCappedHistoric, xtKeyUpdateOnly:True}
-))
-xtension.sendCommandToAll( XTPCommand( command=xtension.xtPCommandData, jsonData=
-	{xtKeyCommand:xtCommandOff, xtKeyTag:xtension.tagDiscreteRegister, xtKeyAddress:addrUndervoltHistoric, xtKeyUpdateOnly:True}
-))
+# load and probe the collectors before XTension asks for the info so it has all the units. Anything
+# that isn't available is logged once we can reach XTension
+collectorMessages = []
+collectorContext = collectors.CollectorContext( xtension=xtension, config=config, pseudoFiles=pseudoFiles, 
+	watchFileDescriptor=watchFileDescriptor, unwatchFileDescriptor=unwatchFileDescriptor, runBlocking=runBlocking)
+activeCollectors = collectors.loadCollectors( collectorContext, logHandler=collectorMessages.append)
 
+# keep the values sent while there is no XTension in the spool until one is found
+if useOfflineSpool:
+	try:
+		xtension.useSpool( Spool( spoolPath, spoolSizeKB * 1024), replayRate=spoolReplayRate)
+	except Exception as e:
+		collectorMessages.append( "unable to open the offline spool %s, values sent while XTension can't be reached will be lost (%s)" % (spoolPath, e))
 
 
-fileWatcherThread = Thread( target=threadedFileWatcher, args=())
-fileWatcherThread.start()
 
+def logStartup():
+	for thisMessage in collectorMessages:
+		print( thisMessage)
+		xtension.writeLog( thisMessage)
+		
+	xtension.writeLog( "Pi Monitor v%s Starting Up" % pluginVersion)
+	
+	
 #
-# if the CPU Frequency check is enabled this will run in a separate thread from the main watcher thread as it needs to
-# scan must more rapidly than the resolution of the main watcher system.
-if checkCPUFrequency:
-	CPUSpeedThread = Thread( target=processCPUFreqFile, args=())
-	CPUSpeedThread.start()
-
-xtension.writeLog( "Pi Monitor v{pluginVersion} Starting Up")
-
-
+#	A S Y N C   M A I N
+#
+#	with useAsyncio on the XTension socket, its timers and the file watcher all run on this one loop
+#
+async def asyncMain():
+	await xtension.startup()
 	
+	# give it a moment to actually find XTension so that initial values can be sent
+	await asyncio.sleep( 2)
+	logStartup()
 	
-
-
-
-
-
-
-
+	await asyncFileWatcher()
+	
+	
+if useAsyncio:
+	asyncio.run( asyncMain())
+	
+else:
+	xtension.startup()
+	
+	# give it a moment to actually find XTension so that initial values can be sent
+	sleep( 2)
+	logStartup()
+	
+	fileWatcherThread = Thread( target=threadedFileWatcher, args=())
+	fileWatcherThread.start()
 
@@ -0,0 +1,199 @@
+#
+#		Deadline Scheduler for the pimonitor collectors
+#			https://MacHomeAutomation.com/
+#
+#		keeps a min-heap of the next due time for every collector so that the file watcher
+#		thread can sleep in its epoll for exactly as long as it takes until the next one is
+#		due instead of waking up every second and counting. All times are from the monotonic
+#		clock so changes to the system time (like when NTP finally syncs after a boot) do
+#		not cause collectors to be skipped or to run in a burst.
+#
+#		intervals can be any float number of seconds, not just whole seconds.
+#
+
+import heapq
+import itertools
+from time import monotonic
+
+
+
+#
+#	class		S C H E D U L E D   T A S K
+#
+#	just a data holder for a single repeating task in the scheduler. It also holds
+#	the statistics about how late the task has been running so that you can tell if
+#	the pi is too busy to keep up with the configured intervals.
+#
+class ScheduledTask( object):
+	def __init__( self, *, name, interval, callback):
+		self.name = name
+		self.interval = float( interval)
+		self.callback = callback
+		self.nextDue = 0.0
+		self.cancelled = False
+
+		# lateness statistics, all in seconds
+		self.runCount = 0
+		self.lastLateness = 0.0
+		self.maxLateness = 0.0
+		self.totalLateness = 0.0
+		self.missedRuns = 0 	# number of whole intervals that were skipped because we were too late
+
+	def averageLateness( self):
+		if self.runCount == 0:
+			return 0.0
+		return self.totalLateness / self.runCount
+
+	def debugLog( self):
+		print( "----- begin ScheduledTask Debug Logging")
+		print( "	name:		%s" % self.name)
+		print( "	interval:	%s" % self.interval)
+		print( "	runs:		%s" % self.runCount)
+		print( "	lateness:	last %.4f avg %.4f max %.4f" % (self.lastLateness, self.averageLateness(), self.maxLateness))
+		print( "	missed:		%s" % self.missedRuns)
+		print()
+
+
+
+
+#
+#	class		S C H E D U L E R
+#
+#	usage:
+#		scheduler = Scheduler()
+#		scheduler.addTask( name='processCPUTemp', interval=10, callback=processCPUTemp)
+#		while True:
+#			epoll.poll( scheduler.timeUntilNext())
+#			scheduler.runDue()
+#
+class Scheduler( object):
+
+	#
+	#	I N I T
+	#
+	#	errorHandler is called with the task and the exception if the task callback raises
+	#	lateHandler is called with the task if it ran more than a full interval late
+	#	both are optional
+	#
+	def __init__( self, *, errorHandler=None, lateHandler=None):
+		self.heap = []
+		self.tasks = {}
+		self.sequence = itertools.count() # tie breaker so the heap never has to compare two tasks
+		self.errorHandler = errorHandler
+		self.lateHandler = lateHandler
+
+
+	#
+	#	A D D   T A S K
+	#
+	#	if runNow is True the task will be due immediately, otherwise it will first run
+	#	after one interval has passed. Adding a task with a name that already exists
+	#	replaces the old task.
+	#
+	def addTask( self, *, name, interval, callback, runNow=True):
+		if interval <= 0:
+			raise ValueError( 'interval for task %s must be greater than 0' % name)
+
+		self.removeTask( name)
+
+		task = ScheduledTask( name=name, interval=interval, callback=callback)
+
+		if runNow:
+			task.nextDue = monotonic()
+		else:
+			task.nextDue = monotonic() + task.interval
+
+		self.tasks[ name] = task
+		heapq.heappush( self.heap, (task.nextDue, next( self.sequence), task))
+		return task
+
+
+	#
+	#	R E M O V E   T A S K
+	#
+	#	the heap entry is just marked as cancelled and thrown away when it comes to the top
+	#
+	def removeTask( self, name):
+		task = self.tasks.pop( name, None)
+		if task != None:
+			task.cancelled = True
+
+
+	def getTask( self, name):
+		return self.tasks.get( name)
+
+
+	#
+	#	T I M E   U N T I L   N E X T
+	#
+	#	returns the number of seconds until the next task is due suitable for passing
+	#	directly to epoll.poll as the timeout. Returns 0 if something is already due
+	#	and -1 (wait forever) if there are no tasks at all.
+	#
+	def timeUntilNext( self):
+		while self.heap and self.heap[0][2].cancelled:
+			heapq.heappop( self.heap)
+
+		if not self.heap:
+			return -1
+
+		return max( 0.0, self.heap[0][0] - monotonic())
+
+
+	#
+	#	R U N   D U E
+	#
+	#	runs every task whose deadline has passed. The next deadline is calculated from
+	#	the previous deadline and not from the time the task actually ran so that the
+	#	intervals do not drift. If we are so late that one or more whole intervals were missed
+	#	they are skipped rather than run in a burst to catch up.
+	#	only tasks that were due when we were called are run, so that a collector that takes
+	#	longer than its own interval cannot keep us in here forever.
+	#
+	def runDue( self):
+		dueBy = monotonic()
+
+		while self.heap and self.heap[0][0] <= dueBy:
+			due, _sequence, task = heapq.heappop( self.heap)
+
+			if task.cancelled:
+				continue
+
+			now = monotonic()
+			lateness = now - due
+			task.runCount += 1
+			task.lastLateness = lateness
+			task.totalLateness += lateness
+			if lateness > task.maxLateness:
+				task.maxLateness = lateness
+
+			try:
+				task.callback()
+			except Exception as e:
+				if self.errorHandler != None:
+					self.errorHandler( task, e)
+
+			nextDue = due + task.interval
+
+			if nextDue <= now:
+				missed = int( (now - due) // task.interval)
+				task.missedRuns += missed
+				nextDue = due + (missed + 1) * task.interval
+
+				if self.lateHandler != None:
+					self.lateHandler( task)
+
+			# the callback may have removed or replaced this task
+			if task.cancelled:
+				continue
+
+			task.nextDue = nextDue
+			heapq.heappush( self.heap, (nextDue, next( self.sequence), task))
+
+
+	#
+	#	D E B U G   L O G
+	#
+	def debugLog( self):
+		for name in sorted( self.tasks):
+			self.tasks[ name].debugLog()
@@ -0,0 +1,166 @@
+#
+#		Offline spool for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		while there is no XTension instance to send to the data commands are kept here with the time
+#		they were sent so they can be replayed with that timestamp when XTension comes back, and there
+#		are no gaps in the unit history. The spool is a fixed size ring in a memory mapped file so it
+#		never uses more than that much memory, survives pimonitor being restarted and when it's full
+#		the oldest commands are dropped to make room.
+#
+#		the file is a header followed by the ring. Every record in the ring is the length of the
+#		command, the time it was sent, its packet flags and the command itself starting from the ';'
+#		after the target id, the same as the tail from XTPCommand.getRawParts. The start and end in the header are
+#		byte counts that only ever go up, the position in the ring is them modulo the ring size.
+#
+
+import mmap
+import os
+import struct
+from threading import Lock
+
+
+
+spoolMagic			= b'PIMSPOOL'
+spoolVersion		= 2
+
+# magic, version, ring size, start, end, record count
+spoolHeader			= struct.Struct( '<8sIIQQI')
+spoolHeaderSize		= 64
+
+# length of the command, the time.time() it was sent and its packet flags
+recordHeader		= struct.Struct( '<HdB')
+
+
+
+#
+#	class		S P O O L
+#
+#	usage:
+#		spool = Spool( '/var/tmp/pimonitor.spool', 1024 * 1024)
+#		spool.append( time(), tail, flags)
+#		for sentAt, tail, flags in spool.read( 100):
+#			...
+#
+#	thread safe, append is called from whatever thread is sending and read from the sender thread
+#
+class Spool( object):
+	def __init__( self, path, size):
+		self.path = path
+		self.lock = Lock()
+		self.droppedRecords = 0
+
+		fd = os.open( path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+		try:
+			if os.fstat( fd).st_size != spoolHeaderSize + size:
+				os.ftruncate( fd, spoolHeaderSize + size)
+			self.map = mmap.mmap( fd, spoolHeaderSize + size)
+		finally:
+			os.close( fd)
+
+		self.size = size
+		magic, version, ringSize, self.start, self.end, self.count = spoolHeader.unpack_from( self.map, 0)
+
+		# anything left from a different version or size is thrown away
+		if magic != spoolMagic or version != spoolVersion or ringSize != size or self.end - self.start > size:
+			self.start = 0
+			self.end = 0
+			self.count = 0
+			self.writeHeader()
+
+
+	def __len__( self):
+		return self.count
+
+
+	def writeHeader( self):
+		spoolHeader.pack_into( self.map, 0, spoolMagic, spoolVersion, self.size, self.start, self.end, self.count)
+
+
+	#
+	#	R I N G   W R I T E   and   R I N G   R E A D
+	#
+	#	copy bytes into or out of the ring at an offset, wrapping around the end if necessary
+	#
+	def ringWrite( self, offset, data):
+		position = offset % self.size
+		first = min( len( data), self.size - position)
+
+		self.map[ spoolHeaderSize + position:spoolHeaderSize + position + first] = data[ :first]
+		if first < len( data):
+			self.map[ spoolHeaderSize:spoolHeaderSize + len( data) - first] = data[ first:]
+
+
+	def ringRead( self, offset, length):
+		position = offset % self.size
+		first = min( length, self.size - position)
+
+		data = self.map[ spoolHeaderSize + position:spoolHeaderSize + position + first]
+		if first < length:
+			data += self.map[ spoolHeaderSize:spoolHeaderSize + length - first]
+
+		return data
+
+
+	#
+	#	A P P E N D
+	#
+	#	adds a command to the end, dropping the oldest ones if there isn't room. The flags are
+	#	kept so that a command sent with the ack flag is still sent with it when it's replayed
+	#
+	def append( self, sentAt, tail, flags=0):
+		recordSize = recordHeader.size + len( tail)
+		if recordSize > self.size or len( tail) > 0xFFFF:
+			self.droppedRecords += 1
+			return
+
+		with self.lock:
+			while self.end - self.start + recordSize > self.size:
+				length, oldSentAt, oldFlags = recordHeader.unpack( self.ringRead( self.start, recordHeader.size))
+				self.start += recordHeader.size + length
+				self.count -= 1
+				self.droppedRecords += 1
+
+			self.ringWrite( self.end, recordHeader.pack( len( tail), sentAt, flags) + tail)
+			self.end += recordSize
+			self.count += 1
+			self.writeHeader()
+
+
+	#
+	#	R E A D
+	#
+	#	removes up to count of the oldest commands and returns them as a list of (sentAt, tail, flags)
+	#
+	def read( self, count):
+		records = []
+
+		with self.lock:
+			while self.count > 0 and len( records) < count:
+				length, sentAt, flags = recordHeader.unpack( self.ringRead( self.start, recordHeader.size))
+				records.append( (sentAt, self.ringRead( self.start + recordHeader.size, length), flags))
+				self.start += recordHeader.size + length
+				self.count -= 1
+
+			if self.count == 0:
+				# start over at the beginning so the offsets stay small
+				self.start = 0
+				self.end = 0
+
+			self.writeHeader()
+
+		return records
+
+
+	def close( self):
+		with self.lock:
+			self.map.flush()
+			self.map.close()
+
+
+	def debugLog( self):
+		print( "----- begin Spool Debug Logging")
+		print( "	path:		%s" % self.path)
+		print( "	records:	%s using %s of %s bytes" % (self.count, self.end - self.start, self.size))
+		print( "	dropped:	%s" % self.droppedRecords)
+		print()
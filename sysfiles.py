@@ -0,0 +1,151 @@
+#
+#		Cached handles for the sysfs and procfs pseudo files read by pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		every collector reads one or more of the small files in /sys or /proc over and over
+#		again. Rather than open and close them each time the cache opens each one once and
+#		then re-reads it from the beginning with os.preadv into a bytearray that is reused
+#		for every read so there are no open/close syscalls and no new strings per sample.
+#
+#		some of these files go away and come back underneath us, like when a usb wifi
+#		adaptor is unplugged or a driver is reloaded. If the read fails with ENODEV or ESTALE
+#		the file is transparently opened again and the read retried once.
+#
+
+import errno
+import os
+
+
+
+# errors that mean the open handle is no good anymore but the path may well be fine
+reopenErrors = (errno.ENODEV, errno.ESTALE, errno.EBADF)
+
+
+
+#
+#	class		P S E U D O   F I L E
+#
+#	a single open sysfs or procfs file. After calling read() the contents are in
+#	self.buffer[ :length] where length is what read() returned.
+#
+#	if something else needs to know the file descriptor, like an epoll watching
+#	for POLLPRI, set the reopenHandler which will be called with the old and the new
+#	file descriptor whenever the file had to be reopened.
+#
+class PseudoFile( object):
+	def __init__( self, path, *, bufferSize=4096, flags=os.O_RDONLY):
+		self.path = path
+		self.flags = flags
+		self.buffer = bytearray( bufferSize)
+		self.bufferList = [self.buffer] 	# preadv wants a sequence of buffers, don't make a new one every read
+		self.reopenHandler = None
+		self.fd = -1
+		self.open()
+
+	def open( self):
+		self.fd = os.open( self.path, self.flags | os.O_CLOEXEC)
+
+	def close( self):
+		if self.fd != -1:
+			try:
+				os.close( self.fd)
+			except OSError:
+				pass
+			self.fd = -1
+
+	def fileno( self):
+		return self.fd
+
+	#
+	#	R E O P E N
+	#
+	def reopen( self):
+		oldFd = self.fd
+		self.close()
+		self.open()
+
+		if self.reopenHandler != None:
+			self.reopenHandler( oldFd, self.fd)
+
+
+	#
+	#	R E A D
+	#
+	#	reads the whole file from the beginning into self.buffer and returns the
+	#	number of bytes read. If the file is larger than the buffer the buffer is
+	#	grown and the read repeated so it will be big enough from then on.
+	#
+	def read( self):
+		while True:
+			try:
+				length = os.preadv( self.fd, self.bufferList, 0)
+			except OSError as e:
+				if e.errno not in reopenErrors:
+					raise
+
+				self.reopen()
+				length = os.preadv( self.fd, self.bufferList, 0)
+
+			if length < len( self.buffer):
+				return length
+
+			self.buffer.extend( bytes( len( self.buffer)))
+
+
+	#
+	#	R E A D   I N T
+	#
+	#	for the many files that contain just a single number
+	#	returns None if the file was empty which does happen sometimes while the
+	#	value is changing
+	#
+	def readInt( self, base=10):
+		length = self.read()
+		if length == 0:
+			return None
+
+		return int( self.buffer[ :length], base)
+
+
+
+
+#
+#	class		P S E U D O   F I L E   C A C H E
+#
+#	usage:
+#		pseudoFiles = PseudoFileCache()
+#		tempInMilliC = pseudoFiles.readInt( '/sys/class/thermal/thermal_zone0/temp')
+#
+#	or to parse something larger:
+#		statFile = pseudoFiles.get( '/proc/stat')
+#		length = statFile.read()
+#		...parse statFile.buffer[ :length]
+#
+class PseudoFileCache( object):
+	def __init__( self):
+		self.files = {}
+
+	def get( self, path, **kwargs):
+		workFile = self.files.get( path)
+
+		if workFile == None:
+			workFile = PseudoFile( path, **kwargs)
+			self.files[ path] = workFile
+
+		return workFile
+
+	def readInt( self, path, base=10):
+		return self.get( path).readInt( base)
+
+	# everything that got the file from the cache shares it and would be left with a closed one
+	# so the collectors don't close theirs when they're stopped, they stay open for whoever is next
+	def close( self, path):
+		workFile = self.files.pop( path, None)
+		if workFile != None:
+			workFile.close()
+
+	def closeAll( self):
+		for workFile in self.files.values():
+			workFile.close()
+
+		self.files = {}
@@ -0,0 +1,191 @@
+#
+#		Timer Wheel for pimonitor
+#			https://MacHomeAutomation.com/
+#
+#		a hashed timing wheel for the many short timers that come and go, like the retransmit
+#		of a packet that is cancelled as soon as its ack comes back. Adding and cancelling are
+#		constant time no matter how many timers there are, unlike the scheduler heap which is
+#		better for the few long lived repeating collectors. Timers are only as accurate as the
+#		tick so a timer fires up to one tick after its deadline, never before.
+#
+#		the wheel does not call anything itself, whoever owns it calls expired() when
+#		timeUntilNext() says to and deals with what comes back. It is not thread safe, the
+#		owner must hold its own lock around it if more than one thread uses it.
+#
+
+from array import array
+import math
+from time import monotonic
+
+
+
+#
+#	class		T I M E R
+#
+#	a single timer in the wheel, returned by add so that it can be cancelled
+#
+class Timer( object):
+	def __init__( self, deadline, tick, item):
+		self.deadline = deadline
+		self.tick = tick
+		self.item = item
+		self.cancelled = False
+
+
+
+
+#
+#	class		T I M E R   W H E E L
+#
+#	usage:
+#		wheel = TimerWheel( tickSeconds=0.05)
+#		timer = wheel.add( 0.5, packet)
+#		wheel.cancel( timer)
+#		for packet in wheel.expired():
+#			...
+#
+class TimerWheel( object):
+	def __init__( self, *, tickSeconds=0.05, slotCount=256):
+		self.tickSeconds = tickSeconds
+		self.slots = [[] for x in range( slotCount)]
+		self.slotTimers = array( 'l', bytes( array( 'l').itemsize * slotCount))	# live timers in each slot
+		self.currentTick = self.tickAt( monotonic())
+		self.liveTimers = 0
+
+		# the tick the earliest timer is in, kept up to date as they are added and only looked
+		# for again when that one fires or is cancelled. None when it has to be looked for
+		self.nextTick = None
+
+
+	def __len__( self):
+		return self.liveTimers
+
+
+	def tickAt( self, when):
+		return int( when / self.tickSeconds)
+
+
+	#
+	#	A D D
+	#
+	#	adds a timer that expires delay seconds from now and returns it. The item is what
+	#	expired() returns for it
+	#
+	def add( self, delay, item):
+		deadline = monotonic() + delay
+		tick = max( math.ceil( deadline / self.tickSeconds), self.currentTick)
+
+		timer = Timer( deadline, tick, item)
+		self.slots[ tick % len( self.slots)].append( timer)
+		self.slotTimers[ tick % len( self.slots)] += 1
+
+		if self.liveTimers == 0:
+			self.nextTick = tick
+		elif self.nextTick != None and tick < self.nextTick:
+			self.nextTick = tick
+
+		self.liveTimers += 1
+		return timer
+
+
+	#
+	#	C A N C E L
+	#
+	#	the timer is only marked and left in its slot until the wheel comes around to it
+	#
+	def cancel( self, timer):
+		if not timer.cancelled:
+			timer.cancelled = True
+			self.liveTimers -= 1
+			self.slotTimers[ timer.tick % len( self.slots)] -= 1
+
+			if timer.tick == self.nextTick:
+				self.nextTick = None
+
+
+	#
+	#	E X P I R E D
+	#
+	#	turns the wheel up to now and returns the items of all the timers that have expired
+	#	in the order of their deadlines. Timers further out than one turn of the wheel stay
+	#	in their slot until the turn they are due in
+	#
+	def expired( self, now=None):
+		if now == None:
+			now = monotonic()
+
+		nowTick = self.tickAt( now)
+		if nowTick < self.currentTick:
+			return []
+
+		fired = []
+		slotCount = len( self.slots)
+
+		for tick in range( self.currentTick, self.currentTick + min( nowTick - self.currentTick + 1, slotCount)):
+			slot = self.slots[ tick % slotCount]
+			waiting = []
+
+			for timer in slot:
+				if timer.cancelled:
+					continue
+
+				if timer.tick <= nowTick:
+					fired.append( timer)
+				else:
+					waiting.append( timer)
+
+			self.slots[ tick % slotCount] = waiting
+			self.slotTimers[ tick % slotCount] = len( waiting)
+
+		self.currentTick = nowTick + 1
+		self.liveTimers -= len( fired)
+
+		if self.nextTick != None and self.nextTick <= nowTick:
+			self.nextTick = None
+
+		fired.sort( key=lambda x: x.deadline)
+		return [x.item for x in fired]
+
+
+	#
+	#	T I M E   U N T I L   N E X T
+	#
+	#	seconds until expired() should next be called, the start of the tick the next timer is
+	#	in, or None if there are no timers at all and so no reason to wake up
+	#
+	def timeUntilNext( self):
+		if self.liveTimers == 0:
+			return None
+
+		if self.nextTick == None:
+			self.nextTick = self.findNextTick()
+
+		return max( 0.0, self.nextTick * self.tickSeconds - monotonic())
+
+
+	#
+	#	F I N D   N E X T   T I C K
+	#
+	#	the tick of the earliest timer, only the slots that have live timers in them are looked
+	#	through. Looks ahead at most one turn of the wheel, if every timer is further out than that
+	#	it's the end of the turn
+	#
+	def findNextTick( self):
+		slotCount = len( self.slots)
+
+		for tick in range( self.currentTick, self.currentTick + slotCount):
+			if self.slotTimers[ tick % slotCount] == 0:
+				continue
+
+			if any( timer.tick == tick and not timer.cancelled for timer in self.slots[ tick % slotCount]):
+				return tick
+
+		return self.currentTick + slotCount
+
+
+	def debugLog( self):
+		print( "----- begin TimerWheel Debug Logging")
+		print( "	tick:		%s seconds" % self.tickSeconds)
+		print( "	slots:		%s" % len( self.slots))
+		print( "	timers:		%s" % self.liveTimers)
+		print()
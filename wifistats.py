@@ -0,0 +1,376 @@
+#
+#		WiFi link statistics for pimonitor without running iwconfig
+#			https://MacHomeAutomation.com/
+#
+#		iwconfig is deprecated and forking it for every interface on every scan costs more than
+#		everything else the monitor does put together on the smaller pis. This talks to the
+#		kernel nl80211 interface directly over a generic netlink socket instead and gets the
+#		frequency, tx power, signal level and bit rate for all the interfaces in one batch.
+#
+#		if nl80211 is not available for some reason then /proc/net/wireless is read instead.
+#		that only has the signal level and link quality so the other values will be None.
+#
+#		link quality is calculated the same way that the kernel calculates it for the old
+#		wireless extensions that iwconfig reads so the values are the same as before.
+#
+
+import socket
+import struct
+
+
+
+# netlink constants from linux/netlink.h and linux/genetlink.h
+NETLINK_GENERIC 		= 16
+NLM_F_REQUEST 			= 0x1
+NLM_F_MULTI				= 0x2
+NLM_F_DUMP 				= 0x300
+NLMSG_ERROR				= 2
+NLMSG_DONE				= 3
+NLA_TYPE_MASK			= 0x3fff 	# strips the nested and byte order flags from attribute types
+
+GENL_ID_CTRL			= 0x10
+CTRL_CMD_GETFAMILY		= 3
+CTRL_ATTR_FAMILY_ID		= 1
+CTRL_ATTR_FAMILY_NAME	= 2
+
+# nl80211 constants from linux/nl80211.h
+NL80211_CMD_GET_INTERFACE			= 5
+NL80211_CMD_GET_STATION				= 17
+NL80211_ATTR_IFINDEX				= 3
+NL80211_ATTR_IFNAME					= 4
+NL80211_ATTR_STA_INFO				= 21
+NL80211_ATTR_WIPHY_FREQ				= 38
+NL80211_ATTR_WIPHY_TX_POWER_LEVEL	= 98
+NL80211_STA_INFO_SIGNAL				= 7
+NL80211_STA_INFO_TX_BITRATE			= 8
+NL80211_RATE_INFO_BITRATE			= 1
+NL80211_RATE_INFO_BITRATE32			= 5
+
+nlMsgHeader 	= struct.Struct( '=IHHII')
+genlMsgHeader	= struct.Struct( '=BBH')
+nlAttrHeader	= struct.Struct( '=HH')
+
+pathProcWireless = '/proc/net/wireless'
+
+
+
+#
+#	L I N K   Q U A L I T Y   F R O M   S I G N A L
+#
+#	this is what cfg80211 does to fill in the wireless extensions link quality that
+#	iwconfig shows as "Link Quality=xx/70" returned here as a percent
+#
+def linkQualityFromSignal( signal):
+	signal = min( max( signal, -110), -40)
+	return round( (signal + 110) / 70 * 100)
+
+
+
+#
+#	class		W I F I   S T A T S
+#
+#	just a data holder for the values read for one interface. Any value that could not
+#	be read is None.
+#
+class WiFiStats( object):
+	def __init__( self, name):
+		self.name = name
+		self.frequency = None 	# GHz
+		self.signal = None		# dBm
+		self.bitRate = None		# Mb/s
+		self.txPower = None		# dBm
+		self.linkQuality = None	# percent
+
+	def debugLog( self):
+		print( "----- begin WiFiStats Debug Logging")
+		print( "	name:		%s" % self.name)
+		print( "	frequency:	%s" % self.frequency)
+		print( "	signal:		%s" % self.signal)
+		print( "	bit rate:	%s" % self.bitRate)
+		print( "	tx power:	%s" % self.txPower)
+		print( "	quality:	%s" % self.linkQuality)
+		print()
+
+
+
+
+#
+#	class		N L 8 0 2 1 1   R E A D E R
+#
+#	keeps one generic netlink socket open and asks it for all the interfaces in a single
+#	dump and then for the station (access point) info of each configured interface.
+#	raises OSError from the constructor if nl80211 is not available.
+#
+class NL80211Reader( object):
+	def __init__( self):
+		self.sequence = 0
+		self.receiveBuffer = bytearray( 32768)
+		self.netlinkSocket = socket.socket( socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+		self.netlinkSocket.bind( (0, 0))
+		self.netlinkSocket.settimeout( 2)
+
+		self.familyId = None
+		self.resolveFamily()
+
+	def close( self):
+		self.netlinkSocket.close()
+
+
+	#
+	#	P A C K   A T T R
+	#
+	@staticmethod
+	def packAttr( attrType, data):
+		length = nlAttrHeader.size + len( data)
+		padding = (4 - length % 4) % 4
+		return nlAttrHeader.pack( length, attrType) + data + bytes( padding)
+
+
+	#
+	#	P A R S E   A T T R S
+	#
+	#	returns a dict of attribute type to a slice of the payload
+	#
+	@staticmethod
+	def parseAttrs( view, offset, end):
+		attrs = {}
+
+		while offset + nlAttrHeader.size <= end:
+			length, attrType = nlAttrHeader.unpack_from( view, offset)
+			if length < nlAttrHeader.size:
+				break
+
+			attrs[ attrType & NLA_TYPE_MASK] = view[ offset + nlAttrHeader.size:offset + length]
+			offset += (length + 3) & ~3
+
+		return attrs
+
+
+	#
+	#	S E N D   R E Q U E S T
+	#
+	#	returns the sequence number used so the replies can be matched up
+	#
+	def sendRequest( self, msgType, flags, command, attrs=b''):
+		self.sequence = (self.sequence + 1) & 0xffffffff
+		payload = genlMsgHeader.pack( command, 1, 0) + attrs
+		self.netlinkSocket.send( nlMsgHeader.pack( nlMsgHeader.size + len( payload), msgType, flags | NLM_F_REQUEST,
+			self.sequence, 0) + payload)
+		return self.sequence
+
+
+	#
+	#	R E C E I V E   R E P L I E S
+	#
+	#	reads until the reply to the request with this sequence number is complete and returns a
+	#	list of the attribute dicts of every message in it. For a dump that is when NLMSG_DONE
+	#	arrives, otherwise it is the first message that isn't marked as part of a multi-part reply.
+	#	An error from the kernel is raised as OSError.
+	#
+	def receiveReplies( self, sequence):
+		replies = []
+		headerSize = nlMsgHeader.size + genlMsgHeader.size
+
+		while True:
+			length = self.netlinkSocket.recv_into( self.receiveBuffer)
+			view = memoryview( self.receiveBuffer)
+			offset = 0
+			finished = False
+
+			while offset + nlMsgHeader.size <= length:
+				msgLength, msgType, msgFlags, msgSequence, _pid = nlMsgHeader.unpack_from( view, offset)
+				if msgLength < nlMsgHeader.size:
+					break
+
+				if msgSequence == sequence:
+					if msgType == NLMSG_DONE:
+						finished = True
+					elif msgType == NLMSG_ERROR:
+						error = struct.unpack_from( '=i', view, offset + nlMsgHeader.size)[0]
+						if error != 0:
+							raise OSError( -error, 'netlink request failed')
+						finished = True
+					else:
+						# copied out as the receive buffer is reused if the reply takes more than one read
+						message = bytes( view[ offset + headerSize:offset + msgLength])
+						replies.append( self.parseAttrs( message, 0, len( message)))
+						if not msgFlags & NLM_F_MULTI:
+							finished = True
+
+				offset += (msgLength + 3) & ~3
+
+			if finished:
+				return replies
+
+
+	#
+	#	R E S O L V E   F A M I L Y
+	#
+	#	generic netlink families get their message type assigned at runtime so we have to
+	#	ask the controller what the nl80211 one is
+	#
+	def resolveFamily( self):
+		sequence = self.sendRequest( GENL_ID_CTRL, 0, CTRL_CMD_GETFAMILY,
+			self.packAttr( CTRL_ATTR_FAMILY_NAME, b'nl80211\0'))
+
+		for attrs in self.receiveReplies( sequence):
+			if CTRL_ATTR_FAMILY_ID in attrs:
+				self.familyId = struct.unpack( '=H', attrs[ CTRL_ATTR_FAMILY_ID][:2])[0]
+
+		if self.familyId == None:
+			raise OSError( 'nl80211 generic netlink family not found')
+
+
+	#
+	#	R E A D
+	#
+	#	pass a list of interface names, returns a dict of name to WiFiStats
+	#	interfaces that do not exist or are not up are just not in the result
+	#
+	def read( self, interfaceNames):
+		results = {}
+		interfaceIndexes = {}
+
+		sequence = self.sendRequest( self.familyId, NLM_F_DUMP, NL80211_CMD_GET_INTERFACE)
+
+		for attrs in self.receiveReplies( sequence):
+			if not NL80211_ATTR_IFNAME in attrs:
+				continue
+
+			name = bytes( attrs[ NL80211_ATTR_IFNAME]).rstrip( b'\0').decode()
+			if not name in interfaceNames:
+				continue
+
+			stats = WiFiStats( name)
+
+			if NL80211_ATTR_WIPHY_FREQ in attrs:
+				stats.frequency = struct.unpack( '=I', attrs[ NL80211_ATTR_WIPHY_FREQ][:4])[0] / 1000
+
+			if NL80211_ATTR_WIPHY_TX_POWER_LEVEL in attrs:
+				# reported in mBm which is 100ths of a dBm
+				stats.txPower = round( struct.unpack( '=i', attrs[ NL80211_ATTR_WIPHY_TX_POWER_LEVEL][:4])[0] / 100)
+
+			results[ name] = stats
+			interfaceIndexes[ name] = attrs[ NL80211_ATTR_IFINDEX]
+
+		# the kernel will only run one dump at a time on a socket so the stations are asked for
+		# one interface after the other. In station mode there is only the one access point.
+		for name, ifIndex in interfaceIndexes.items():
+			stats = results[ name]
+
+			try:
+				sequence = self.sendRequest( self.familyId, NLM_F_DUMP, NL80211_CMD_GET_STATION,
+					self.packAttr( NL80211_ATTR_IFINDEX, bytes( ifIndex)))
+				replies = self.receiveReplies( sequence)
+			except OSError:
+				continue
+
+			for attrs in replies:
+				if not NL80211_ATTR_STA_INFO in attrs:
+					continue
+
+				stationInfo = attrs[ NL80211_ATTR_STA_INFO]
+				stationAttrs = self.parseAttrs( stationInfo, 0, len( stationInfo))
+
+				if NL80211_STA_INFO_SIGNAL in stationAttrs:
+					stats.signal = struct.unpack( '=b', stationAttrs[ NL80211_STA_INFO_SIGNAL][:1])[0]
+					stats.linkQuality = linkQualityFromSignal( stats.signal)
+
+				if NL80211_STA_INFO_TX_BITRATE in stationAttrs:
+					rateInfo = stationAttrs[ NL80211_STA_INFO_TX_BITRATE]
+					rateAttrs = self.parseAttrs( rateInfo, 0, len( rateInfo))
+
+					# both are in units of 100kbit/s, the 32 bit one is needed for the faster rates
+					if NL80211_RATE_INFO_BITRATE32 in rateAttrs:
+						stats.bitRate = struct.unpack( '=I', rateAttrs[ NL80211_RATE_INFO_BITRATE32][:4])[0] / 10
+					elif NL80211_RATE_INFO_BITRATE in rateAttrs:
+						stats.bitRate = struct.unpack( '=H', rateAttrs[ NL80211_RATE_INFO_BITRATE][:2])[0] / 10
+
+				break
+
+		return results
+
+
+
+
+#
+#	class		P R O C   W I R E L E S S   R E A D E R
+#
+#	the fallback, reads /proc/net/wireless through the pseudo file cache. This only
+#	gives us the link quality and the signal level.
+#
+#	the file looks like this after two header lines:
+#	 wlan0: 0000   70.  -38.  -256        0      0      0      0      0        0
+#
+class ProcWirelessReader( object):
+
+	# the maximum link quality that cfg80211 reports, it's the 70 in "Link Quality=70/70"
+	maxQuality = 70
+
+	def __init__( self, pseudoFiles):
+		self.wirelessFile = pseudoFiles.get( pathProcWireless)
+
+	def close( self):
+		pass
+
+	def read( self, interfaceNames):
+		results = {}
+		length = self.wirelessFile.read()
+		buffer = self.wirelessFile.buffer
+
+		for name in interfaceNames:
+			key = name.encode() + b':'
+			start = buffer.find( key, 0, length)
+
+			# names are right justified so make sure we didn't just match the end of a longer name
+			while start > 0 and not buffer[ start - 1] in b' \n':
+				start = buffer.find( key, start + 1, length)
+
+			if start == -1:
+				continue
+
+			lineEnd = buffer.find( b'\n', start, length)
+			if lineEnd == -1:
+				lineEnd = length
+
+			# status, link quality, signal level, noise level
+			fields = buffer[ start + len( key):lineEnd].split( None, 4)
+			if len( fields) < 3:
+				continue
+
+			stats = WiFiStats( name)
+			stats.linkQuality = round( float( fields[1].rstrip( b'.')) / self.maxQuality * 100)
+			stats.signal = int( float( fields[2].rstrip( b'.')))
+			results[ name] = stats
+
+		return results
+
+
+
+
+#
+#	class		W I F I   R E A D E R
+#
+#	usage:
+#		wifiReader = WiFiReader( pseudoFiles)
+#		for name, stats in wifiReader.read( ['wlan0', 'wlan1']).items():
+#			...
+#
+#	tries nl80211 first and falls back to /proc/net/wireless if that can't be opened
+#
+class WiFiReader( object):
+	def __init__( self, pseudoFiles):
+		self.pseudoFiles = pseudoFiles
+
+		try:
+			self.backend = NL80211Reader()
+			self.backendName = 'nl80211'
+		except OSError:
+			self.backend = ProcWirelessReader( pseudoFiles)
+			self.backendName = 'procfs'
+
+	def read( self, interfaceNames):
+		return self.backend.read( interfaceNames)
+
+	def close( self):
+		self.backend.close()
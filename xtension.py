@@ -15,16 +15,21 @@
 #		version 1.0 	11/23/2019
 #
 
+import hashlib
+import itertools
 import json
 import os
 from socket import *
 from threading import *
 from time import *
 import atexit
+from collections import deque, OrderedDict
+from contextlib import contextmanager
 
 
 
 from xtension_constants import *
+from timerwheel import TimerWheel
 
 # a local global for our XTension class reference
 # this is probably not necessary...
@@ -95,6 +100,12 @@ class XTension( object):
 	xtPCommandDebug				= "debug" 		# passes 0 or 1 in the 7th packet format to turn it on or off
 	xtPCommandFindMe			= "findme" 		# passes 0 or 1 in the 7th packet format to turn it on or off
 	xtPCommandUpdateAvailable 	= "firmup" 		# a firmware update is available for this device, alert the user
+	xtPCommandChunk				= "chunk"		# one piece of a command too large for a single datagram, see encodeCommand
+	xtPCommandInfoDelta			= "infodelta"	# the units added to and removed from the info since the version it names, see refreshInfo
+	
+	# an XTension that can take chunk or infodelta commands says so by listing their names in the data
+	# of its info or announce packets, the ones that don't are sent the whole info in a single datagram
+	xtPFeatures					= (xtPCommandChunk, xtPCommandInfoDelta)
 
 	
 	
@@ -105,10 +116,50 @@ class XTension( object):
 	
 	xtensionTimeout 			= 90 	# 90 seconds before we consider an XTension instance to be gone
 	xtensionPingInterval		= 45	# 45 seconds of silence before we ping an XTension process to see if it's still there
+	xtensionPingRetry			= 15	# and every 15 seconds after that until it answers or times out
 	
 	
 	packetDelim					= ';'
 	
+	# commands sent together are packed into datagrams of up to this many bytes, small enough
+	# to get through any normal network without being fragmented. A single larger command,
+	# like the info packet, is still sent on its own
+	maxDatagramSize				= 1400
+	
+	# the most commands that can be waiting in each lane of the send queue before the oldest are dropped
+	maxQueuedCommands			= 1000
+	
+	# a packet with the same sender and packet id as one received within this many seconds is a
+	# duplicate and ignored, and how many of those are remembered
+	duplicateWindow				= 2
+	maxRecentPackets			= 256
+	
+	# the size of the buffer datagrams are received into, large enough for any datagram, and how many datagrams a second each
+	# address can send us with bursts of up to receiveBurst before the rest are dropped
+	receiveBufferSize			= 65535
+	receiveRate					= 50
+	receiveBurst				= 100
+	maxRateLimitedSenders		= 256
+	
+	# a packet sent with the ack flag is sent again if there is no ack after retransmitSeconds,
+	# doubling each time, and given up on after maxRetransmits
+	retransmitSeconds			= 0.5
+	maxRetransmits				= 5
+	
+	# an info packet larger than this, the most a receiver reads in one go, is sent in chunks of
+	# up to chunkSize bytes of JSON to the instances that support them. The rest get it in a single
+	# datagram as long as it is no larger than maxSingleInfoSize, about the most a UDP datagram
+	# can carry. Chunks of a command received from someone else are put back together for up to
+	# chunkReassemblySeconds and from up to maxChunkTransfers at a time
+	maxInfoSize					= 4096
+	maxSingleInfoSize			= 65000
+	chunkSize					= 1200
+	chunkReassemblySeconds		= 10
+	maxChunkTransfers			= 16
+	
+	# when the offline spool is being replayed a chunk of it is sent this often
+	replayChunkSeconds			= 0.1
+	
 	
 	
 	
@@ -126,8 +177,10 @@ class XTension( object):
 	#	usage:
 	#	xtension = XTension( deviceName='lab rainbow hat', deviceID='EA1234')
 	#
+	#	maxInstances is how many XTension instances we can be connected to at once
+	#
 	
-	def __init__( self, *, deviceClass='xt.generic', deviceName='unnamed', deviceId=None):
+	def __init__( self, *, deviceClass='xt.generic', deviceName='unnamed', deviceId=None, maxInstances=8):
 	
 		# store off a local global (is that even a thing?) so that other classes can access
 		# the data and methods in this class, not just in the importing files that will create
@@ -161,14 +214,85 @@ class XTension( object):
 		
 		#print( "unique id is: %s" % self.uniqueId)
 		
-		# we can be connected to as many as 4 XTension instances so we need an array to hold those
-		# data classes that describe them
-		#self.xtInstances = [None, None, None, None]
-		self.xtInstances = [None] * 4
+		# the XTension instances we are connected to keyed by their unique id in the order they were
+		# last heard from, least recent first. When a new one is found and there are already
+		# maxInstances the one we haven't heard from the longest is dropped. See addInstance
+		self.xtInstances = OrderedDict()
+		self.maxInstances = maxInstances
 		
-		# counter so that we can send our announce packet every few minutes
+		# we send our announce packet every few minutes
 		self.announceInterval = 120
-		self.announceCounter = self.announceInterval # so it runs on the first loop iteration
+		self.lastAnnounce = None
+		
+		# the deadlines for the announce and for pinging and timing out each instance. Only used
+		# from the listener thread which sleeps until a packet comes in or the next one is due
+		self.keepaliveTimers = TimerWheel( tickSeconds=0.25, slotCount=512)
+		
+		# the commands waiting to be sent together for each thread that has begun a batch, see beginBatch
+		self.batchState = local()
+		
+		# the send queue, everything is sent from the sender thread so that nothing else ever
+		# waits on the network. See queueParts
+		self.sendCondition = Condition()
+		self.priorityLane = deque()
+		self.bulkLane = OrderedDict() 	# keyed by (target, unit address) so newer values replace waiting ones
+		self.unkeyedCount = 0
+		self.senderThread = None
+		self.sendIdle = True
+		
+		# the offline spool if one has been set with useSpool, data commands sent while there is no
+		# instance to send them to are kept there and replayed to the next instance to connect
+		self.spool = None
+		self.spoolReplayRate = 200
+		self.replayInstance = None 	# the instance the spool is being replayed to
+		self.replayDue = 0
+		self.dataTailStart = (self.packetDelim + self.deviceClass + self.packetDelim + self.xtPCommandData + self.packetDelim + '{').encode()
+		
+		# the (sender id, packet id) of the packets received recently and when, so that the same
+		# broadcast arriving more than once is only processed once. See isDuplicatePacket
+		self.recentPackets = OrderedDict()
+		self.duplicatePackets = 0
+		
+		# our id to check against received packets before they are decoded, the packets that were
+		# dropped for not being for us and the rate limit for each address. See processDatagram
+		self.uniqueIdBytes = self.uniqueId.encode()
+		self.filteredPackets = 0
+		self.receiveBuckets = OrderedDict()
+		self.rateLimitedDatagrams = 0
+		
+		# the info built by buildInfo and its encoded packets both whole and in chunks, sent as they
+		# are until the units change. See sendInfo and refreshInfo
+		self.infoLock = Lock()
+		self.infoDocument = None
+		self.infoUnits = None
+		self.infoTails = None
+		
+		# the chunked commands being received keyed by (sender id, transfer id), see reassembleChunk
+		self.chunkTransfers = OrderedDict()
+		
+		# the last data command sent to each unit keyed by its address, sent together to an instance
+		# when it is first found or asks with a query so it doesn't wait for values to change. See sendSnapshot
+		self.lastKnownTails = OrderedDict()
+		self.lastKnownLock = Lock()
+		
+		# the packets sent with the ack flag that haven't been acked yet keyed by (instance id, packet id)
+		# and the timers to send them again. See trackReliableParts, only used with the sendCondition held
+		self.unackedPackets = {}
+		self.retransmitTimers = TimerWheel( tickSeconds=0.05)
+		
+		# send queue statistics, see sendQueueDebugLog
+		self.maxBacklog = 0
+		self.sentDatagrams = 0
+		self.sendErrors = 0
+		self.droppedDatagrams = 0
+		self.droppedCommands = 0
+		self.coalescedCommands = 0
+		self.reliableSent = 0
+		self.ackedPackets = 0
+		self.retransmits = 0
+		self.failedDeliveries = 0
+		self.totalAckLatency = 0.0
+		self.maxAckLatency = 0.0
 
 	#
 	#	M A K E   U N I Q U E   I D
@@ -226,55 +350,109 @@ class XTension( object):
 	#
 	
 	def getInstance( self, id):
-		for x in self.xtInstances:
-			if x != None and x.uniqueId == id:
-				return x
+		return self.xtInstances.get( id)
+		
+		
+	#
+	#	I N S T A N C E S
+	#
+	#	a list of the current instances that is safe to loop over from any thread while the
+	#	listener thread adds and removes them, copying the dict is a single step under the GIL
+	#
+	def instances( self):
+		return list( self.xtInstances.values())
+		
+		
+	#
+	#	H A S   I N S T A N C E
+	#
+	#	True if this exact instance is still in the table and hasn't been removed or replaced
+	#
+	def hasInstance( self, instance):
+		return instance != None and self.xtInstances.get( instance.uniqueId) is instance
 		
-		return None
 		
 	#
 	#	A D D   I N S T A N C E
 	#
-	#	if no instance was found then we insert one here
-	# 	since we can only hold 4 instances at a time we need to find an empty slot
-	#	and if there is no empty slot then we put it in place where the oldest
-	#	entry is and replace that as its probably not responding or something.
+	#	if no instance was found then we insert one here. If there are already maxInstances
+	#	then the one we have gone the longest without hearing from is dropped to make room
+	#	as it's probably not responding or something. Only called from the listener thread
+	#	as it sets the keepalive timer for the instance
 	#
 	
 	def addInstance( self, newInstance):
-
-		# make sure we're not already in the index
-		for i in range( len( self.xtInstances)):
-			if self.xtInstances[ i] != None and self.xtInstances[ i].uniqueId == newInstance.uniqueId:
-				self.xtInstances[ i] = newInstance
-				return
-
-		workIndex = -1
 		
-		for i in range( len( self.xtInstances)):
-			if self.xtInstances[ i] == None:
-				workIndex = i
-				break
-				
-		if not workIndex == -1:
-			self.xtInstances[ workIndex] = newInstance
+		# replacing one that's already there just makes it the most recently heard
+		if newInstance.uniqueId in self.xtInstances:
+			self.xtInstances[ newInstance.uniqueId] = newInstance
+			self.xtInstances.move_to_end( newInstance.uniqueId)
 			return
 			
-		# there were no empty instances found so we must find the one with the longest
-		# time since we received anything from it and replace that one
+		while len( self.xtInstances) >= self.maxInstances:
+			oldId, oldInstance = self.xtInstances.popitem( last=False)
+			print( "dropping XTension instance %s at %s to make room for %s" % (oldId, oldInstance.address, newInstance.uniqueId))
+			
+		self.xtInstances[ newInstance.uniqueId] = newInstance
+		self.keepaliveTimers.add( self.xtensionPingInterval, (self.checkInstance, newInstance))
 		
-		workTimeout = -1
 		
-		for i in range( len( self.xtInstances)):
-			if self.xtInstances[ i].connectionTimeout > workTimeout:
-				workTimeout = self.xtInstances[ i].connectionTimeout
-				workIndex = i
-				
-		if workIndex == -1:
-			print( "unable to store new XTension reference")
+	#
+	#	C H E C K   I N S T A N C E
+	#
+	#	called by the keepalive timer for an instance. The timer isn't moved every time a packet
+	#	comes in, instead when it goes off it looks at how long it's really been since we heard
+	#	from the instance and pings it, removes it or just sets the timer again for when it will
+	#	have been silent long enough to need a ping
+	#
+	def checkInstance( self, instance):
+		if not self.hasInstance( instance):
+			return 	# removed or replaced since the timer was set
+			
+		silence = monotonic() - instance.lastHeard
+		
+		if silence >= self.xtensionTimeout:
+			# it's been longer than the connection timeout since we've heard from this
+			# machine, so give up trying to do so
+			self.removeInstance( instance=instance)
+			print( "removing XTension instance %s, nothing heard for %d seconds" % (instance.uniqueId, silence))
 			return
 			
-		self.xtInstances[ workIndex] = newInstance
+		if silence >= self.xtensionPingInterval:
+			#print( "sending ping to: %s" % instance.address)
+			self.sendPing( instance)
+			instance.pingSent = True
+			delay = min( self.xtensionPingRetry, self.xtensionTimeout - silence)
+		else:
+			delay = self.xtensionPingInterval - silence
+			
+		self.keepaliveTimers.add( delay, (self.checkInstance, instance))
+		
+		
+	#
+	#	C H E C K   A N N O U N C E
+	#
+	#	called by the keepalive timer to send our announce every announceInterval seconds
+	#
+	def checkAnnounce( self):
+		if self.lastAnnounce == None or monotonic() - self.lastAnnounce >= self.announceInterval:
+			self.sendAnnounce()
+			
+		self.keepaliveTimers.add( self.lastAnnounce + self.announceInterval - monotonic(), (self.checkAnnounce,))
+		
+		
+	#
+	#	H E A R D   F R O M   I N S T A N C E
+	#
+	#	called for every packet received from an instance, it becomes the most recently heard
+	#	from so it's the last to be dropped
+	#
+	def heardFromInstance( self, instance):
+		instance.lastHeard = monotonic()
+		instance.pingSent = False
+		
+		if instance.uniqueId in self.xtInstances:
+			self.xtInstances.move_to_end( instance.uniqueId)
 			
 			
 	#
@@ -289,17 +467,10 @@ class XTension( object):
 			id = instance.uniqueId
 			
 		if id == None:
-			raise ValueException( 'either id or instance required for call to removeInstance')
+			raise ValueError( 'either id or instance required for call to removeInstance')
 			return
 			
-		for i in range( len( self.xtInstances)):
-			x = self.xtInstances[ i]
-			if x == None:
-				continue
-				
-			if x.uniqueId == id:
-				self.xtInstances[ i] = None
-				return
+		self.xtInstances.pop( id, None)
 
 
 
@@ -316,7 +487,7 @@ class XTension( object):
 	#
 	def sendAnnounce( self):
 		self.sendBroadcastCommand( XTPCommand( command=self.xtPCommandAnnounce))
-		self.announceCounter = 0
+		self.lastAnnounce = monotonic()
 		
 	
 	#
@@ -340,38 +511,225 @@ class XTension( object):
 	#	this is sent in response to receiving the request from it from a host like XTension
 	#
 	#	pass an xtInstance class to it as these are always sent upon request to a specific
-	#	host and not via broadcast
+	#	instance. The info is only built the first time it's asked for and after that the same
+	#	encoded packets are sent to everyone who asks until refreshInfo finds the units have changed,
+	#	in chunks if the instance supports them
 	#
-	
 	def sendInfo( self, xtInfo):
 	
+		if self.shuttingDown:
+			return
+			
+		with self.infoLock:
+			if self.infoDocument == None:
+				self.cacheInfo( self.buildInfo())
+				
+			tails = self.infoTails[ xtInfo.supports( self.xtPCommandChunk)]
+			
+		self.queueParts( xtInfo, [(self.packetHead(), tail, None) for tail in tails])
+		
+		
+	#
+	#	B U I L D   I N F O
+	#
+	#	the info from callbackGetInfo with our device id added to the unit addresses, the keys
+	#	XTension assumes anyway left out and a version that is a hash of all the rest, so the
+	#	same units always have the same version. The units from the callback are copied and
+	#	never changed
+	#
+	def buildInfo( self):
+	
 		if self.callbackGetInfo == None:
 			work = {}
 		else:
-			work = self.callbackGetInfo()
+			work = dict( self.callbackGetInfo())
 			
-		# post process the addresses in any units that are passed to us
 		# all unit address must end in a period and our device id which is self.uniqueId
 		# but it shouldn't be necessary to pass it with this included, so if it is not there
-		# then we will walk the array of units passed in here and add it.
+		# then it is added to the copy of the unit
 		
 		if 'units' in work:
 			addressSuffix = '.' + self.uniqueId
+			units = []
 			
 			for workUnit in work[ 'units']:
-			
-				workAddress = workUnit[ 'address'] # all units MUST have an address
-				if not workAddress.endswith( addressSuffix):
-					workUnit[ 'address'] = workAddress + addressSuffix
+				# keys that are False or empty are what XTension assumes anyway so leave them out
+				unit = {key:value for key, value in workUnit.items() if not (value is False or value is None or value == '')}
+				
+				if not unit[ 'address'].endswith( addressSuffix): # all units MUST have an address
+					unit[ 'address'] += addressSuffix
 					
+				units.append( unit)
 				
+			work[ 'units'] = units
 			
 		work[ 'name'] = self.deviceName
 		work[ 'class'] = self.deviceClass
+		work.pop( 'version', None)
+		work[ 'version'] = hashlib.sha1( json.dumps( work, sort_keys=True, separators=(',', ':')).encode()).hexdigest()[ :12]
+		
+		return work
+		
+		
+	#
+	#	C A C H E   I N F O
+	#
+	#	keeps the info, its units by address for working out what changed, and the encoded
+	#	packet tails that sendInfo sends, see encodeCommand. Only called with the infoLock held
+	#
+	def cacheInfo( self, info):
+		self.infoDocument = info
+		self.infoUnits = OrderedDict( (unit[ 'address'], unit) for unit in info.get( 'units', []))
+		self.infoTails = self.encodeCommand( XTPCommand( command=self.xtPCommandInfo, jsonData=info, compact=True), 'info-' + info[ 'version'])
+		
+		
+	#
+	#	R E F R E S H   I N F O
+	#
+	#	builds the info again and if the units have changed, like a new network interface showing
+	#	up, sends just the unit descriptions that were added or changed and the addresses of the
+	#	ones that are gone in an infodelta command along with the version it replaces to every
+	#	instance that supports them. If anything other than the units changed, or the instance
+	#	doesn't know infodelta, it gets the whole info instead. The last known values of the units
+	#	that are gone are forgotten so they aren't in the next snapshot. returns True if anything was different
+	#
+	def refreshInfo( self):
+	
+		info = self.buildInfo()
+		
+		with self.infoLock:
+			previous = self.infoDocument
+			if previous != None and previous[ 'version'] == info[ 'version']:
+				return False
+				
+			# kept while the lock is held as another refresh could replace them as soon as it's let go
+			previousUnits = self.infoUnits
+			self.cacheInfo( info)
+			currentUnits = self.infoUnits
+			infoTails = self.infoTails
+			
+		# no one has been sent the old info so there is nothing to update
+		if previous == None:
+			return True
+			
+		removed = [address for address in previousUnits if address not in currentUnits]
+		addressSuffix = '.' + self.uniqueId
+		
+		with self.lastKnownLock:
+			for address in removed:
+				if address.endswith( addressSuffix):
+					address = address[ :-len( addressSuffix)]
+				self.lastKnownTails.pop( address, None)
+				
+		otherKeys = lambda x: {key:value for key, value in x.items() if key not in ('units', 'version')}
+		deltaTails = None
+		
+		if otherKeys( previous) == otherKeys( info):
+			delta = {
+				'version':	info[ 'version'],
+				'previous':	previous[ 'version'],
+				'add':		[unit for address, unit in currentUnits.items() if previousUnits.get( address) != unit],
+				'remove':	removed
+			}
+			
+			deltaTails = self.encodeCommand( XTPCommand( command=self.xtPCommandInfoDelta, jsonData=delta, compact=True), 'delta-' + info[ 'version'])
+			
+		# queued for each instance rather than sent to all so they aren't kept in the offline spool
+		# the next instance found gets the whole info anyway
+		for instance in self.instances():
+			if deltaTails != None and instance.supports( self.xtPCommandInfoDelta):
+				tails = deltaTails[ instance.supports( self.xtPCommandChunk)]
+			else:
+				tails = infoTails[ instance.supports( self.xtPCommandChunk)]
+				
+			self.queueParts( instance, [(self.packetHead(), tail, None) for tail in tails])
+			
+		return True
+		
+		
+	#
+	#	E N C O D E   C O M M A N D
+	#
+	#	the encoded packet tails to send the command, see getRawParts, as a tuple of the tails for
+	#	instances that don't support chunks and the ones that do, so it can be indexed with
+	#	instance.supports( xtPCommandChunk). If its JSON is larger than maxInfoSize the ones that do
+	#	get a series of chunk commands each with a piece of the JSON. The data of each is the
+	#	transfer id, which must be different for each command sent in chunks, the index of the
+	#	piece, how many pieces there are and the original command, so the receiver can put them
+	#	back together in order. See reassembleChunk. The rest get the whole command in one
+	#	datagram unless it's too large for one, then there's nothing else to do but send the chunks
+	#
+	def encodeCommand( self, command, transferId):
+		text = command.getJSONText()
+		single = [command.getRawParts()[ 1]]
+		
+		if len( text) <= self.maxInfoSize:
+			return (single, single)
+			
+		pieces = [text[ x:x + self.chunkSize] for x in range( 0, len( text), self.chunkSize)]
+		
+		chunks = [XTPCommand( command=self.xtPCommandChunk, packetId=0, data=[transferId, str( index), str( len( pieces)), 
+			command.command, pieces[ index]]).getRawParts()[ 1] for index in range( len( pieces))]
+			
+		if len( text) > self.maxSingleInfoSize:
+			print( "%s command of %d bytes is too large for one datagram, sending it in chunks to every instance" % (command.command, len( text)))
+			return (chunks, chunks)
+			
+		return (single, chunks)
+		
+		
+	#
+	#	P A C K E T   F E A T U R E S
+	#
+	#	the names from xtPFeatures that an info or announce packet from XTension lists in its data
+	#
+	def packetFeatures( self, p):
+		return frozenset( x for x in p.data if x in self.xtPFeatures)
+			
+			
+	#
+	#	R E A S S E M B L E   C H U N K
+	#
+	#	keeps the piece from a received chunk command and once all of them have arrived returns the
+	#	packet turned back into the original command with the whole JSON as its data. Returns None
+	#	until then or if the chunk is malformed. A transfer that isn't complete in
+	#	chunkReassemblySeconds is thrown away. Only called from the listener
+	#
+	def reassembleChunk( self, p):
+		try:
+			transferId, index, count, command, piece = p.data[ :5]
+			index = int( index)
+			count = int( count)
+		except ValueError:
+			print( "malformed chunk ignored")
+			return None
+			
+		now = monotonic()
+		key = (p.senderId, transferId)
 		
-		#print( "in sendInfo with info=(%s)" % json.dumps( work))
+		# throw away any transfers that have been waiting too long for the rest of their pieces
+		while len( self.chunkTransfers) > 0:
+			oldKey, (started, oldPieces) = next( iter( self.chunkTransfers.items()))
+			if now - started < self.chunkReassemblySeconds and len( self.chunkTransfers) < self.maxChunkTransfers:
+				break
+			del self.chunkTransfers[ oldKey]
+			
+		if not key in self.chunkTransfers:
+			self.chunkTransfers[ key] = (now, [None] * count)
+			
+		started, pieces = self.chunkTransfers[ key]
+		if len( pieces) != count or index < 0 or index >= count:
+			print( "malformed chunk ignored")
+			return None
 			
-		self.sendCommand( instance=xtInfo, command=XTPCommand( command=self.xtPCommandInfo, jsonData=work))
+		pieces[ index] = piece
+		if None in pieces:
+			return None
+			
+		del self.chunkTransfers[ key]
+		p.command = command
+		p.data = [''.join( pieces)]
+		return p
 		
 
 
@@ -387,7 +745,6 @@ class XTension( object):
 		self.udpListener = socket( AF_INET, SOCK_DGRAM)
 		self.udpListener.setsockopt( SOL_SOCKET, SO_REUSEADDR, 1)
 		self.udpListener.bind( ('0.0.0.0', self.udpPort))
-		self.udpListener.settimeout( 1)
 		
 		self.listenThread = Thread( target=self.threadedRead, args=(), name='udp listener')
 		self.listenThread.start()
@@ -402,193 +759,871 @@ class XTension( object):
 		
 		
 	#
-	#	T H R E A D E D   R E A D
+	#	T H R E A D E D   R E A D
+	#
+	#	the threaded handler for receiving UDP packets
+	#	the announce, pings and instance timeouts are kept in the keepaliveTimers and the socket
+	#	timeout is set to wake us when the next one is due, or never if there are none. They are
+	#	checked after every packet as well so a busy network can't hold them up
+	#
+	
+	def threadedRead( self):
+		# received into the same buffer every time rather than allocating a new one for each datagram
+		readBuffer = bytearray( self.receiveBufferSize)
+		readView = memoryview( readBuffer)
+		
+		self.keepaliveTimers.add( self.announceInterval, (self.checkAnnounce,))
+		
+		while True:
+			self.runKeepaliveTimers()
+					
+			delay = self.keepaliveTimers.timeUntilNext()
+			if delay != None and delay <= 0:
+				continue
+				
+			self.udpListener.settimeout( delay)
+			
+			try:
+				(readCount, readAddr) = self.udpListener.recvfrom_into( readBuffer)
+				#print( "received: (%s) from (%s)" % (readView[ :readCount].tobytes(), readAddr))
+			except timeout:
+				continue
+				
+			self.processDatagram( readView[ :readCount], readAddr[ 0])
+			
+			
+	#
+	#	P R O C E S S   D A T A G R A M
+	#
+	#	splits a received datagram into its packets and processes each one that is for us. The
+	#	datagram may be bytes or a memoryview of the receive buffer. Anything over the rate limit for
+	#	the sender or that isn't an xtkit packet at all is thrown away before it is even copied and
+	#	each packet is checked with isPacketForUs before it's decoded and parsed
+	#
+	def processDatagram( self, readBuffer, address):
+		if readBuffer[ :6] != b'xtkit;':
+			self.filteredPackets += 1
+			return
+			
+		if not self.allowDatagram( address):
+			return
+			
+		packets = bytes( readBuffer).split( b'\n')
+		
+		for x in packets:
+			if x == b'' or not self.isPacketForUs( x):
+				continue
+				
+			try:
+				workPacket = XTPCommand( received=x, address=address)
+			except ValueError:
+				print( "invalid packet ignored")
+				continue
+				
+			#workPacket.debugLog()
+			self.processReception( workPacket)
+			
+			
+	#
+	#	R U N   K E E P A L I V E   T I M E R S
+	#
+	#	calls whatever is due in the keepaliveTimers, each timer item is a tuple of the function
+	#	and its arguments
+	#
+	def runKeepaliveTimers( self):
+		for callback in self.keepaliveTimers.expired():
+			try:
+				callback[ 0]( *callback[ 1:])
+			except Exception as e:
+				print( "error in keepalive timer: %s" % e)
+				
+				
+
+	#
+	#	A L L O W   D A T A G R A M
+	#
+	#	a token bucket for each address we receive from so that a misbehaving device flooding the
+	#	network can't keep us busy. Each datagram takes a token, they refill at receiveRate a second
+	#	up to receiveBurst. Only the most recent maxRateLimitedSenders addresses are remembered
+	#	only called from the listener
+	#
+	def allowDatagram( self, address):
+		now = monotonic()
+		bucket = self.receiveBuckets.get( address)
+		
+		if bucket == None:
+			bucket = [self.receiveBurst, now]
+			self.receiveBuckets[ address] = bucket
+			if len( self.receiveBuckets) > self.maxRateLimitedSenders:
+				self.receiveBuckets.popitem( last=False)
+		else:
+			self.receiveBuckets.move_to_end( address)
+			bucket[ 0] = min( self.receiveBurst, bucket[ 0] + (now - bucket[ 1]) * self.receiveRate)
+			bucket[ 1] = now
+			
+		if bucket[ 0] < 1:
+			self.rateLimitedDatagrams += 1
+			return False
+			
+		bucket[ 0] -= 1
+		return True
+		
+		
+	#
+	#	I S   P A C K E T   F O R   U S
+	#
+	#	the same checks as processReception but on the raw bytes before anything is decoded or
+	#	parsed. Our own broadcasts coming back to us and the broadcasts and commands of every
+	#	other kit device on the network are dropped here, leaving just the packets from XTension
+	#	and anything addressed to us, as long as they aren't duplicates
+	#
+	def isPacketForUs( self, raw):
+		fields = raw.split( b';', 6)
+		
+		if len( fields) < 7 or fields[ 3] == self.uniqueIdBytes or (fields[ 5] != b'xtension' and fields[ 4] != self.uniqueIdBytes):
+			self.filteredPackets += 1
+			return False
+			
+		return not self.isDuplicatePacket( fields[ 3], fields[ 1])
+		
+		
+	#
+	#	I S   D U P L I C A T E   P A C K E T
+	#
+	#	returns True if a packet with the same sender id and packet id was received in the last
+	#	duplicateWindow seconds, the same broadcast having arrived on more than one interface or
+	#	been repeated. Packet ids roll over so an old one is not a duplicate. Only the most recent
+	#	maxRecentPackets are remembered. Only called from the listener
+	#
+	def isDuplicatePacket( self, senderId, packetId):
+		key = (senderId, packetId)
+		now = monotonic()
+		
+		seenAt = self.recentPackets.get( key)
+		if seenAt != None and now - seenAt < self.duplicateWindow:
+			self.duplicatePackets += 1
+			return True
+			
+		self.recentPackets[ key] = now
+		self.recentPackets.move_to_end( key)
+		
+		if len( self.recentPackets) > self.maxRecentPackets:
+			self.recentPackets.popitem( last=False)
+			
+		return False
+		
+		
+	#
+	#	P R O C E S S   R E C E P T I O N
+	#
+	#	called from the threaded read when we have parsed a valid packet
+	#
+	
+	def processReception( self, p):
+		
+		#	ignore our own reception of our own accounce and bye bye and other broadcast packets
+		#	they will show up here as if they were from someone else
+		
+		if p.senderId == self.uniqueId:
+			#print( "send to self broadcast ignored")
+			return
+			
+		# a piece of a larger command, once they've all arrived it carries on as that command
+		if p.command == self.xtPCommandChunk:
+			p = self.reassembleChunk( p)
+			if p == None:
+				return
+			
+		#p.debugLog()
+			
+		# if the packet is from XTension then we have to create the instance entry for this
+		# or to update the timeouts and such
+		
+		if p.deviceType == 'xtension':
+			workInstance = self.getInstance( p.senderId)
+			
+			if workInstance == None:
+				# this is a new reception from this instance
+				# we need to create an instance and insert it into the 
+				# list
+				
+				#print( "adding instance for XTension at: %s with ID %s" % (p.address, p.senderId))
+				
+				workInstance = XTInstance( address=p.address, uniqueId=p.senderId)
+				if p.command in (self.xtPCommandInfo, self.xtPCommandAnnounce):
+					workInstance.features = self.packetFeatures( p)
+				
+				self.addInstance( workInstance)
+				# since this is the first time we've seen this XTension machine we should also send it our info
+				self.sendInfo( workInstance)
+				
+				# and anything that was spooled while there was no XTension to send it to
+				self.startReplay( workInstance)
+				
+				# followed by the current state of all the units
+				self.sendSnapshot( workInstance)
+				
+			else:
+				# if it is the bye bye command then we remove the instance of XTension
+				# and stop processing here
+				if p.command == self.xtPCommandByeBye:
+					#print( "ByeBye from XTension %s" % p.senderId)
+					self.removeInstance( instance=workInstance)
+					return
+			
+			
+				#print( "udating timeouts for XTension at: %s with ID %s was %.1f seconds since we last heard from it" % (workInstance.address, workInstance.uniqueId, monotonic() - workInstance.lastHeard))
+				self.heardFromInstance( workInstance)
+				
+				# what it supports may have changed if it was upgraded without changing its id
+				if p.command in (self.xtPCommandInfo, self.xtPCommandAnnounce):
+					workInstance.features = self.packetFeatures( p)
+				
+			# we should have a valid instance reference now in workInstance so now we can process the command
+			# if it is XTension sending us an Info packet, then we need to respond with our own Info packet
+			
+			if p.command == self.xtPCommandInfo:
+				#print( "processing info packet from XTension")
+				self.sendInfo( workInstance)
+				return
+				
+			# the ack for a packet we sent with the ack flag
+			if p.command == self.xtPCommandAck:
+				self.receivedAck( workInstance, p.packetId)
+				return
+				
+			# a query asks for the current state of all our units
+			if p.command == self.xtPCommandQuery:
+				self.sendSnapshot( workInstance)
+				return
+		
+		# all other commands should be directly addressed to us so we can bail out if we receive something
+		# that does not match our ID
+		
+		if not p.targetId == self.uniqueId:
+			#print( "packet not for us")
+			return
+				
+		if not self.callbackHandleCommand == None:
+			try:
+				self.callbackHandleCommand( p)
+			except Exception as e:
+				print( "error:(%s) while handling command from XTension:" % e)
+				p.debugLog()
+				
+			
+			
+			
+		
+
+				
+	#
+	#	S E N D   C O M M A N D   T O   A L L 
+	#
+	#	sends the same command to all currently valid instances of XTension on the network
+	#	everything but the target id is the same for every instance so the command is only
+	#	encoded once and the target id of each instance spliced in when it is sent
+	#
+	def sendCommandToAll( self, theCommand, *, priority=False):
+		self.sendRawPartsToAll( [theCommand.getRawParts()], priority=priority)
+				
+		
+	#
+	#	S E N D   C O M M A N D S   T O   A L L
+	#
+	#	sends a list of commands to all currently valid instances of XTension. The receiver
+	#	splits datagrams on the newline at the end of every command so they are packed into
+	#	as few datagrams to each instance as will fit in maxDatagramSize rather than one packet per command.
+	#	like sendCommandToAll each command is only encoded once no matter how many instances there are
+	#
+	def sendCommandsToAll( self, commands, *, priority=False):
+		self.sendRawPartsToAll( [command.getRawParts() for command in commands], priority=priority)
+				
+				
+	#
+	#	S E N D   R A W   P A R T S   T O   A L L
+	#
+	#	sends already encoded commands to all currently valid instances of XTension, pass a
+	#	list of the (head, tail, key) parts from XTPCommand.getRawParts or a UnitSender. 
+	#	they are put in the send queue and sent by the sender thread with the target id of each
+	#	instance spliced in. Pass priority=True for state changes that should go ahead of everything
+	#	else that is waiting, like the throttled units
+	#
+	def sendRawPartsToAll( self, parts, *, priority=False):
+	
+		if len( parts) == 0 or self.shuttingDown:
+			return
+			
+		self.rememberParts( parts)
+			
+		# if this thread has a batch open then they just wait there to be sent with the others
+		if not priority:
+			pending = getattr( self.batchState, 'parts', None)
+			if pending != None:
+				if len( pending) == 0:
+					self.batchState.started = monotonic()
+				pending += parts
+				return
+			
+		self.queueParts( None, parts, priority=priority)
+				
+				
+	#
+	#	Q U E U E   P A R T S
+	#
+	#	adds commands to the send queue for the sender thread. The target is the XTInstance to
+	#	send them to or None for all the instances that exist when they are actually sent.
+	#	this never blocks, if the queue is full the oldest waiting commands are dropped. If a
+	#	command for a unit is still waiting when a newer one for the same unit is queued, the
+	#	waiting one is replaced so a backlog only ever holds the latest value for each unit.
+	#	priority commands are never replaced or dropped in favor of regular ones
+	#
+	def queueParts( self, target, parts, *, priority=False):
+	
+		with self.sendCondition:
+			if target == None and self.spool != None and self.shouldSpool():
+				parts = self.spoolParts( parts)
+				if len( parts) == 0:
+					return
+					
+			if priority:
+				lane = self.priorityLane
+				for head, tail, key in parts:
+					if len( lane) >= self.maxQueuedCommands:
+						lane.popleft()
+						self.droppedCommands += 1
+					lane.append( (target, head, tail))
+			else:
+				lane = self.bulkLane
+				for head, tail, key in parts:
+					if key == None:
+						# nothing to replace it with so give it a key of its own
+						key = self.unkeyedCount
+						self.unkeyedCount += 1
+						
+					queueKey = (target, key)
+					if queueKey in lane:
+						self.coalescedCommands += 1
+						
+					elif len( lane) >= self.maxQueuedCommands:
+						lane.popitem( last=False)
+						self.droppedCommands += 1
+						
+					lane[ queueKey] = (target, head, tail)
+					
+			backlog = len( self.priorityLane) + len( self.bulkLane)
+			if backlog > self.maxBacklog:
+				self.maxBacklog = backlog
+				
+			self.wakeSender()
+				
+				
+	#
+	#	T H R E A D E D   S E N D
+	#
+	#	the sender thread. Takes everything that is waiting in the send queue, priority lane first,
+	#	and sends it packed into as few datagrams to each instance as it will fit. If the network is
+	#	down the retries only hold up this thread, anything sent in the meantime waits in the queue.
+	#	when the spool is being replayed a little of it is sent every replayChunkSeconds in between
+	#
+	def threadedSend( self):
+		while True:
+			with self.sendCondition:
+				while len( self.priorityLane) == 0 and len( self.bulkLane) == 0:
+					delay = self.timeUntilSendDue()
+					
+					if self.replayInstance == None:
+						self.sendIdle = True
+						self.sendCondition.notify_all()
+						
+					if delay != None and delay <= 0:
+						break
+						
+					self.sendCondition.wait( delay)
+					
+				self.sendIdle = False
+				entries = self.takeQueued()
+				
+			self.sendEntries( entries)
+			
+			
+	#
+	#	W A K E   S E N D E R
+	#
+	#	lets the sender thread know there is something new in the queue, starting it the first
+	#	time. Only called with the sendCondition held
+	#
+	def wakeSender( self):
+		if self.senderThread == None:
+			self.senderThread = Thread( target=self.threadedSend, args=(), name='udp sender', daemon=True)
+			self.senderThread.start()
+			
+		self.sendCondition.notify()
+		
+		
+	#
+	#	T A K E   Q U E U E D
+	#
+	#	empties the send queue and returns what was in it as (target, head, tail) priority lane
+	#	first. Only called with the sendCondition held
+	#
+	def takeQueued( self):
+		entries = list( self.priorityLane)
+		entries += self.bulkLane.values()
+		self.priorityLane.clear()
+		self.bulkLane.clear()
+		return entries
+		
+		
+	#
+	#	T I M E   U N T I L   S E N D   D U E
+	#
+	#	seconds until the next retransmit or chunk of the spool replay is due even if nothing else
+	#	is sent, or None if neither is waiting. Only called with the sendCondition held
+	#
+	def timeUntilSendDue( self):
+		delay = self.retransmitTimers.timeUntilNext()
+		
+		if self.replayInstance != None:
+			replayDelay = self.replayDue - monotonic()
+			if delay == None or replayDelay < delay:
+				delay = replayDelay
+				
+		return delay
+		
+		
+	#
+	#	S E N D   E N T R I E S
+	#
+	#	sends the entries taken from the send queue and then anything that is due to be sent again
+	#	or replayed. Called without the sendCondition held as sending may wait on the network
+	#
+	def sendEntries( self, entries):
+		# sort them out by where they are going keeping them in order
+		byTarget = {}
+		instances = self.instances()
+		for target, head, tail in entries:
+			if target == None:
+				for xt in instances:
+					byTarget.setdefault( xt, []).append( (head, tail))
+			else:
+				byTarget.setdefault( target, []).append( (head, tail))
+				
+		for target, parts in byTarget.items():
+			try:
+				self.sendPackedParts( target, parts)
+			except Exception as e:
+				print( "error sending to %s: %s" % (target.address, e))
+				
+			if isinstance( target, XTInstance):
+				self.trackReliableParts( target, parts)
+				
+		self.retransmitExpired()
+				
+		if self.replayInstance != None and monotonic() >= self.replayDue:
+			try:
+				self.replaySpool()
+			except Exception as e:
+				print( "error replaying the spool: %s" % e)
+				
+			self.replayDue = monotonic() + self.replayChunkSeconds
+				
+				
+	#
+	#	R E M E M B E R   P A R T S
+	#
+	#	keeps the data commands for units, the ones with the unit address as their key, as the
+	#	last known state of each unit for sendSnapshot
+	#
+	def rememberParts( self, parts):
+		with self.lastKnownLock:
+			for head, tail, key in parts:
+				if key != None and tail.startswith( self.dataTailStart):
+					self.lastKnownTails[ key] = tail
+					
+					
+	#
+	#	S E N D   S N A P S H O T
+	#
+	#	sends the last known state of every unit to just this instance, packed into as few datagrams
+	#	as they fit in. Called when an instance is first found right after its info packet and when
+	#	it sends a query. If the spool is being replayed to it the snapshot is sent when that is
+	#	finished so the older values from the spool don't replace it
+	#
+	def sendSnapshot( self, instance):
+		if self.shuttingDown or self.replayInstance == instance:
+			return
+			
+		with self.lastKnownLock:
+			tails = list( self.lastKnownTails.items())
+			
+		if len( tails) == 0:
+			return
+			
+		self.queueParts( instance, [(self.packetHead(), tail, key) for key, tail in tails])
+		
+		
+	#
+	#	T R A C K   R E L I A B L E   P A R T S
+	#
+	#	the commands sent with the ack flag, like those from a UnitSender created with reliable=True
+	#	are kept until XTension acks them and a timer set to send them again if it doesn't. Only
+	#	called from the sender thread after the parts were sent to the instance
+	#
+	def trackReliableParts( self, instance, parts):
+		for head, tail in parts:
+			fields = head.split( b';', 3)
+			if not int( fields[ 2]) & self.xtPFlagsAck:
+				continue
+				
+			packet = ReliablePacket( instance, fields[ 1].decode(), head, tail)
+			
+			with self.sendCondition:
+				# if the id has come all the way around there's no telling which one an ack is for
+				# so the older one is given up on rather than cleared by the wrong ack
+				older = self.unackedPackets.get( packet.key)
+				if older != None:
+					self.retransmitTimers.cancel( older.timer)
+					self.failedDeliveries += 1
+					
+				self.unackedPackets[ packet.key] = packet
+				packet.timer = self.retransmitTimers.add( self.retransmitSeconds, packet)
+				self.reliableSent += 1
+				
+				
+	#
+	#	R E T R A N S M I T   E X P I R E D
+	#
+	#	sends again every reliable packet whose timer has run out with the same packet id so XTension
+	#	can ignore it if it was only the ack that was lost. The wait doubles every time until
+	#	maxRetransmits when it is given up on. Only called from the sender thread
+	#
+	def retransmitExpired( self):
+		resend = []
+		
+		with self.sendCondition:
+			for packet in self.retransmitTimers.expired():
+				if self.unackedPackets.get( packet.key) != packet:
+					continue
+					
+				if packet.retransmits >= self.maxRetransmits or not self.hasInstance( packet.instance):
+					del self.unackedPackets[ packet.key]
+					self.failedDeliveries += 1
+					continue
+					
+				packet.retransmits += 1
+				self.retransmits += 1
+				packet.timer = self.retransmitTimers.add( self.retransmitSeconds * 2 ** packet.retransmits, packet)
+				resend.append( packet)
+				
+		for packet in resend:
+			try:
+				self.sendPackedParts( packet.instance, [(packet.head, packet.tail)])
+			except Exception as e:
+				print( "error sending to %s: %s" % (packet.instance.address, e))
+				
+				
+	#
+	#	R E C E I V E D   A C K
+	#
+	#	called from the listener thread when an instance acks one of our packets. Keeps the time
+	#	from when it was first sent to the ack for the latency statistics
+	#
+	def receivedAck( self, instance, packetId):
+		with self.sendCondition:
+			packet = self.unackedPackets.pop( (instance.uniqueId, packetId), None)
+			if packet == None:
+				return 	# a late ack for one we already gave up on or a second ack for a retransmit
+				
+			self.retransmitTimers.cancel( packet.timer)
+			
+			latency = monotonic() - packet.firstSent
+			self.ackedPackets += 1
+			self.totalAckLatency += latency
+			if latency > self.maxAckLatency:
+				self.maxAckLatency = latency
+				
+				
+	def averageAckLatency( self):
+		if self.ackedPackets == 0:
+			return 0.0
+		return self.totalAckLatency / self.ackedPackets
+		
+		
+	#
+	#	U S E   S P O O L
+	#
+	#	pass a spool.Spool to keep the data commands sent while there are no instances of XTension
+	#	and replay them to the next one that connects at replayRate commands per second
+	#
+	def useSpool( self, spool, *, replayRate=200):
+		with self.sendCondition:
+			self.spool = spool
+			self.spoolReplayRate = replayRate
+			
+			
+	#
+	#	S H O U L D   S P O O L
+	#
+	#	data commands for all instances only go to the spool when there are no instances to send
+	#	them to. While the spool is being replayed new values still go straight out, priority and
+	#	reliable ones included, so they aren't held up behind the backlog. Replayed values have the
+	#	time they were read so XTension keeps them in its history without taking them as the
+	#	current value, and the snapshot at the end of the replay makes sure of it. Only called
+	#	with the sendCondition held
+	#
+	def shouldSpool( self):
+		return len( self.xtInstances) == 0
+		
+		
+	#
+	#	S P O O L   P A R T S
+	#
+	#	adds the data commands to the spool with the time now and their flags and returns the other
+	#	parts that still need to be queued, like log commands which are of no use later
+	#
+	def spoolParts( self, parts):
+		remaining = []
+		now = time()
+		
+		for part in parts:
+			head, tail, key = part
+			if tail.startswith( self.dataTailStart):
+				self.spool.append( now, tail, int( head.split( b';', 3)[ 2]))
+			else:
+				remaining.append( part)
+				
+		return remaining
+		
+		
+	#
+	#	S T A R T   R E P L A Y
+	#
+	#	begins replaying anything in the spool to the instance, called when a new instance is found
+	#	after it has been sent our info so that all the units exist
+	#
+	def startReplay( self, instance):
+		with self.sendCondition:
+			if self.spool == None or len( self.spool) == 0 or self.replayInstance != None:
+				return
+				
+			self.replayInstance = instance
+			self.wakeSender()
+			
+			
+	#
+	#	R E P L A Y   S P O O L
 	#
-	#	the threaded handler for receiving UDP packets
-	#	all the timeouts and other counters are managed during the timeout
-	# 	on this socket as well
+	#	sends the next replayChunkSeconds worth of the spool at spoolReplayRate with the time each
+	#	command was originally sent as the timestamp and the flags it was sent with, so the reliable
+	#	ones are tracked until they are acked. Only called from the sender thread
 	#
-	
-	def threadedRead( self):
-		readBuffer = b''
+	def replaySpool( self):
+		instance = self.replayInstance
 		
-		while True:
-			try:
-				(readBuffer, readAddr) = self.udpListener.recvfrom( 4096)
-				#print( "received: (%s) from (%s)" % (readBuffer, readAddr))
-			except timeout:
-				#print( "socket timeout")
-				
-				# in our timeout we process the ping timers and other timeouts
-				
-				for i in range( len( self.xtInstances)):
-					workInstance = self.xtInstances[ i]
-					if workInstance == None:
-						continue
-					
-					workInstance.connectionTimeout += 1
+		if not self.hasInstance( instance):
+			# it went away, carry on with the most recently heard from instance or wait for the next one to connect
+			with self.sendCondition:
+				instances = self.instances()
+				if len( instances) > 0:
+					self.replayInstance = instances[ -1]
+				else:
+					self.replayInstance = None
 						
-					
-					if workInstance.connectionTimeout > self.xtensionTimeout:
-						# it's been longer than the connection timeout since we've heard from this
-						# machine, so give up trying to do so
-						self.xtInstances[ i] = None
-						print( "removing XTension instance at index: %s" % i)
-						continue
-					
-					if workInstance.connectionTimeout > self.xtensionPingInterval:
-						#print( "sending ping to: %s" % workInstance.address)
-						self.sendPing( workInstance)
+			return
+			
+		records = self.spool.read( max( 1, int( self.spoolReplayRate * self.replayChunkSeconds)))
+		parts = []
+		
+		for sentAt, tail, flags in records:
+			if tail.endswith( b'}\n'):
+				tail = b''.join( (tail[ :-2], b', "%s": %.3f}\n' % (xtKeyTimestamp.encode(), sentAt)))
 				
+			parts.append( (self.packetHead( flags), tail))
+			
+		self.sendPackedParts( instance, parts)
+		self.trackReliableParts( instance, parts)
+		
+		with self.sendCondition:
+			if len( self.spool) > 0:
+				return
 				
+			self.replayInstance = None
+			
+		self.sendSnapshot( instance)
 				
 				
+	#
+	#	P A C K E T   H E A D
+	#
+	#	the encoded start of a new packet up to the target id with the next packet id
+	#
+	def packetHead( self, flags=0):
+		delim = self.packetDelim
+		return (delim.join( (XTPCommand.commandStart, str( XTPCommand.nextPacketId()), str( flags), self.uniqueId)) + delim).encode()
+					
+					
+	#
+	#	W A I T   F O R   S E N D   Q U E U E
+	#
+	#	waits up to timeout seconds for the sender thread to send everything that is queued
+	#	returns True if it did
+	#
+	def waitForSendQueue( self, timeout=None):
+		with self.sendCondition:
+			if self.senderThread == None:
+				return True
 				
-				continue
+			return self.sendCondition.wait_for( lambda: self.sendIdle and len( self.priorityLane) == 0 and 
+				len( self.bulkLane) == 0, timeout)
 				
-			packets = readBuffer.split( b'\n')
-			
-			for x in packets:
-				if x != b'':
-					workPacket = XTPCommand( received=x, address=readAddr[0])
-					#workPacket.debugLog()
-					
-					if workPacket.isValid:
-						self.processReception( workPacket)
-					else:
-						print( "invalid packet ignored")
-						
 				
+	#
+	#	S E N D   P A C K E D   P A R T S
+	#
+	#	sends the commands to one instance packing as many of them into each datagram as
+	#	will fit in maxDatagramSize. Only called from the sender thread
+	#
+	def sendPackedParts( self, instance, parts):
+		targetId = instance.targetIdBytes
+		maxSize = self.maxDatagramSize
+		
+		if isinstance( instance, BroadcastTarget):
+			sendData = self.sendBroadcastData
+		else:
+			sendData = self.sendRawData
+		rawData = []
+		size = 0
+		
+		for head, tail in parts:
+			commandSize = len( head) + len( targetId) + len( tail)
 			
+			if size > 0 and size + commandSize > maxSize:
+				sendData( instance, b''.join( rawData))
+				rawData = []
+				size = 0
 				
+			rawData += (head, targetId, tail)
+			size += commandSize
 			
-
-
+		if size > 0:
+			sendData( instance, b''.join( rawData))
 			
 			
-	
-
-	#
-	#	P R O C E S S   R E C E P T I O N
-	#
-	#	called from the threaded read when we have parsed a valid packet
 	#
-	
-	def processReception( self, p):
+	#	B E G I N   B A T C H
+	#
+	#	after this any commands sent to all instances from this thread are kept until flushBatch or
+	#	endBatch is called and then queued together so the sender thread packs them into as few
+	#	datagrams as they will fit. Batches are per thread so one thread holding a batch open doesn't
+	#	delay another's commands. Priority commands are never held in a batch.
+	#	use the batch() context manager for a batch around a block of code:
+	#		with xtension.batch():
+	#			...send a bunch of values
+	#
+	def beginBatch( self):
+		if getattr( self.batchState, 'parts', None) == None:
+			self.batchState.parts = []
+			self.batchState.started = None
+			self.batchState.depth = 0
+			
+		self.batchState.depth += 1
 		
-		#	ignore our own reception of our own accounce and bye bye and other broadcast packets
-		#	they will show up here as if they were from someone else
 		
-		if p.senderId == self.uniqueId:
-			#print( "send to self broadcast ignored")
+	def endBatch( self):
+		self.batchState.depth -= 1
+		if self.batchState.depth > 0:
 			return
 			
-		#p.debugLog()
+		self.flushBatch()
+		self.batchState.parts = None
+		
+		
+	def flushBatch( self):
+		parts = getattr( self.batchState, 'parts', None)
+		if not parts:
+			return
 			
-		# if the packet is from XTension then we have to create the instance entry for this
-		# or to update the timeouts and such
+		self.batchState.parts = []
+		self.batchState.started = None
 		
-		if p.deviceType == 'xtension':
-			workInstance = self.getInstance( p.senderId)
+		if self.shuttingDown:
+			return
 			
-			if workInstance == None:
-				# this is a new reception from this instance
-				# we need to create an instance and insert it into the 
-				# list
-				
-				#print( "adding instance for XTension at: %s with ID %s" % (p.address, p.senderId))
+		self.queueParts( None, parts)
 				
-				workInstance = XTInstance( address=p.address, uniqueId=p.senderId)
-				
-				self.addInstance( workInstance)
-				# since this is the first time we've seen this XTension machine we should also send it our info
-				self.sendInfo( workInstance)
-				
-			else:
-				# if it is the bye bye command then we remove the instance of XTension
-				# and stop processing here
-				if p.command == self.xtPCommandByeBye:
-					#print( "ByeBye from XTension %s" % p.senderId)
-					self.removeInstance( instance=workInstance)
-					return
-			
-			
-				#print( "udating timeouts for XTension at: %s with ID %s was %s seconds since we last heard from it" % (workInstance.address, workInstance.uniqueId, workInstance.connectionTimeout))
-				workInstance.connectionTimeout = 0
 				
-			# we should have a valid instance reference now in workInstance so now we can process the command
-			# if it is XTension sending us an Info packet, then we need to respond with our own Info packet
+	#
+	#	B A T C H   A G E
+	#
+	#	seconds since the oldest command still waiting in this thread's batch was sent, or None
+	#	if nothing is waiting
+	#
+	def batchAge( self):
+		started = getattr( self.batchState, 'started', None)
+		if started == None:
+			return None
 			
-			if p.command == self.xtPCommandInfo:
-				#print( "processing info packet from XTension")
-				self.sendInfo( workInstance)
-				return
+		return monotonic() - started
 		
-		# all other commands should be directly addressed to us so we can bail out if we receive something
-		# that does not match our ID
 		
-		if not p.targetId == self.uniqueId:
-			#print( "packet not for us")
-			return
-				
-		if not self.callbackHandleCommand == None:
-			try:
-				self.callbackHandleCommand( p)
-			except Exception as e:
-				print( "error:(%s) while handling command from XTension:" % e)
-				p.debugLog()
+	@contextmanager
+	def batch( self):
+		self.beginBatch()
+		try:
+			yield
+		finally:
+			self.endBatch()
 				
-			
-			
-			
-		
-
 				
 	#
-	#	S E N D   C O M M A N D   T O   A L L 
+	#	S E N D   C O M M A N D S
 	#
-	#	sends the same command to all currently valid instances of XTension on the network
+	#	the same as sendCommand but for a list of commands packed into as few datagrams as they fit in
 	#
-	def sendCommandToAll( self, theCommand):
+	def sendCommands( self, *, instance, commands, priority=False):
+	
+		if self.shuttingDown:
+			return
+			
+		self.queueParts( instance, [command.getRawParts() for command in commands], priority=priority)
 	
-		for xt in self.xtInstances:
-			if not xt == None:
-				self.sendCommand( instance=xt, command=theCommand)
-				
-		
 	
 	#
 	#	S E N D   C O M M A N D
 	#
 	#	lower level sendCommand handler than sendCommandToAll and sendJSONCommandToAll
-	# 	is called by those and other handlers to get the raw data of the command and 
-	#	send the packet out
+	# 	is called by those and other handlers to queue the command for just one instance
 	#	
 	#	this is NOT for broadcasts but for direct comms
 	#	for broadcasts use the next sendBroadcast command
 	#
 	#	use named parameters like:
-	#	xtension.sendCommand( address='1.2.3.4', command=theCommand)
-	#	port is optional, if not there we will use the self.udpPort value
+	#	xtension.sendCommand( instance=theInstance, command=theCommand)
 	#
-	def sendCommand( self,*, instance, command):
+	def sendCommand( self,*, instance, command, priority=False):
 		
 		if self.shuttingDown:
 			#print( "returning direct without sending")
 			return
 	
+		# the target id is spliced in by the sender thread from the instance
+		self.queueParts( instance, [command.getRawParts()], priority=priority)
+		
+		
+	#
+	#	S E N D   R A W   D A T A
+	#
+	#	sends an already encoded packet (or several joined together) directly to an instance
+	#	only called from the sender thread
+	#
+	def sendRawData( self, instance, rawData):
+	
 		if self.udpSocket == None:
 			self.udpSocket = socket( AF_INET, SOCK_DGRAM)
 			self.udpSocket.setsockopt( SOL_SOCKET, SO_REUSEADDR, 1)
 			#self.udpSocket.setsockopt( SOL_SOCKET, SO_BROADCAST, 1)
 
-		# set the targetId of the command to the one from the instance as this is most
-		# normally used from the sendToAll calls which mean we will be reusing this command
-		# for each one
-		
-		command.targetId = instance.uniqueId
-		#print( "sending command (%s) to (%s, %s)" % (command.getRawData(), instance.address, instance.port))
-		
 		# it is possible that a network being down would make this error or if we manage to come up
 		# before the wifi is connected so we should sleep a moment and then retry
 		
@@ -596,16 +1631,22 @@ class XTension( object):
 		
 		while retryCount < 5:
 			try:		
-				self.udpSocket.sendto( command.getRawData(), (instance.address, instance.port))
-				break
+				self.udpSocket.sendto( rawData, (instance.address, instance.port))
+				self.sentDatagrams += 1
+				return
 			except:
 				retryCount +=1
+				self.sendErrors += 1
 				sleep( 2)
+				
+		self.droppedDatagrams += 1
 			
 
 	#
 	#	S E N D   B R O A D C A S T   C O M M A N D
 	#
+	#	broadcasts go through the send queue as well, ahead of anything that isn't priority
+	#
 	def sendBroadcastCommand( self, command, *, address=None, port=None):
 		
 		# once we have sent the bye bye command no other command should be sent
@@ -613,35 +1654,68 @@ class XTension( object):
 			#print( "returning without sending")
 			return
 			
+		if address == None:
+			address = self.udpBroadcastAddress
+			
+		if port == None:
+			port = self.udpPort
+			
+		self.queueParts( BroadcastTarget( address, port), [command.getRawParts()], priority=True)
+		
 		if command.command == self.xtPCommandByeBye:
 			self.shuttingDown = True
 			
+			
+	#
+	#	S E N D   B R O A D C A S T   D A T A
+	#
+	#	the broadcast version of sendRawData, only called from the sender thread
+	#
+	def sendBroadcastData( self, target, rawData):
 		
 		if self.udpBroadcastSocket == None:
 			self.udpBroadcastSocket = socket( AF_INET, SOCK_DGRAM)
 			self.udpBroadcastSocket.setsockopt( SOL_SOCKET, SO_REUSEADDR, 1)
 			self.udpBroadcastSocket.setsockopt( SOL_SOCKET, SO_BROADCAST, 1)
 			
-		if address == None:
-			address = self.udpBroadcastAddress
-			
-		if port == None:
-			port = self.udpPort
-			
-		
 		retryCount = 0
 		
 		while retryCount < 5:
 			try:
-				self.udpBroadcastSocket.sendto( command.getRawData(), (address, port))
-				break
+				self.udpBroadcastSocket.sendto( rawData, (target.address, target.port))
+				self.sentDatagrams += 1
+				return
 			except:
 				retryCount += 1
+				self.sendErrors += 1
 				sleep( 2)
-			
-		
+				
+		self.droppedDatagrams += 1
 			
 			
+	def receiveDebugLog( self):
+		print( "----- begin Receive Debug Logging")
+		print( "	not for us:	%s" % self.filteredPackets)
+		print( "	duplicates:	%s" % self.duplicatePackets)
+		print( "	rate limited:	%s from %s addresses" % (self.rateLimitedDatagrams, len( self.receiveBuckets)))
+		print()
+		
+		
+	def sendQueueDebugLog( self):
+		print( "----- begin Send Queue Debug Logging")
+		print( "	waiting:	%s priority %s" % (len( self.bulkLane), len( self.priorityLane)))
+		print( "	max backlog:	%s" % self.maxBacklog)
+		print( "	datagrams sent:	%s" % self.sentDatagrams)
+		print( "	send errors:	%s" % self.sendErrors)
+		print( "	datagrams dropped:	%s" % self.droppedDatagrams)
+		print( "	commands dropped:	%s" % self.droppedCommands)
+		print( "	commands replaced:	%s" % self.coalescedCommands)
+		print( "	reliable sent:	%s acked %s unacked %s failed %s" % (self.reliableSent, self.ackedPackets, len( self.unackedPackets), self.failedDeliveries))
+		print( "	retransmits:	%s" % self.retransmits)
+		print( "	ack latency:	avg %.4f max %.4f" % (self.averageAckLatency(), self.maxAckLatency))
+		print()
+		
+		
 	#
 	#	W R I T E   L O G
 	#
@@ -684,7 +1758,7 @@ class XTension( object):
 			raise ValueError( 'unable to find known instance of XTension with ID: (%s)' % (theCommand.senderId))
 			return
 			
-		self.sendCommand( instance=workInstance,
+		self.sendCommand( instance=workInstance, priority=True,
 				command = XTPCommand( command=self.xtPCommandAck, targetId=theCommand.senderId, packetId=theCommand.packetId))
 		
 		
@@ -699,10 +1773,7 @@ class XTension( object):
 	#
 	
 	def receivedByeBye( self, theCommand):
-		for i in range( 4):
-			if self.xtInstances[ i] != None and self.xtInstances[i].uniqueId == theCommand.senderId:
-				self.xtInstances[ i] = None
-				return
+		self.removeInstance( id=theCommand.senderId)
 
 
 	#
@@ -722,7 +1793,9 @@ class XTension( object):
 				
 		self.writeLog( self.deviceName + " is being shutdown")
 		self.sendByeBye()
-		sleep( 1)
+		
+		# give the sender thread a chance to get it all out before we go
+		self.waitForSendQueue( 5)
 		
 		
 	
@@ -799,6 +1872,21 @@ class XTension( object):
 			
 		self.sendCommandToAll( XTPCommand( command=self.xtPCommandData, jsonData=data))
 			
+			
+	#
+	#	U N I T   S E N D E R
+	#
+	#	returns a UnitSender for sending values, ons and offs to one unit over and over without
+	#	building and encoding the whole command every time. The address and tag are required and
+	#	any other keywords are the same as sendValue and are sent with every command, like:
+	#		cpuTempSender = xtension.unitSender( address='CPUTEMP', tag=xtension.tagTemperature, xtKeyUpdateOnly=True)
+	#		cpuTempSender.sendValue( 51.2, label='51.2°C')
+	#	pass reliable=True for units whose changes must not be lost, every command is sent with the
+	#	ack flag and sent again until XTension acks it. Leave it off for values that are sent
+	#	regularly anyway, the next one will replace a lost one
+	#
+	def unitSender( self, *, address, tag, **kwargs):
+		return UnitSender( self, address=address, tag=tag, **kwargs)
 	
 		
 	
@@ -813,6 +1901,138 @@ class XTension( object):
 	
 	
 
+#
+#	class		U N I T   S E N D E R
+#
+#	a prepared command for one unit. Everything in the packet except the packet id, the target
+#	id, the value and the label is the same every time so it is encoded once here and each send
+#	only joins a few small pieces of bytes. The JSON is the same as XTPCommand would produce.
+#	get one from XTension.unitSender rather than creating it directly.
+#
+class UnitSender( object):
+	def __init__( self, xtension, *, address, tag, flags=0, reliable=False, **kwargs):
+		self.xtension = xtension
+		self.address = address
+		self.tag = tag
+		self.flags = flags
+		delim = xtension.packetDelim
+		
+		# reliable commands ask XTension for an ack and are sent again until they get one
+		self.setReliable( reliable)
+		
+		# the keys and values that go with every command, expanding any global constants that were used as keys
+		static = {xtKeyTag:tag, xtKeyAddress:address}
+		for key in kwargs:
+			value = kwargs[ key]
+			if key in globals():
+				key = globals()[ key]
+			static[ key] = value
+			
+		staticJSON = json.dumps( static)[ 1:-1].replace( delim, '-')
+		
+		self.headStart = (XTPCommand.commandStart + delim).encode()
+		
+		tailStart = delim + xtension.deviceClass + delim + xtension.xtPCommandData + delim
+		
+		self.valueStart = (tailStart + '{"%s": "%s", %s, "%s": ' % (xtKeyCommand, xtCommandSetValue, staticJSON, xtKeyValue)).encode()
+		self.labelStart = (', "%s": ' % xtKeyDefaultLabel).encode()
+		self.onTail = (tailStart + '{"%s": "%s", %s}\n' % (xtKeyCommand, xtCommandOn, staticJSON)).encode()
+		self.offTail = (tailStart + '{"%s": "%s", %s}\n' % (xtKeyCommand, xtCommandOff, staticJSON)).encode()
+		
+		
+	def head( self):
+		return b''.join( (self.headStart, str( XTPCommand.nextPacketId()).encode(), self.headEnd))
+		
+		
+	#
+	#	S E T   R E L I A B L E
+	#
+	#	turns the ack flag on or off for the commands created from now on, like when the
+	#	reliableUnits configuration option was changed
+	#
+	def setReliable( self, reliable):
+		if reliable:
+			self.flags |= self.xtension.xtPFlagsAck
+		else:
+			self.flags &= ~self.xtension.xtPFlagsAck
+			
+		delim = self.xtension.packetDelim
+		self.headEnd = (delim + str( self.flags) + delim + self.xtension.uniqueId + delim).encode()
+		
+		
+	#
+	#	V A L U E   P A R T S
+	#
+	#	the (head, tail, key) parts of a SetValue command for XTension.sendRawPartsToAll so that
+	#	several units can be sent together. label None leaves the default label out entirely
+	#
+	def valueParts( self, value, label=None):
+		if label == None:
+			tail = b''.join( (self.valueStart, json.dumps( value).encode(), b'}\n'))
+		else:
+			tail = b''.join( (self.valueStart, json.dumps( value).encode(), self.labelStart, 
+				json.dumps( label).replace( self.xtension.packetDelim, '-').encode(), b'}\n'))
+		
+		return (self.head(), tail, self.address)
+		
+	def onParts( self):
+		return (self.head(), self.onTail, self.address)
+		
+	def offParts( self):
+		return (self.head(), self.offTail, self.address)
+		
+		
+	def sendValue( self, value, label=None, *, priority=False):
+		self.xtension.sendRawPartsToAll( [self.valueParts( value, label)], priority=priority)
+		
+	def sendOn( self, *, priority=False):
+		self.xtension.sendRawPartsToAll( [self.onParts()], priority=priority)
+		
+	def sendOff( self, *, priority=False):
+		self.xtension.sendRawPartsToAll( [self.offParts()], priority=priority)
+		
+		
+		
+		
+		
+		
+#
+#	class		R E L I A B L E   P A C K E T
+#
+#	a command sent with the ack flag to one instance that XTension hasn't acked yet
+#
+class ReliablePacket( object):
+	def __init__( self, instance, packetId, head, tail):
+		self.instance = instance
+		self.key = (instance.uniqueId, packetId)
+		self.head = head
+		self.tail = tail
+		self.firstSent = monotonic()
+		self.retransmits = 0
+		self.timer = None
+		
+		
+		
+		
+		
+		
+#
+#	class		B R O A D C A S T   T A R G E T
+#
+#	where a broadcast command in the send queue is going. Broadcasts have no target id
+#
+class BroadcastTarget( object):
+	targetIdBytes = b''
+	
+	def __init__( self, address, port):
+		self.address = address
+		self.port = port
+		
+		
+		
+		
+		
+		
 #
 #
 #	class 		X T   I N S T A N C E
@@ -820,31 +2040,40 @@ class XTension( object):
 #	this is just a data holder that stores the necessary info for us to know about XTension
 # 	or other listeners that we have found. It holds their address and the last time we
 # 	heard from them as well as their unique ID and such
-#	they are stored in the XTension class in the xtInstances list
+#	they are stored in the XTension class in the xtInstances dict keyed by their uniqueId
 #
 #	to the constructor please pass:
 #		address = "ip.address.of.thing"
 #		uniqueId = "123456"
 #
+#	one is looked at for every packet received so it uses slots to keep it small and quick
+#
 class XTInstance( object):
+	__slots__ = ('address', 'uniqueId', 'targetIdBytes', 'port', 'lastHeard', 'pingSent', 'timeout', 'pingInterval', 'features')
+	
 	def __init__( self, *, address, uniqueId, port=None):
 		self.address = address
 		self.uniqueId = uniqueId
+		self.targetIdBytes = uniqueId.encode()	# spliced into commands that were encoded once for all instances
 		if port == None:
 			self.port = xtension.udpPort
 		else:
 			self.port = port
 		
-		self.connectionTimeout = 0
+		self.lastHeard = monotonic() 	# when we last received anything from it
 		self.pingSent = False
 		self.timeout = 0
 		self.pingInterval = 0
+		self.features = frozenset() 	# the xtPFeatures it told us it supports, see packetFeatures
+		
+	def supports( self, feature):
+		return feature in self.features
 		
 	def debugLog( self):
 		print( "----- begin XTInstance Debug Logging")
 		print( "	address:	%s" % self.address)
 		print( "	id:			%s" % self.uniqueId)
-		print( "	timeout:	%s" % self.connectionTimeout)
+		print( "	last heard:	%.1f seconds ago" % (monotonic() - self.lastHeard))
 		print()
 		
 		
@@ -867,22 +2096,26 @@ class XTInstance( object):
 #	class 		X T   P   C O M M A N D
 #
 # 	if creating an ack or something that needs to include a specific packet ID then pass
-#	packetId=1234 or whatever. if the packet ID is not passed then it will be generated and the
-#	currentCommandId incremented
+#	packetId=1234 or whatever. if the packet ID is not passed then the next one is taken from
+#	packetIds, see nextPacketId
 #
 class XTPCommand( object):
 
-	# shared property of the class for currentCommandID this is a rotating number
-	# from 0 to 1000 and then rolls over. This way we can ignore repeats of broadcasted
-	# commands
-	currentCommandId = 0
+	# shared by every thread that sends, the packet id is this modulo packetIdLimit so it is a rotating
+	# number that rolls over. This way repeats of broadcasted commands can be ignored. Acks are matched
+	# to the packet by its id so it must not come around again while a reliable packet is still being
+	# retransmitted, which can take about 30 seconds, even with thousands of packets sent in between
+	packetIds = itertools.count()
+	packetIdLimit = 1000000
 	
 	# commands always start with "xtkit"
 	commandStart = "xtkit"
 	packetDelim = ';'
 	
-	def __init__( self, *, received=None, flags=0, targetId=None, command=None, data=[], jsonData=None, packetId=None, address=None):
+	def __init__( self, *, received=None, flags=0, targetId=None, command=None, data=[], jsonData=None, packetId=None, address=None, compact=False):
 	
+		self.compact = compact 	# encode the JSON without any spaces, for large commands like the info
+		
 		if received == None:
 			self.isValid = True 	# we are a new outgoing packet so should always be valid
 			self.address = address
@@ -893,11 +2126,10 @@ class XTPCommand( object):
 			self.jsonData = jsonData
 			
 			# we need a packet ID if we are being created to go out
-			self.packetId = self.currentCommandId
-			
-			self.currentCommandId += 1
-			if self.currentCommandId > 1000:
-				self.currentCommandId = 0
+			if packetId == None:
+				packetId = XTPCommand.nextPacketId()
+				
+			self.packetId = packetId
 				
 			
 		else:
@@ -907,6 +2139,18 @@ class XTPCommand( object):
 			self.isValid = True
 			
 		
+	#
+	#	N E X T   P A C K E T   I D
+	#
+	#	the rotating packet id shared by every outgoing command, including the ones sent
+	#	through a UnitSender. Taking the next number from an itertools.count is a single step
+	#	under the GIL so no two threads can ever get the same id without needing a lock
+	#
+	@classmethod
+	def nextPacketId( cls):
+		return next( cls.packetIds) % cls.packetIdLimit
+		
+		
 	def parse( self, received):
 	
 		if isinstance( received, bytes):
@@ -966,8 +2210,24 @@ class XTPCommand( object):
 		if self.targetId == None:
 			self.targetId = ''
 			
-		work = [self.commandStart, str( self.packetId), str( self.flags), xtension.uniqueId, 
-			self.targetId, xtension.deviceClass, self.command]
+		head, tail, key = self.getRawParts()
+		return b''.join( (head, self.targetId.encode(), tail))
+		
+		
+	#
+	#	G E T   R A W   P A R T S
+	#
+	#	the encoded packet split around the target id as (head, tail, key) so that the same command
+	#	can be sent to any number of instances by joining head, the instance target id and tail
+	#	without encoding the JSON again for each one. The key is the unit the command is for, used
+	#	by the send queue to replace a waiting value with a newer one, commands don't have one
+	#
+	def getRawParts( self):
+		delim = xtension.packetDelim
+		
+		head = delim.join( (self.commandStart, str( self.packetId), str( self.flags), xtension.uniqueId)) + delim
+			
+		work = ['', xtension.deviceClass, self.command]
 			
 		# add in any other items in the data list
 		
@@ -977,10 +2237,24 @@ class XTPCommand( object):
 		# lastly add in the JSON data that describes the lower level command if it is there
 		
 		if not self.jsonData == None:
-			work.append( json.dumps( self.jsonData).replace( xtension.packetDelim, '-'))
+			work.append( self.getJSONText())
+			
 			
+		return (head.encode(), (delim.join( work) + '\n').encode(), None)
+		
+		
+	#
+	#	G E T   J S O N   T E X T
+	#
+	#	the JSON data as it goes in the packet with any packet delimiters replaced
+	#
+	def getJSONText( self):
+		if self.compact:
+			text = json.dumps( self.jsonData, separators=(',', ':'))
+		else:
+			text = json.dumps( self.jsonData)
 			
-		return (xtension.packetDelim.join( work) + '\n').encode()
+		return text.replace( xtension.packetDelim, '-')
 		
 	
 		
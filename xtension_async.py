@@ -0,0 +1,184 @@
+#
+#		asyncio XTension transport
+#			https://MacHomeAutomation.com/
+#
+#		the same XTension class with the same methods for sending, but instead of a listener thread
+#		and a sender thread everything runs on one asyncio event loop. Packets are received and sent
+#		through a DatagramProtocol on a single socket, the keepalive timers and the send queue are
+#		serviced by callbacks scheduled on the loop, so nothing is ever sent or received from two
+#		threads at once.
+#
+#		usage:
+#			xtension = AsyncXTension( deviceName='lab pi')
+#			async def main():
+#				await xtension.startup()
+#				...
+#			asyncio.run( main())
+#
+#		startup is a coroutine here and must be awaited from inside the running loop. Everything
+#		else is called just the same as on XTension.
+#
+
+import asyncio
+from socket import *
+
+from xtension import XTension
+
+
+
+#
+#	class		X T E N S I O N   P R O T O C O L
+#
+#	receives the datagrams for AsyncXTension on the event loop
+#
+class XTensionProtocol( asyncio.DatagramProtocol):
+	def __init__( self, xtension):
+		self.xtension = xtension
+
+	def datagram_received( self, data, addr):
+		self.xtension.processDatagram( data, addr[ 0])
+		self.xtension.serviceKeepalive()
+
+	def error_received( self, exc):
+		# the send that failed is gone, only the reliable units will be sent again
+		self.xtension.sendErrors += 1
+		self.xtension.droppedDatagrams += 1
+
+
+
+
+#
+#	class		A S Y N C   X T E N S I O N
+#
+class AsyncXTension( XTension):
+	def __init__( self, **kwargs):
+		super().__init__( **kwargs)
+
+		self.loop = None
+		self.transport = None
+		self.keepaliveHandle = None 	# the loop callback for when the next keepalive timer is due
+		self.drainHandle = None			# the loop callback for the next retransmit or replay
+		self.drainScheduled = False		# a drain of the send queue is already waiting to run
+
+
+	#
+	#	S T A R T U P
+	#
+	#	opens the socket for sending and receiving on the running loop and sends our announce. The
+	#	socket is set up the same as the listener in XTension with broadcast allowed as well so the
+	#	one socket does everything
+	#
+	async def startup( self):
+		self.loop = asyncio.get_running_loop()
+
+		udpSocket = socket( AF_INET, SOCK_DGRAM)
+		udpSocket.setsockopt( SOL_SOCKET, SO_REUSEADDR, 1)
+		udpSocket.setsockopt( SOL_SOCKET, SO_BROADCAST, 1)
+		udpSocket.bind( ('0.0.0.0', self.udpPort))
+		udpSocket.setblocking( False)
+
+		self.transport, protocol = await self.loop.create_datagram_endpoint( lambda: XTensionProtocol( self), sock=udpSocket)
+
+		self.keepaliveTimers.add( self.announceInterval, (self.checkAnnounce,))
+		self.serviceKeepalive()
+
+		# anything that was sent before we had a loop to send it with
+		with self.sendCondition:
+			self.wakeSender()
+
+		# a short pause to let the first replies to our announce arrive
+		self.sendAnnounce()
+		await asyncio.sleep( 0.5)
+
+
+	#
+	#	S E R V I C E   K E E P A L I V E
+	#
+	#	runs whatever keepalive timers are due and sets a loop callback for the next one. Called
+	#	after every datagram received as that may have added a new instance and its timer
+	#
+	def serviceKeepalive( self):
+		self.runKeepaliveTimers()
+
+		if self.keepaliveHandle != None:
+			self.keepaliveHandle.cancel()
+			self.keepaliveHandle = None
+
+		delay = self.keepaliveTimers.timeUntilNext()
+		if delay != None:
+			self.keepaliveHandle = self.loop.call_later( delay, self.serviceKeepalive)
+
+
+	#
+	#	W A K E   S E N D E R
+	#
+	#	instead of a sender thread the queue is drained by a callback on the loop, scheduled once
+	#	no matter how many commands are queued before it runs. This may be called from another
+	#	thread, like the atexit handler, so it is scheduled threadsafe. Only called with the
+	#	sendCondition held
+	#
+	def wakeSender( self):
+		if self.loop == None or self.loop.is_closed():
+			return 	# it waits in the queue until startup or waitForSendQueue
+
+		if not self.drainScheduled:
+			self.drainScheduled = True
+			self.loop.call_soon_threadsafe( self.drainSendQueue)
+
+
+	#
+	#	D R A I N   S E N D   Q U E U E
+	#
+	#	sends everything waiting in the send queue and then sets a loop callback for when the next
+	#	retransmit or chunk of the spool replay is due
+	#
+	def drainSendQueue( self):
+		with self.sendCondition:
+			self.drainScheduled = False
+			if self.drainHandle != None:
+				self.drainHandle.cancel()
+				self.drainHandle = None
+
+			entries = self.takeQueued()
+
+		self.sendEntries( entries)
+
+		with self.sendCondition:
+			delay = self.timeUntilSendDue()
+			if delay != None and self.loop != None and not self.loop.is_closed():
+				self.drainHandle = self.loop.call_later( max( 0, delay), self.drainSendQueue)
+
+
+	#
+	#	W A I T   F O R   S E N D   Q U E U E
+	#
+	#	there is no sender thread to wait for and waiting here would stop the loop from sending
+	#	so whatever is waiting is sent right now. The timeout is ignored
+	#
+	def waitForSendQueue( self, timeout=None):
+		self.drainSendQueue()
+		return True
+
+
+	#
+	#	S E N D   R A W   D A T A   and   S E N D   B R O A D C A S T   D A T A
+	#
+	#	sent through the transport which never blocks, if the network is down the error comes back
+	#	to the protocol and the datagram is lost rather than holding up the loop with retries. If
+	#	the loop isn't running, like when the atexit handler sends our bye bye, they go out through
+	#	the blocking sockets of XTension instead
+	#
+	def sendRawData( self, instance, rawData):
+		if self.transport == None or not self.loop.is_running():
+			return super().sendRawData( instance, rawData)
+
+		self.transport.sendto( rawData, (instance.address, instance.port))
+		self.sentDatagrams += 1
+
+
+	def sendBroadcastData( self, target, rawData):
+		if self.transport == None or not self.loop.is_running():
+			return super().sendBroadcastData( target, rawData)
+
+		self.transport.sendto( rawData, (target.address, target.port))
+		self.sentDatagrams += 1